@@ -112,6 +112,7 @@ const apiLimiter = rateLimit({
 });
 
 app.use(logger('dev'));
+app.use('/api/tirada/bulk', express.json({ limit: '256kb' })); // Bulk ID lookups carry up to 20000 IDs
 app.use(express.json({ limit: '10kb' })); // Limit JSON payload size to prevent DoS
 app.use(express.urlencoded({ extended: false, limit: '10kb' })); // Limit URL-encoded payload size
 app.use(cookieParser());
@@ -9,6 +9,8 @@ const { CobroCuota, Socio, Grupo } = require('../models');
 const { Op } = require('sequelize');
 
 const FEE_BY_PAGE = 8;
+const MAX_BULK_IDS = 20000;
+const BULK_CHUNK_SIZE = 2000;
 
 /**
  * Validate numeric parameter
@@ -237,4 +239,84 @@ router.get('/custom/:ccid1/:ccid2/:ccid3/:ccid4/:ccid5/:ccid6/:ccid7/:ccid8', as
   }
 });
 
+/**
+ * POST /api/tirada/bulk
+ * Get fee collection records by an arbitrary list of IDs
+ * Body: { "ids": [662464, 662471, ...] } (up to MAX_BULK_IDS IDs)
+ * IDs are deduplicated and queried with one Op.in query per BULK_CHUNK_SIZE IDs
+ */
+router.post('/bulk', async (req, res) => {
+  const rawIds = req.body ? req.body.ids : undefined;
+
+  if (!Array.isArray(rawIds) || rawIds.length === 0) {
+    return res.status(400).json({ error: 'Parámetro inválido', message: 'ids debe ser un arreglo no vacío' });
+  }
+
+  if (rawIds.length > MAX_BULK_IDS) {
+    return res.status(400).json({ error: 'Demasiados IDs', message: `El máximo es de ${MAX_BULK_IDS} IDs por solicitud` });
+  }
+
+  // Validate all IDs
+  const idSet = new Set();
+  for (let i = 0; i < rawIds.length; i++) {
+    if (typeof rawIds[i] !== 'number' && typeof rawIds[i] !== 'string') {
+      return res.status(400).json({ error: 'Parámetro inválido', message: `ids[${i}] debe ser un número válido` });
+    }
+
+    const validation = validateNumber(rawIds[i], `ids[${i}]`, 0, 999999999);
+    if (!validation.valid) {
+      return res.status(400).json({ error: 'Parámetro inválido', message: validation.error });
+    }
+
+    idSet.add(validation.value);
+  }
+
+  const ids = Array.from(idSet).sort((a, b) => a - b);
+
+  try {
+    const results = [];
+
+    // Chunks are sorted, so concatenating them keeps CC_ID order
+    for (let offset = 0; offset < ids.length; offset += BULK_CHUNK_SIZE) {
+      const chunk = ids.slice(offset, offset + BULK_CHUNK_SIZE);
+
+      // Query using Sequelize with eager loading
+      const cuotas = await CobroCuota.findAll({
+        where: {
+          CC_ID: {
+            [Op.in]: chunk
+          },
+          CC_Anulado: 'N',
+          CC_Cobrado: {
+            [Op.ne]: ''
+          },
+          CC_Debito: 'N'
+        },
+        include: [{
+          model: Socio,
+          as: 'socio',
+          attributes: ['So_ID', 'So_Nombre', 'So_Apellido', 'So_DomCob', 'Gr_ID'],
+          include: [{
+            model: Grupo,
+            as: 'grupo',
+            attributes: ['Gr_Titulo']
+          }]
+        }],
+        order: [['CC_ID', 'ASC']]
+      });
+
+      // Transform results to match original API format
+      for (const cuota of cuotas) {
+        results.push(transformResult(cuota));
+      }
+    }
+
+    res.json(results);
+
+  } catch (error) {
+    console.error('Database query error:', error);
+    res.status(500).json({ error: 'Error interno del servidor', message: 'Ocurrió un error al procesar tu solicitud' });
+  }
+});
+
 module.exports = router;
@@ -95,6 +95,33 @@ describe('Printer Role Integration Tests', () => {
       expect(Array.isArray(response.body)).toBe(true);
     });
 
+    test('printer can access tirada by bulk ID list', async () => {
+      const ids = Array.from({ length: 3000 }, (_, i) => i + 1);
+      const response = await request(app)
+        .post('/api/tirada/bulk')
+        .set('Authorization', `Bearer ${printerToken}`)
+        .send({ ids })
+        .expect(200);
+
+      expect(Array.isArray(response.body)).toBe(true);
+      const ccIds = response.body.map(r => r.CC_ID);
+      expect(ccIds).toEqual([...ccIds].sort((a, b) => a - b));
+    });
+
+    test('bulk lookup rejects invalid ID lists', async () => {
+      await request(app)
+        .post('/api/tirada/bulk')
+        .set('Authorization', `Bearer ${printerToken}`)
+        .send({ ids: [] })
+        .expect(400);
+
+      await request(app)
+        .post('/api/tirada/bulk')
+        .set('Authorization', `Bearer ${printerToken}`)
+        .send({ ids: [1, 'abc'] })
+        .expect(400);
+    });
+
     test('printer cannot access without token', async () => {
       const response = await request(app)
         .get('/api/tirada/start/1/end/3')
@@ -0,0 +1,96 @@
+"""
+Benchmark de extractor.py sobre páginas de circulación guardadas
+
+Compara la extracción anterior (BeautifulSoup con html.parser sobre la
+página entera) con extract_table() (parser por eventos que se detiene al
+terminar la segunda tabla) y verifica que el JSON resultante sea idéntico.
+
+Uso:
+    python3 bench_extractor.py --save muestras 1234 5678   (descarga páginas de ejemplo)
+    python3 bench_extractor.py muestras/*.html --runs 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import extractor
+
+
+def extract_bs4(page):
+    # Implementación anterior de extractor.main(), sin la descarga
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page.decode(extractor.ENCODING), 'html.parser')
+    tables = soup.find_all('table')
+    if len(tables) < 2:
+        return None
+    data = []
+    for row in tables[1].find_all('tr'):
+        cells = row.find_all('td')
+        data.append({i: cells[i].text.strip() for i in range(len(cells))})
+    return data
+
+
+def extract_stream(page, chunk_size=extractor.CHUNK_SIZE):
+    # Los trozos simulan iter_content() de la respuesta
+    chunks = (page[i:i + chunk_size] for i in range(0, len(page), chunk_size))
+    return extractor.extract_table(chunks, 1)
+
+
+def best_time(func, page, runs):
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func(page)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def save_pages(directory, expresiones):
+    import requests
+    os.makedirs(directory, exist_ok=True)
+    for expresion in expresiones:
+        response = requests.get(extractor.URL_TEMPLATE.format(expresion))
+        path = os.path.join(directory, f'{expresion}.html')
+        with open(path, 'wb') as f:
+            f.write(response.content)
+        print(f'{path}: {len(response.content)} bytes (HTTP {response.status_code})')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Comparar la extracción con BeautifulSoup y por eventos.')
+    parser.add_argument('pages', nargs='*', help='Páginas HTML guardadas')
+    parser.add_argument('--runs', type=int, default=10, help='Repeticiones por página (se informa la mejor)')
+    parser.add_argument('--save', metavar='DIR', help='Descargar las páginas de las expresiones dadas en DIR')
+    args = parser.parse_args(argv)
+
+    if args.save:
+        save_pages(args.save, args.pages)
+        return 0
+    if not args.pages:
+        parser.error('indicar las páginas a medir')
+
+    print(f"{'Página':<30}{'Bytes':>9}{'Filas':>7}{'bs4 ms':>9}{'eventos ms':>12}{'x':>7}  JSON")
+    total_old = total_new = 0
+    mismatches = 0
+    for path in args.pages:
+        with open(path, 'rb') as f:
+            page = f.read()
+        old_time, old = best_time(extract_bs4, page, args.runs)
+        new_time, new = best_time(extract_stream, page, args.runs)
+        same = json.dumps(old, ensure_ascii=False) == json.dumps(new, ensure_ascii=False)
+        mismatches += not same
+        total_old += old_time
+        total_new += new_time
+        rows = len(new) if new is not None else '-'
+        print(f'{os.path.basename(path):<30}{len(page):>9}{rows:>7}{old_time * 1000:>9.2f}'
+              f'{new_time * 1000:>12.2f}{old_time / new_time:>7.1f}  {"igual" if same else "DISTINTO"}')
+    print(f"{'Total':<46}{total_old * 1000:>9.2f}{total_new * 1000:>12.2f}{total_old / total_new:>7.1f}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
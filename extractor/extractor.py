@@ -1,59 +1,506 @@
+import collections
 import json
-import requests
-from bs4 import BeautifulSoup
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-def main(expresion):
-    # URL base
-    url_template = 'http://campi.abr.net/omp/cgi-bin/wxis/omp/circulacion/?IsisScript=circulacion/consulta.xis&operario_id=gberni&criterio=lector&expresion={}'
+# requests se importa al descargar: una consulta que sale de la caché no lo necesita
 
+# URL base
+URL_TEMPLATE = 'http://campi.abr.net/omp/cgi-bin/wxis/omp/circulacion/?IsisScript=circulacion/consulta.xis&operario_id=gberni&criterio=lector&expresion={}'
+
+# Codificación de las páginas de wxis
+ENCODING = 'ISO-8859-1'
+CHUNK_SIZE = 16384
+
+# Modo por lotes: consultas simultáneas, reintentos y segundos de espera por consulta
+WORKERS = 8
+RETRIES = 3
+TIMEOUT = 30
+
+# Caché de respuestas: archivo SQLite, vigencia en segundos y cantidad máxima de expresiones
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extractor_cache.sqlite')
+CACHE_TTL = 900
+CACHE_MAX_ENTRIES = 20000
+
+# Servicio HTTP local (--serve); main() lo usa si está corriendo
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = int(os.environ.get('EXTRACTOR_PORT', 8091))
+
+NO_TABLE = 'No se encontró la segunda tabla en el contenido HTML.'
+
+# Elementos vacíos de HTML (no tienen contenido ni etiqueta de cierre)
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+             'link', 'meta', 'param', 'source', 'track', 'wbr'}
+# Su texto no forma parte de .text en BeautifulSoup
+SKIP_TEXT_TAGS = {'script', 'style', 'template', 'rt', 'rp'}
+
+
+class Node:
+    __slots__ = ('tag', 'children')
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.children = []
+
+    def find_all(self, tag):
+        # Descendientes con la etiqueta dada, en orden del documento (como find_all de bs4)
+        found = []
+        stack = [iter(self.children)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, Node):
+                    if child.tag == tag:
+                        found.append(child)
+                    stack.append(iter(child.children))
+                    break
+            else:
+                stack.pop()
+        return found
+
+    @property
+    def text(self):
+        parts = []
+        stack = [iter(self.children)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, Node):
+                    stack.append(iter(child.children))
+                    break
+                parts.append(child)
+            else:
+                stack.pop()
+        return ''.join(parts)
+
+
+class TableParser(HTMLParser):
+    """
+    Parser por eventos que arma sólo el árbol de la tabla buscada
+
+    Anida las etiquetas igual que el html.parser de BeautifulSoup (sin cierres
+    implícitos; una etiqueta de cierre cierra hasta la última abierta con ese
+    nombre) y marca done en cuanto la tabla termina, para dejar de leer.
+    """
+
+    def __init__(self, index=1):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.index = index
+        self.tables = 0
+        self.table = None
+        self.done = False
+        # Etiquetas abiertas del documento: (etiqueta, nodo o None fuera de la tabla)
+        self.open = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        parent = self.open[-1][1] if self.open else None
+        node = None
+        if tag == 'table':
+            self.tables += 1
+            if self.tables == self.index + 1 and self.table is None:
+                node = self.table = Node(tag)
+        if parent is not None:
+            node = node or Node(tag)
+            parent.children.append(node)
+        if tag not in VOID_TAGS:
+            self.open.append((tag, node))
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        for i in range(len(self.open) - 1, -1, -1):
+            if self.open[i][0] == tag:
+                closed = self.open[i:]
+                del self.open[i:]
+                if self.table is not None and any(node is self.table for _, node in closed):
+                    self.done = True
+                return
+
+    def handle_data(self, data):
+        if self.done or not self.open:
+            return
+        tag, node = self.open[-1]
+        if node is not None and tag not in SKIP_TEXT_TAGS:
+            node.children.append(data)
+
+
+def extract_table(chunks, index=1):
+    """
+    Filas de la tabla número index (0 = primera) de una página HTML
+
+    chunks son trozos de la página (bytes en ISO-8859-1 o str); se dejan de
+    leer al cerrarse la tabla. Devuelve una lista de diccionarios
+    {número de celda: texto} o None si la página no tiene esa tabla.
+    """
+    parser = TableParser(index)
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            # ISO-8859-1 es de un byte por carácter: cada trozo se decodifica solo
+            chunk = chunk.decode(ENCODING)
+        parser.feed(chunk)
+        if parser.done:
+            break
+    else:
+        parser.close()
+
+    if parser.table is None:
+        return None
+    data = []
+    for row in parser.table.find_all('tr'):
+        cells = row.find_all('td')
+        row_data = {i: cells[i].text.strip() for i in range(len(cells))}
+        data.append(row_data)
+    return data
+
+
+class ResponseCache:
+    """
+    Caché en disco (SQLite) de las filas extraídas, por expresión
+
+    Sólo se guardan las respuestas correctas. Una entrada vale ttl segundos;
+    al pasar de max_entries se borran las menos usadas. Los errores de la
+    base (archivo de sólo lectura, bloqueo) no interrumpen la consulta: se
+    descarga como si no hubiera caché.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS cache (expresion TEXT PRIMARY KEY, '
+                            'data TEXT NOT NULL, fetched REAL NOT NULL, used REAL NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS cache_used ON cache (used)')
+
+    def get(self, expresion):
+        # Filas guardadas y vigentes, o None
+        now = time.time()
+        try:
+            with self.lock, self.db:
+                row = self.db.execute('SELECT data FROM cache WHERE expresion = ? AND fetched > ?',
+                                      (expresion, now - self.ttl)).fetchone()
+                if row is None:
+                    return None
+                self.db.execute('UPDATE cache SET used = ? WHERE expresion = ?', (now, expresion))
+        except sqlite3.Error:
+            return None
+        return json.loads(row[0])
+
+    def put(self, expresion, data):
+        now = time.time()
+        try:
+            with self.lock, self.db:
+                self.db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                                (expresion, json.dumps(data, ensure_ascii=False), now, now))
+                count = self.db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+                if count > self.max_entries:
+                    # Dejar un margen del 10% para no podar en cada inserción
+                    keep = self.max_entries * 9 // 10
+                    self.db.execute('DELETE FROM cache WHERE expresion IN '
+                                    '(SELECT expresion FROM cache ORDER BY used LIMIT ?)', (count - keep,))
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        self.db.close()
+
+
+def open_cache(path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+    # Caché, o None si está desactivada (ttl <= 0) o no se puede abrir
+    if ttl <= 0:
+        return None
+    try:
+        return ResponseCache(path, ttl, max_entries)
+    except sqlite3.Error as e:
+        print(f'Caché no disponible ({path}): {e}', file=sys.stderr)
+        return None
+
+
+def make_session(workers=WORKERS, retries=RETRIES):
+    """
+    Sesión con conexiones persistentes al CGI (una por consulta simultánea)
+
+    Reintenta con espera creciente los errores de conexión y las respuestas
+    5xx; tras el último intento se devuelve la respuesta con error.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_table(expresion, session=None, timeout=None, cache=None, refresh=False):
+    """
+    Descargar la página de una expresión y extraer la segunda tabla
+
+    Con cache, devuelve las filas guardadas si están vigentes (salvo con
+    refresh) y guarda las descargadas. Devuelve (código de estado HTTP,
+    filas); las filas son None si la respuesta no es 200 o no tiene la
+    segunda tabla.
+    """
+    if cache is not None and not refresh:
+        data = cache.get(expresion)
+        if data is not None:
+            return 200, data
+
+    import requests
     # Formatear la URL con la expresión proporcionada
-    url = url_template.format(expresion)
-
-    # Descargar el contenido HTML desde la URL
-    response = requests.get(url)
-    response.encoding = 'ISO-8859-1'  # Asegurarse de que la codificación sea la correcta
-
-    if response.status_code == 200:
-        input_html = response.text
-
-        # Parsear el contenido HTML
-        soup = BeautifulSoup(input_html, 'html.parser')
-
-        # Encontrar todas las tablas en el contenido HTML
-        tables = soup.find_all('table')
-
-        if len(tables) > 1:
-            # Procesar la segunda tabla
-            table = tables[1]
-            rows = table.find_all('tr')
-            
-            # Procesar las filas de la tabla
-            data = []
-            for row in rows:  # Omitir la primera fila (encabezados)
-                cells = row.find_all('td')
-                
-                # Asegurarse de que la cantidad de celdas coincida con la cantidad de encabezados
-                row_data = {i: cells[i].text.strip() for i in range(len(cells))}
-                data.append(row_data)
+    url = URL_TEMPLATE.format(expresion)
+
+    # Descargar el contenido HTML desde la URL, leyéndolo a medida que se procesa
+    response = (session or requests).get(url, stream=True, timeout=timeout)
+    with response:
+        if response.status_code != 200:
+            return response.status_code, None
+        chunks = response.iter_content(CHUNK_SIZE)
+        data = extract_table(chunks, 1)
+        if session is not None:
+            # Leer (sin procesar) el resto de la página para que la conexión
+            # vuelva a la sesión en lugar de cerrarse
+            for _ in chunks:
+                pass
+    if cache is not None and data is not None:
+        cache.put(expresion, data)
+    return 200, data
+
+
+def lookup(expresion, session, timeout=TIMEOUT, cache=None, refresh=False):
+    """
+    Resultado de una expresión para el modo por lotes (una línea NDJSON)
+    """
+    import requests
+    try:
+        status, data = fetch_table(expresion, session, timeout, cache, refresh)
+    except requests.RequestException as e:
+        return {'expresion': expresion, 'error': str(e)}
+    if status != 200:
+        return {'expresion': expresion, 'status': status, 'error': f'Código de estado: {status}'}
+    if data is None:
+        return {'expresion': expresion, 'status': status, 'error': NO_TABLE}
+    return {'expresion': expresion, 'status': status, 'data': data}
+
+
+def read_expressions(lines):
+    # Una expresión por línea; se ignoran las líneas vacías y los comentarios (#)
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def run_batch(expresiones, out=sys.stdout, workers=WORKERS, retries=RETRIES, timeout=TIMEOUT,
+              cache=None, refresh=False):
+    """
+    Consultar muchas expresiones con una sesión compartida y escribir NDJSON
+
+    Hasta workers consultas van en paralelo, pero cada línea se escribe en
+    el orden de entrada en cuanto está lista (y las anteriores también). Las
+    expresiones se leen a medida que se necesitan, así que la entrada puede
+    ser un archivo grande o stdin.
+
+    Devuelve (cantidad de expresiones, cantidad con error).
+    """
+    session = make_session(workers, retries)
+    pending = collections.deque()
+    count = errors = 0
+
+    def write(future):
+        result = future.result()
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        out.flush()
+        return 'error' in result
+
+    with session, ThreadPoolExecutor(max_workers=workers) as executor:
+        for expresion in expresiones:
+            pending.append(executor.submit(lookup, expresion, session, timeout, cache, refresh))
+            count += 1
+            # Ventana acotada: no adelantarse más de 2 * workers a la salida
+            while len(pending) >= 2 * workers or (pending and pending[0].done()):
+                errors += write(pending.popleft())
+        while pending:
+            errors += write(pending.popleft())
+    return count, errors
+
+
+class ExtractorService(ThreadingHTTPServer):
+    """
+    Servicio HTTP/JSON de consultas, con imports, sesión y caché ya cargados
+
+    GET /lector?expresion=...[&refresh=1]   resultado de lookup() + "elapsed_ms"
+    GET /health                             consultas, errores y latencia (p50, p95)
+
+    Cada pedido se atiende en su hilo; las descargas comparten la sesión
+    (conexiones persistentes al CGI, hasta workers a la vez).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=WORKERS, retries=RETRIES, timeout=TIMEOUT, cache=None):
+        ThreadingHTTPServer.__init__(self, address, ServiceHandler)
+        self.session = make_session(workers, retries)
+        self.timeout = timeout
+        self.cache = cache
+        self.started = time.time()
+        self.stats = {'requests': 0, 'errors': 0}
+        # Latencias de las últimas consultas, en milisegundos
+        self.latencies = collections.deque(maxlen=1000)
+        self.stats_lock = threading.Lock()
+
+    def record(self, elapsed_ms, error):
+        with self.stats_lock:
+            self.stats['requests'] += 1
+            self.stats['errors'] += error
+            self.latencies.append(elapsed_ms)
+
+    def health(self):
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+            health = dict(self.stats, status='ok', uptime=round(time.time() - self.started))
+        for name, fraction in (('p50_ms', 0.5), ('p95_ms', 0.95)):
+            health[name] = latencies[int(fraction * (len(latencies) - 1))] if latencies else None
+        return health
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: el cliente puede reutilizar la conexión
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        started = time.perf_counter()
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        if url.path == '/health':
+            self._reply(200, self.server.health(), started)
+        elif url.path == '/lector':
+            if not params.get('expresion'):
+                self._reply(400, {'error': 'Falta el parámetro expresion'}, started)
+                return
+            refresh = params.get('refresh', [''])[0] in ('1', 'true')
+            result = lookup(params['expresion'][0], self.server.session, self.server.timeout,
+                            self.server.cache, refresh)
+            self._reply(200, result, started)
+            self.server.record(result['elapsed_ms'], 'error' in result)
+        else:
+            self._reply(404, {'error': 'No encontrado'}, started)
+
+    def _reply(self, status, body, started):
+        body['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Server-Timing', f'total;dur={body["elapsed_ms"]}')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f'{self.address_string()} {format % args}\n')
+
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT, workers=WORKERS, retries=RETRIES, timeout=TIMEOUT, cache=None):
+    # Correr el servicio hasta Ctrl+C
+    server = ExtractorService((host, port), workers, retries, timeout, cache)
+    print(f'Extractor escuchando en http://{host}:{port}/lector?expresion=...', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.session.close()
+
+
+def query_service(expresion, refresh=False, port=SERVICE_PORT):
+    """
+    Resultado de lookup() desde el servicio local, o None si no está corriendo
+    o no responde a tiempo
+    """
+    query = urllib.parse.urlencode({'expresion': expresion, 'refresh': int(refresh)})
+    url = f'http://{SERVICE_HOST}:{port}/lector?{query}'
+    try:
+        with urllib.request.urlopen(url, timeout=TIMEOUT * (RETRIES + 1)) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except (urllib.error.URLError, ConnectionError, socket.timeout, TimeoutError):
+        # socket.timeout: lectura sin respuesta de un servicio trabado (en 3.10+ es TimeoutError)
+        return None
+
+
+def main(expresion, cache=None, refresh=False, service=True, port=SERVICE_PORT):
+    # Con el servicio corriendo se evita importar requests y abrir otra conexión
+    result = query_service(expresion, refresh, port) if service else None
+    if result is None:
+        status, data = fetch_table(expresion, cache=cache, refresh=refresh)
+    elif 'status' not in result:
+        # Error de conexión con el CGI
+        print(result['error'], file=sys.stderr)
+        sys.exit(1)
+    else:
+        status, data = result['status'], result.get('data')
+
+    if status == 200:
+        if data is not None:
             # Convertir los datos a JSON
             json_output = json.dumps(data, ensure_ascii=False)
-            
+
             # Mostrar la segunda tabla en formato JSON
             print(json_output)
         else:
-            print("No se encontró la segunda tabla en el contenido HTML.")
+            print(NO_TABLE)
     else:
-        print(f"Error al descargar el contenido HTML. Código de estado: {response.status_code}")
+        print(f"Error al descargar el contenido HTML. Código de estado: {status}")
 
 if __name__ == "__main__":
     import argparse
 
     # Configurar argparse para manejar los argumentos de la línea de comandos
     parser = argparse.ArgumentParser(description='Obtener y procesar una tabla desde una URL.')
-    parser.add_argument('expresion', type=str, help='El valor de la expresión para la URL')
+    parser.add_argument('expresion', type=str, nargs='?', help='El valor de la expresión para la URL')
+    parser.add_argument('--batch', metavar='ARCHIVO',
+                        help='Procesar las expresiones del archivo (una por línea, - = stdin) y escribir NDJSON')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Consultas simultáneas en modo por lotes')
+    parser.add_argument('--retries', type=int, default=RETRIES, help='Reintentos por consulta')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help='Segundos de espera por consulta')
+    parser.add_argument('--cache', default=CACHE_PATH, help='Archivo de la caché de respuestas')
+    parser.add_argument('--ttl', type=float, default=CACHE_TTL, help='Vigencia de la caché en segundos (0 = sin caché)')
+    parser.add_argument('--cache-max', type=int, default=CACHE_MAX_ENTRIES, help='Expresiones guardadas como máximo')
+    parser.add_argument('--refresh', action='store_true', help='No usar la caché para leer (sí se actualiza)')
+    parser.add_argument('--serve', action='store_true', help='Correr como servicio HTTP local')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='Puerto del servicio')
+    parser.add_argument('--local', action='store_true', help='Consultar sin pasar por el servicio')
 
     # Parsear los argumentos
     args = parser.parse_args()
 
-    # Llamar a la función principal con el argumento proporcionado
-    main(args.expresion)
\ No newline at end of file
+    cache = open_cache(args.cache, args.ttl, args.cache_max)
+    if args.serve:
+        serve(SERVICE_HOST, args.port, args.workers, args.retries, args.timeout, cache)
+    elif args.batch:
+        source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+        with source:
+            count, errors = run_batch(read_expressions(source), sys.stdout, args.workers,
+                                      args.retries, args.timeout, cache, args.refresh)
+        print(f'{count} expresiones, {errors} con error', file=sys.stderr)
+    elif args.expresion is not None:
+        # Llamar a la función principal con el argumento proporcionado
+        main(args.expresion, cache, args.refresh, not args.local, args.port)
+    else:
+        parser.error('indicar una expresión o --batch')
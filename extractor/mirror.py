@@ -0,0 +1,239 @@
+"""
+Espejo local (SQLite) de los datos de circulación
+
+sync recorre el CGI de circulación para una lista de lectores y guarda las
+filas de cada uno; en cada pasada sólo vuelve a consultar los lectores que
+nunca se consultaron o cuyos datos tienen más de --max-age segundos. Con
+--loop queda corriendo y repite la pasada periódicamente.
+
+query responde desde la base local, con índices por lector y por ítem (la
+celda ITEM_COLUMN de cada fila), sin consultar el sitio remoto.
+
+La fila 0 de cada lector es la de encabezados, como en la salida de
+extractor.py; las consultas devuelven las filas en ese mismo formato.
+
+Uso:
+    python3 mirror.py sync --ids lectores.txt --max-age 86400
+    python3 mirror.py sync --range 1 20000 --loop 3600
+    python3 mirror.py query 1234 5678
+    python3 mirror.py query --item 012345 --ids items.txt
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import extractor
+
+MIRROR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'circulacion.sqlite')
+# Segundos que un lector se considera al día
+MAX_AGE = 86400
+# Celda de cada fila que identifica al ítem prestado
+ITEM_COLUMN = 0
+# Cantidad de parámetros por consulta IN (SQLite admite 999)
+QUERY_CHUNK = 500
+
+
+def item_of(row):
+    # Las filas leídas de JSON (caché) tienen las claves como texto
+    return row.get(ITEM_COLUMN, row.get(str(ITEM_COLUMN)))
+
+
+class Mirror:
+    """
+    Base local con las filas de circulación de cada lector
+    """
+
+    def __init__(self, path=MIRROR_PATH):
+        self.db = sqlite3.connect(path, timeout=30)
+        with self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS lectores (expresion TEXT PRIMARY KEY, '
+                            'fetched REAL NOT NULL, status INTEGER, error TEXT)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS lectores_fetched ON lectores (fetched)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS filas (expresion TEXT NOT NULL, fila INTEGER NOT NULL, '
+                            'item TEXT, data TEXT NOT NULL, PRIMARY KEY (expresion, fila))')
+            self.db.execute('CREATE INDEX IF NOT EXISTS filas_item ON filas (item)')
+
+    def close(self):
+        self.db.close()
+
+    def stale(self, expresiones, max_age=MAX_AGE):
+        """
+        Expresiones sin consultar, con error en la última consulta o con datos
+        de más de max_age segundos, en el orden dado
+        """
+        expresiones = list(dict.fromkeys(expresiones))
+        fresh = set()
+        limit = time.time() - max_age
+        for i in range(0, len(expresiones), QUERY_CHUNK):
+            chunk = expresiones[i:i + QUERY_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            fresh.update(row[0] for row in self.db.execute(
+                f'SELECT expresion FROM lectores WHERE expresion IN ({marks}) '
+                'AND fetched > ? AND error IS NULL',
+                chunk + [limit]))
+        return [expresion for expresion in expresiones if expresion not in fresh]
+
+    def store(self, result):
+        """
+        Guardar un resultado de extractor.lookup()
+
+        Si la consulta falló se registra el error y se conservan las filas
+        anteriores del lector; si no, se reemplazan.
+        """
+        expresion = result['expresion']
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO lectores VALUES (?, ?, ?, ?)',
+                            (expresion, time.time(), result.get('status'), result.get('error')))
+            if 'data' in result:
+                self.db.execute('DELETE FROM filas WHERE expresion = ?', (expresion,))
+                self.db.executemany('INSERT INTO filas VALUES (?, ?, ?, ?)', [
+                    (expresion, number, item_of(row) if number else None,
+                     json.dumps(row, ensure_ascii=False))
+                    for number, row in enumerate(result['data'])])
+
+    def loans(self, expresiones):
+        """
+        Filas guardadas de varios lectores
+
+        Returns:
+            dict: {expresión: lista de filas (encabezados incluidos)}; los
+                  lectores que no están en la base no aparecen
+        """
+        expresiones = list(dict.fromkeys(expresiones))
+        result = {}
+        for i in range(0, len(expresiones), QUERY_CHUNK):
+            chunk = expresiones[i:i + QUERY_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            for expresion in self.db.execute(f'SELECT expresion FROM lectores WHERE expresion IN ({marks}) '
+                                             'AND error IS NULL', chunk):
+                result[expresion[0]] = []
+            for expresion, data in self.db.execute(f'SELECT expresion, data FROM filas WHERE expresion IN ({marks}) '
+                                                   'ORDER BY expresion, fila', chunk):
+                result.setdefault(expresion, []).append(json.loads(data))
+        return result
+
+    def items(self, items):
+        """
+        Filas (con su lector) en las que figuran los ítems dados
+
+        Returns:
+            list: {'expresion', 'item', 'data'} por fila, ordenados por ítem
+        """
+        items = list(dict.fromkeys(items))
+        rows = []
+        for i in range(0, len(items), QUERY_CHUNK):
+            chunk = items[i:i + QUERY_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            rows += self.db.execute(f'SELECT expresion, item, data FROM filas WHERE item IN ({marks})', chunk)
+        rows.sort(key=lambda row: (row[1], row[0]))
+        return [{'expresion': expresion, 'item': item, 'data': json.loads(data)} for expresion, item, data in rows]
+
+    def summary(self):
+        lectores, errors, oldest = self.db.execute(
+            'SELECT COUNT(*), COUNT(error), MIN(fetched) FROM lectores').fetchone()
+        filas = self.db.execute('SELECT COUNT(*) FROM filas WHERE fila > 0').fetchone()[0]
+        return {'lectores': lectores, 'errores': errors, 'filas': filas,
+                'antigüedad': round(time.time() - oldest) if oldest else None}
+
+
+def sync(mirror, expresiones, max_age=MAX_AGE, workers=extractor.WORKERS, retries=extractor.RETRIES,
+         timeout=extractor.TIMEOUT):
+    """
+    Consultar en el CGI sólo los lectores desactualizados y guardarlos
+
+    Las descargas van en paralelo por una sesión compartida; la base se
+    escribe desde este hilo a medida que llegan los resultados.
+
+    Returns:
+        tuple: (lectores consultados, con error)
+    """
+    pending = mirror.stale(expresiones, max_age)
+    session = extractor.make_session(workers, retries)
+    count = errors = 0
+    with session, ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(lambda expresion: extractor.lookup(expresion, session, timeout), pending):
+            mirror.store(result)
+            count += 1
+            errors += 'error' in result
+    return count, errors
+
+
+def read_ids(args):
+    # Valores de la línea de comandos, --ids (archivo o - = stdin) y --range
+    ids = list(args.values or [])
+    if args.ids:
+        source = sys.stdin if args.ids == '-' else open(args.ids, encoding='utf-8')
+        with source:
+            ids += extractor.read_expressions(source)
+    if getattr(args, 'range', None):
+        ids += [str(number) for number in range(args.range[0], args.range[1] + 1)]
+    return ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Espejo local de los datos de circulación.')
+    parser.add_argument('--db', default=MIRROR_PATH, help='Archivo de la base local')
+    commands = parser.add_subparsers(dest='command')
+
+    sync_parser = commands.add_parser('sync', help='Actualizar la base desde el CGI')
+    sync_parser.add_argument('values', nargs='*', metavar='expresion', help='Lectores a consultar')
+    sync_parser.add_argument('--ids', metavar='ARCHIVO', help='Lectores, uno por línea (- = stdin)')
+    sync_parser.add_argument('--range', type=int, nargs=2, metavar=('DESDE', 'HASTA'), help='Lectores numéricos')
+    sync_parser.add_argument('--max-age', type=float, default=MAX_AGE, help='Segundos hasta volver a consultar un lector')
+    sync_parser.add_argument('--workers', type=int, default=extractor.WORKERS, help='Consultas simultáneas')
+    sync_parser.add_argument('--retries', type=int, default=extractor.RETRIES, help='Reintentos por consulta')
+    sync_parser.add_argument('--timeout', type=float, default=extractor.TIMEOUT, help='Segundos de espera por consulta')
+    sync_parser.add_argument('--loop', type=float, metavar='SEGUNDOS', help='Repetir la pasada cada SEGUNDOS')
+
+    query_parser = commands.add_parser('query', help='Consultar la base local (NDJSON)')
+    query_parser.add_argument('values', nargs='*', metavar='valor', help='Lectores (o ítems con --item)')
+    query_parser.add_argument('--item', action='store_true', help='Los valores son ítems en lugar de lectores')
+    query_parser.add_argument('--ids', metavar='ARCHIVO', help='Valores, uno por línea (- = stdin)')
+
+    commands.add_parser('status', help='Resumen de la base local')
+    args = parser.parse_args(argv)
+
+    mirror = Mirror(args.db)
+    try:
+        if args.command == 'sync':
+            ids = read_ids(args)
+            if not ids:
+                parser.error('indicar los lectores a consultar')
+            while True:
+                started = time.perf_counter()
+                count, errors = sync(mirror, ids, args.max_age, args.workers, args.retries, args.timeout)
+                print(f'{count} lectores consultados ({len(ids) - count} al día), {errors} con error, '
+                      f'{time.perf_counter() - started:.1f} s', file=sys.stderr)
+                if not args.loop:
+                    break
+                time.sleep(args.loop)
+        elif args.command == 'query':
+            ids = read_ids(args)
+            if args.item:
+                results = mirror.items(ids)
+            else:
+                loans = mirror.loans(ids)
+                results = [{'expresion': expresion, 'data': loans[expresion]} if expresion in loans
+                           else {'expresion': expresion, 'error': 'No está en la base local'}
+                           for expresion in dict.fromkeys(ids)]
+            for result in results:
+                print(json.dumps(result, ensure_ascii=False))
+        elif args.command == 'status':
+            print(json.dumps(mirror.summary(), ensure_ascii=False))
+        else:
+            parser.print_help()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mirror.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
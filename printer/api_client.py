@@ -7,25 +7,38 @@ import urllib.request
 import urllib.parse
 import urllib.error
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 import env
+from cassette import UrllibTransport
+from ratecontrol import AdaptiveLimiter
 
 class BiblioAPIClient:
     """
     API client for biblio-server with authentication and CSRF support
     """
 
-    def __init__(self, base_url=None, api_key=None):
+    def __init__(self, base_url=None, api_key=None, transport=None, limiter=None, max_retries=3):
         """
         Initialize API client
 
         Args:
             base_url: Server URL (default: from env.py)
             api_key: API key for authentication (default: from env.py)
+            transport: Object with open(request) used to send requests
+                       (default: UrllibTransport). Use cassette.RecordingTransport
+                       or cassette.ReplayTransport to record/replay responses.
+            limiter: ratecontrol.AdaptiveLimiter shared by all requests
+                     (default: a new AdaptiveLimiter)
+            max_retries: Retries for requests rejected with HTTP 429/503
         """
         self.base_url = base_url or getattr(env, 'APP_HOST', 'http://admin.abr.net:3000')
         self.api_key = api_key or getattr(env, 'API_KEY', None)
         self.csrf_token = None
         self.jwt_token = None
+        self.transport = transport or UrllibTransport()
+        self.limiter = limiter or AdaptiveLimiter()
+        self.max_retries = max_retries
 
     def _make_request(self, url, method='GET', data=None, headers=None):
         """
@@ -70,27 +83,61 @@ class BiblioAPIClient:
             method=method
         )
 
-        # Make request
-        try:
-            response = urllib.request.urlopen(request)
-            response_data = response.read()
+        # Make request (retrying while the server asks us to slow down)
+        attempt = 0
+        while True:
+            attempt += 1
+            self.limiter.acquire()
+            started = time.perf_counter()
+            status = None
+            response_headers = None
+            try:
+                response = self.transport.open(request)
+                status = getattr(response, 'status', None) or response.getcode()
+                response_headers = response.headers
+                response_data = response.read()
+
+                # Parse JSON response
+                if response_data:
+                    return json.loads(response_data)
+                return None
+
+            except urllib.error.HTTPError as e:
+                status = e.code
+                response_headers = e.headers
+                if self.limiter.should_retry(status, attempt, self.max_retries):
+                    continue
+
+                # Read error response
+                error_data = e.read()
+                try:
+                    error_json = json.loads(error_data)
+                    raise Exception(f"HTTP {e.code}: {error_json.get('error', str(e))}")
+                except:
+                    raise Exception(f"HTTP {e.code}: {str(e)}")
+
+            except urllib.error.URLError as e:
+                raise Exception(f"Connection error: {str(e)}")
+
+            finally:
+                self.limiter.release(status, response_headers, time.perf_counter() - started)
+
+    def fetch_many(self, func, items):
+        """
+        Call func(item) for every item in parallel, within the limiter's concurrency
 
-            # Parse JSON response
-            if response_data:
-                return json.loads(response_data)
-            return None
+        Args:
+            func: Client method or function taking one item (e.g. self.get_tirada_page)
+            items: Iterable of arguments
 
-        except urllib.error.HTTPError as e:
-            # Read error response
-            error_data = e.read()
-            try:
-                error_json = json.loads(error_data)
-                raise Exception(f"HTTP {e.code}: {error_json.get('error', str(e))}")
-            except:
-                raise Exception(f"HTTP {e.code}: {str(e)}")
+        Returns:
+            list: Results in the same order as items
 
-        except urllib.error.URLError as e:
-            raise Exception(f"Connection error: {str(e)}")
+        Raises:
+            Exception: The first error raised by func
+        """
+        with ThreadPoolExecutor(max_workers=self.limiter.maximum) as executor:
+            return list(executor.map(func, items))
 
     def get_csrf_token(self):
         """
@@ -182,6 +229,21 @@ class BiblioAPIClient:
         url = f"{self.base_url}/api/tirada/page/{page}"
         return self._make_request(url, method='GET')
 
+    def get_tirada_ranges(self, ranges):
+        """
+        Get tirada records for several ID ranges in parallel
+
+        Args:
+            ranges: List of (start_id, end_id) tuples
+
+        Returns:
+            list: One list of tirada records per range, in order
+
+        Raises:
+            Exception: If any request fails
+        """
+        return self.fetch_many(lambda r: self.get_tirada_range(r[0], r[1]), ranges)
+
     def get_tirada_custom(self, cc_ids):
         """
         Get tirada records by custom ID list
@@ -203,6 +265,30 @@ class BiblioAPIClient:
         url = f"{self.base_url}/api/tirada/custom/{ids_str}"
         return self._make_request(url, method='GET')
 
+    def get_tirada_bulk(self, cc_ids, batch_size=5000):
+        """
+        Get tirada records for any number of IDs (POST /api/tirada/bulk)
+
+        Args:
+            cc_ids: List of cobrocuotas IDs (any size, negative padding IDs are ignored)
+            batch_size: IDs per request (server maximum: 20000)
+
+        Returns:
+            list: Tirada records ordered by CC_ID (duplicates removed)
+
+        Raises:
+            Exception: If any request fails
+        """
+        ids = sorted(set(int(cc_id) for cc_id in cc_ids if int(cc_id) >= 0))
+        if not ids:
+            return []
+
+        url = f"{self.base_url}/api/tirada/bulk"
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        results = self.fetch_many(
+            lambda batch: self._make_request(url, method='POST', data={'ids': batch}), batches)
+        return [record for batch in results for record in (batch or [])]
+
 
 # Convenience functions for backward compatibility
 
@@ -0,0 +1,116 @@
+"""
+Import-Time Benchmark
+Measures the startup cost of the printer client modules with python -X importtime
+
+Each case runs in a new interpreter (as the host app does for every print)
+and reports:
+    imports   total import time of the statement (sum of -X importtime roots)
+    process   wall time of the whole interpreter run, startup included
+    heaviest  modules with the largest own import time
+
+The "eager" cases import what the modules used to load at import time
+(pywin32, user32.dll, PIL, python-escpos); the difference with the plain
+case is the cold start saved by the lazy imports. Modules that do not exist
+on this host (e.g. pywin32 on Linux) are skipped.
+
+Usage:
+    python bench_import.py
+    python bench_import.py --runs 10 --python C:\\biblio-printer\\python\\python.exe
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+EAGER_TIRADA = ("win32print", "win32ui", "win32gui", "win32con", "PIL.Image", "PIL.ImageWin",
+                "PIL.ImageFont", "api_client", "tirada_cell_data")
+EAGER_RECEIPTS = ("escpos.printer", "escpos.image")
+
+CASES = [
+    ("python (startup only)", "pass"),
+    ("print_agent (templates)", "import print_agent"),
+    ("tirada", "import tirada"),
+    ("tirada, eager (before)", "import tirada\n"
+     "try:\n"
+     "    import ctypes; ctypes.WinDLL('user32.dll')\n"
+     "except (OSError, AttributeError):\n"
+     "    pass\n"
+     "for m in %r:\n"
+     "    try:\n"
+     "        __import__(m)\n"
+     "    except ImportError:\n"
+     "        pass" % (EAGER_TIRADA,)),
+    ("receipts", "import receipts"),
+    ("receipts, eager (before)", "import receipts\nfor m in %r: __import__(m)" % (EAGER_RECEIPTS,)),
+    ("dispatcher", "import dispatcher"),
+    ("tirada_summary", "import tirada_summary"),
+]
+
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output ("import time: self [us] | cumulative | name",
+    nested imports indented under the module that imported them)
+
+    Returns:
+        tuple: (total microseconds of the root imports, list of (self us, module))
+    """
+    total = 0
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cumulative, name = line.split("|", 2)
+        modules.append((int(head.split(":", 1)[1]), name.strip()))
+        # Roots have a single space before the name
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total, modules
+
+
+def measure(python, statement):
+    """
+    Run a statement in a new interpreter with -X importtime
+
+    Returns:
+        tuple: (import seconds, process seconds, heaviest [(self us, module)])
+    """
+    started = time.perf_counter()
+    result = subprocess.run([python, "-X", "importtime", "-c", statement], cwd=HERE,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise Exception(result.stderr.strip().splitlines()[-1])
+    total, modules = parse_importtime(result.stderr)
+    modules.sort(reverse=True)
+    return total / 1e6, elapsed, modules[:3]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de importación de los módulos del cliente de impresión")
+    parser.add_argument("--runs", type=int, default=5, help="Ejecuciones por caso (se informa la primera y la mejor)")
+    parser.add_argument("--python", default=sys.executable, help="Intérprete a medir")
+    args = parser.parse_args(argv)
+
+    print(f"{'Caso':<28}{'imports 1ª':>12}{'mejor':>10}{'proceso':>10}  más pesados (ms propios)")
+    for name, statement in CASES:
+        try:
+            runs = [measure(args.python, statement) for _ in range(args.runs)]
+        except Exception as e:
+            print(f"{name:<28}  no disponible: {e}")
+            continue
+        first = runs[0][0]
+        best = min(runs)
+        heaviest = ", ".join(f"{module} {us / 1000:.0f}" for us, module in best[2])
+        print(f"{name:<28}{first * 1000:>10.1f}ms{best[0] * 1000:>8.1f}ms"
+              f"{best[1] * 1000:>8.1f}ms  {heaviest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
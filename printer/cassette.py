@@ -0,0 +1,339 @@
+"""
+HTTP transports for BiblioAPIClient
+Live transport plus record/replay "cassettes" for offline benchmarks and tests
+"""
+
+import base64
+import email.message
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Headers and JSON body fields never written to a cassette file
+SECRET_HEADERS = ('x-api-key', 'authorization', 'x-csrf-token', 'cookie', 'set-cookie')
+SECRET_FIELDS = ('password',)
+SECRET_RESPONSE_FIELDS = ('csrfToken', 'accessToken', 'refreshToken', 'token')
+
+
+class UrllibTransport:
+    """
+    Live transport: sends requests with urllib.request.urlopen
+    """
+
+    def __init__(self, timeout=None):
+        """
+        Initialize live transport
+
+        Args:
+            timeout: Socket timeout in seconds (default: no timeout)
+        """
+        self.timeout = timeout
+
+    def open(self, request):
+        """
+        Send a request to the server
+
+        Args:
+            request: urllib.request.Request
+
+        Returns:
+            File-like response with read(), status and headers
+
+        Raises:
+            urllib.error.HTTPError: On HTTP errors
+            urllib.error.URLError: On connection errors
+        """
+        if self.timeout is None:
+            return urllib.request.urlopen(request)
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+
+class CassetteResponse:
+    """
+    In-memory response with the same interface as urlopen() results
+    """
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = _make_headers(headers)
+        self._body = io.BytesIO(body)
+
+    def read(self, amt=None):
+        return self._body.read() if amt is None else self._body.read(amt)
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+    def close(self):
+        self._body.close()
+
+
+class Cassette:
+    """
+    Recorded request/response pairs stored as a JSON file
+
+    Interactions are matched by (method, url, body). When the same request
+    was recorded several times, replays return the recordings in order and
+    repeat the last one once they run out.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize cassette
+
+        Args:
+            path: JSON file holding the interactions (created on first save)
+        """
+        self.path = path
+        self.interactions = []
+        self._lock = threading.Lock()
+        self._played = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.interactions = json.load(f).get('interactions', [])
+
+    def append(self, method, url, body, status, headers, response_body, elapsed):
+        """
+        Add an interaction and write the cassette to disk
+        """
+        response_body, masked = _mask_response_body(response_body)
+        hidden = SECRET_HEADERS + (('content-length',) if masked else ())
+        interaction = {
+            'request': {
+                'method': method,
+                'url': url,
+                'body': _encode_request_body(body)
+            },
+            'response': {
+                'status': status,
+                'headers': {k: v for k, v in headers.items() if k.lower() not in hidden},
+                'body': _encode_body(response_body),
+                'elapsed': round(elapsed, 6)
+            }
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+            self.save()
+
+    def save(self):
+        """
+        Write the cassette atomically (temp file + rename)
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'interactions': self.interactions}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def find(self, method, url, body):
+        """
+        Find the next recorded response for a request
+
+        Returns:
+            dict: Recorded response, or None if the request was never recorded
+        """
+        encoded = _encode_request_body(body)
+        key = (method, url, json.dumps(encoded, sort_keys=True))
+        with self._lock:
+            matches = [i['response'] for i in self.interactions
+                       if i['request']['method'] == method and i['request']['url'] == url
+                       and i['request']['body'] == encoded]
+            if not matches:
+                return None
+            index = self._played.get(key, 0)
+            self._played[key] = index + 1
+            return matches[min(index, len(matches) - 1)]
+
+    def rewind(self):
+        """
+        Restart replay from the first recording of every request
+        """
+        with self._lock:
+            self._played = {}
+
+
+class RecordingTransport:
+    """
+    Transport that forwards to a live transport and records every response
+    """
+
+    def __init__(self, cassette, inner=None):
+        """
+        Initialize recording transport
+
+        Args:
+            cassette: Cassette instance or path to the cassette file
+            inner: Transport that performs the real request (default: UrllibTransport)
+        """
+        self.cassette = cassette if isinstance(cassette, Cassette) else Cassette(cassette)
+        self.inner = inner or UrllibTransport()
+
+    def open(self, request):
+        method = request.get_method()
+        url = request.full_url
+        started = time.perf_counter()
+        try:
+            response = self.inner.open(request)
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            self.cassette.append(method, url, request.data, e.code, dict(e.headers or {}),
+                                 body, time.perf_counter() - started)
+            raise urllib.error.HTTPError(url, e.code, e.msg, e.headers, io.BytesIO(body))
+
+        body = response.read()
+        status = getattr(response, 'status', None) or response.getcode()
+        headers = dict(response.headers or {})
+        self.cassette.append(method, url, request.data, status, headers,
+                             body, time.perf_counter() - started)
+        return CassetteResponse(url, status, headers, body)
+
+
+class ReplayTransport:
+    """
+    Transport that serves responses from a cassette without touching the network
+
+    Latency and bandwidth can be simulated to benchmark client code against
+    realistic timings:
+        latency=None       no delay
+        latency=0.05       fixed 50 ms per request
+        latency='recorded' the elapsed time measured while recording
+        bandwidth=N        additional len(body) / N seconds (bytes per second)
+    """
+
+    def __init__(self, cassette, latency=None, bandwidth=None, sleep=time.sleep):
+        """
+        Initialize replay transport
+
+        Args:
+            cassette: Cassette instance or path to the cassette file
+            latency: Simulated latency (None, seconds or 'recorded')
+            bandwidth: Simulated bandwidth in bytes per second (None = unlimited)
+            sleep: Sleep function (replaceable for tests)
+        """
+        self.cassette = cassette if isinstance(cassette, Cassette) else Cassette(cassette)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.sleep = sleep
+
+    def open(self, request):
+        method = request.get_method()
+        url = request.full_url
+        recorded = self.cassette.find(method, url, request.data)
+        if recorded is None:
+            raise urllib.error.URLError(f"No recorded response for {method} {url}")
+
+        body = _decode_body(recorded['body']) or b''
+        delay = self._delay(recorded, len(body))
+        if delay > 0:
+            self.sleep(delay)
+
+        status = recorded['status']
+        if status >= 400:
+            raise urllib.error.HTTPError(url, status, 'Recorded error',
+                                         _make_headers(recorded['headers']), io.BytesIO(body))
+        return CassetteResponse(url, status, recorded['headers'], body)
+
+    def _delay(self, recorded, size):
+        if self.latency == 'recorded':
+            delay = recorded.get('elapsed', 0)
+        else:
+            delay = self.latency or 0
+        if self.bandwidth:
+            delay += size / self.bandwidth
+        return delay
+
+
+def _make_headers(headers):
+    message = email.message.Message()
+    for name, value in (headers or {}).items():
+        message[name] = value
+    return message
+
+
+def _encode_body(data):
+    """
+    Store text bodies as-is and binary bodies as base64
+    """
+    if data is None:
+        return None
+    try:
+        return {'text': data.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(data).decode('ascii')}
+
+
+def _mask_fields(payload, fields):
+    """
+    Replace the given fields of a JSON value (at any depth) with '***'
+
+    Returns:
+        bool: True if a field was masked
+    """
+    masked = False
+    if isinstance(payload, dict):
+        for key, value in payload.items():
+            if key in fields and value is not None:
+                payload[key] = '***'
+                masked = True
+            else:
+                masked = _mask_fields(value, fields) or masked
+    elif isinstance(payload, list):
+        for value in payload:
+            masked = _mask_fields(value, fields) or masked
+    return masked
+
+
+def _mask_response_body(data):
+    """
+    Mask the tokens of a JSON response body (csrf-token, login, refresh)
+
+    Returns:
+        tuple: (body, True if it was changed)
+    """
+    if not data:
+        return data, False
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return data, False
+    if not _mask_fields(payload, SECRET_RESPONSE_FIELDS):
+        return data, False
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8'), True
+
+
+def _encode_request_body(data):
+    """
+    Encode a request body, masking secret fields of JSON bodies (e.g. login)
+    """
+    if data is None:
+        return None
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return _encode_body(data)
+    if isinstance(payload, dict):
+        for field in SECRET_FIELDS:
+            if field in payload:
+                payload[field] = '***'
+        data = json.dumps(payload, sort_keys=True).encode('utf-8')
+    return _encode_body(data)
+
+
+def _decode_body(stored):
+    if stored is None:
+        return None
+    if 'text' in stored:
+        return stored['text'].encode('utf-8')
+    return base64.b64decode(stored['base64'])
@@ -0,0 +1,406 @@
+"""
+Multi-Printer Receipt Dispatcher
+Spreads receipt jobs over a pool of network and serial ESC/POS printers
+
+Every printer has its own worker thread and persistent ReceiptPrinter
+session. Jobs are assigned when submitted:
+    'round_robin'   next healthy printer in turn
+    'least_loaded'  healthy printer with the fewest queued receipts
+
+A printer that fails with a connection error is taken out of the pool; its
+current and queued jobs go back to the dispatcher and are reassigned to the
+remaining printers (or held until one comes back). A health check thread
+reopens failed printers every health_interval seconds. A receipt that has
+been tried max_attempts times is not reassigned again: it fails with the
+last printer error.
+
+submit() blocks once max_pending jobs are waiting (backpressure), so a
+producer cannot queue receipts faster than the pool prints them.
+
+Usage:
+    pool = [{"printer_conn": "network", "printer_host": "192.168.1.100"},
+            {"printer_conn": "serial", "comm_name": "COM3"}]
+    with ReceiptDispatcher(pool) as dispatcher:
+        jobs = [dispatcher.submit(receipts.RECIBO_COB, record) for record in records]
+        dispatcher.join()
+
+    python dispatcher.py recibos.json --layout cob
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import queue
+import sys
+import threading
+import time
+
+import env
+import receipts
+
+STRATEGIES = ("round_robin", "least_loaded")
+
+# Printers a receipt is tried on before it fails
+MAX_ATTEMPTS = 3
+
+
+def printer_errors():
+    """
+    Errors that mean the printer (not the receipt) failed
+    """
+    from escpos.exceptions import DeviceNotFoundError
+    return (OSError, DeviceNotFoundError)
+
+
+class ReceiptJob:
+    """
+    One receipt submitted to the dispatcher
+    """
+
+    def __init__(self, layout, record):
+        self.layout = layout
+        self.record = record
+        self.printer = None
+        self.attempts = 0
+        self.error = None
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until the receipt is printed
+
+        Returns:
+            bool: True if printed, False on timeout
+
+        Raises:
+            Exception: The error that made the receipt itself fail
+        """
+        if not self._done.wait(timeout):
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class PrinterSlot:
+    """
+    Printer in the pool: session, job queue and health state
+    """
+
+    def __init__(self, config, session):
+        self.config = config
+        self.name = receipts.printer_id(config)
+        self.session = session
+        self.jobs = collections.deque()
+        self.current = None
+        self.healthy = True
+        self.printed = 0
+        self.failures = 0
+        self.last_error = None
+        self.thread = None
+
+    def load(self):
+        return len(self.jobs) + (1 if self.current is not None else 0)
+
+
+class ReceiptDispatcher:
+    """
+    Job queue and load balancer for a pool of receipt printers
+    """
+
+    def __init__(self, printers=None, strategy="least_loaded", max_pending=200,
+                 health_interval=10.0, session_factory=None, max_attempts=MAX_ATTEMPTS):
+        """
+        Initialize dispatcher and start the printer workers
+
+        Args:
+            printers: List of connection settings (see receipts.default_config());
+                      default: env.ESCPOS_PRINTERS, or the single env.py printer
+            strategy: 'round_robin' or 'least_loaded'
+            max_pending: Jobs accepted before submit() blocks
+            health_interval: Seconds between reconnection attempts to failed printers
+            session_factory: Function config -> ReceiptPrinter (replaceable for tests)
+            max_attempts: Printer failures a receipt survives before it fails
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}")
+        if printers is None:
+            printers = getattr(env, "ESCPOS_PRINTERS", None) or [{}]
+        factory = session_factory or receipts.ReceiptPrinter
+        self.strategy = strategy
+        self.max_pending = max_pending
+        self.health_interval = health_interval
+        self.max_attempts = max_attempts
+        self.slots = []
+        for config in printers:
+            config = dict(receipts.default_config(), **config)
+            self.slots.append(PrinterSlot(config, factory(config)))
+        self.backlog = collections.deque()
+        self.pending = 0
+        self.closed = False
+        self._cond = threading.Condition()
+        self._turn = itertools.cycle(range(len(self.slots)))
+
+        for slot in self.slots:
+            slot.thread = threading.Thread(target=self._worker, args=(slot,),
+                                           name=f"printer {slot.name}", daemon=True)
+            slot.thread.start()
+        self._health_thread = threading.Thread(target=self._health_check,
+                                               name="printer health", daemon=True)
+        self._health_thread.start()
+
+    def submit(self, layout, record, timeout=None):
+        """
+        Queue one receipt
+
+        Args:
+            layout: Receipt layout (receipts.RECIBO_ADM, receipts.RECIBO_COB, ...)
+            record: Receipt record (dict with the layout #fields)
+            timeout: Seconds to wait while the queue is full (None = wait forever)
+
+        Returns:
+            ReceiptJob
+
+        Raises:
+            queue.Full: The queue stayed full for timeout seconds
+        """
+        job = ReceiptJob(layout, record)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.pending >= self.max_pending and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Full("Receipt queue is full")
+                self._cond.wait(remaining)
+            if self.closed:
+                raise Exception("Dispatcher is closed")
+            self.pending += 1
+            self._assign(job)
+        return job
+
+    def submit_batch(self, layout, records):
+        """
+        Queue several receipts (blocking while the queue is full)
+
+        Returns:
+            list: ReceiptJob per record, in order
+        """
+        return [self.submit(layout, record) for record in records]
+
+    def join(self, timeout=None):
+        """
+        Wait until every submitted job is finished
+
+        Returns:
+            bool: True if the queue drained, False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, wait=True, timeout=None):
+        """
+        Stop the workers and close the printer sessions
+
+        Jobs that are still queued when the workers stop are finished with an
+        error, so nobody waits on them forever.
+
+        Args:
+            wait: Print the queued jobs first
+            timeout: Seconds to wait for them (None = until they are printed)
+        """
+        if wait:
+            self.join(timeout)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        for slot in self.slots:
+            slot.thread.join()
+        self._health_thread.join()
+        for slot in self.slots:
+            slot.session.close()
+
+        # Jobs left behind by close(wait=False) or the timeout are finished with an error
+        with self._cond:
+            left = list(self.backlog) + [job for slot in self.slots for job in slot.jobs]
+            self.backlog.clear()
+            for slot in self.slots:
+                slot.jobs.clear()
+            for job in left:
+                job.error = Exception("Dispatcher closed before the receipt was printed")
+                self.pending -= 1
+                job._done.set()
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(wait=exc_type is None)
+
+    def status(self):
+        """
+        State of every printer in the pool
+
+        Returns:
+            list: Dicts with name, healthy, queued, printed, failures and last_error
+        """
+        with self._cond:
+            return [{
+                "name": slot.name,
+                "healthy": slot.healthy,
+                "queued": slot.load(),
+                "printed": slot.printed,
+                "failures": slot.failures,
+                "last_error": str(slot.last_error) if slot.last_error else None,
+            } for slot in self.slots]
+
+    def _assign(self, job):
+        """
+        Put a job on a healthy printer queue, or hold it in the backlog (lock held)
+        """
+        healthy = [slot for slot in self.slots if slot.healthy]
+        if not healthy:
+            self.backlog.append(job)
+            return
+        if self.strategy == "round_robin":
+            slot = next(self.slots[i] for i in self._turn if self.slots[i].healthy)
+        else:
+            slot = min(healthy, key=PrinterSlot.load)
+        slot.jobs.append(job)
+        self._cond.notify_all()
+
+    def _worker(self, slot):
+        errors = printer_errors()
+        while True:
+            with self._cond:
+                while not self.closed and not (slot.healthy and slot.jobs):
+                    self._cond.wait()
+                if self.closed:
+                    return
+                job = slot.jobs.popleft()
+                slot.current = job
+                job.attempts += 1
+
+            try:
+                slot.session.print_receipt(job.layout, job.record)
+            except errors as e:
+                self._printer_failed(slot, job, e)
+                continue
+            except Exception as e:
+                job.error = e
+            self._finish(slot, job)
+
+    def _finish(self, slot, job):
+        with self._cond:
+            slot.current = None
+            if job.error is None:
+                job.printer = slot.name
+                slot.printed += 1
+            self.pending -= 1
+            job._done.set()
+            self._cond.notify_all()
+
+    def _printer_failed(self, slot, job, error):
+        """
+        Take the printer out of the pool and hand its jobs to the others
+
+        The failed job itself is finished with an error once it has been
+        tried max_attempts times.
+        """
+        try:
+            slot.session.close()
+        except Exception:
+            pass
+        with self._cond:
+            slot.current = None
+            slot.healthy = False
+            slot.failures += 1
+            slot.last_error = error
+            jobs = list(slot.jobs)
+            slot.jobs.clear()
+            if job.attempts >= self.max_attempts:
+                job.error = Exception(f"Receipt not printed after {job.attempts} attempts: {error}")
+                self.pending -= 1
+                job._done.set()
+            else:
+                jobs.insert(0, job)
+            for pending_job in jobs:
+                self._assign(pending_job)
+            self._cond.notify_all()
+
+    def _health_check(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.closed, self.health_interval)
+                if self.closed:
+                    return
+                failed = [slot for slot in self.slots if not slot.healthy]
+
+            for slot in failed:
+                try:
+                    self._probe(slot)
+                except Exception as e:
+                    with self._cond:
+                        slot.last_error = e
+                    continue
+                with self._cond:
+                    slot.healthy = True
+                    while self.backlog:
+                        self._assign(self.backlog.popleft())
+                    self._cond.notify_all()
+
+    def _probe(self, slot):
+        """
+        Reconnect a failed printer (raises if it is still unreachable)
+        """
+        slot.session.close()
+        slot.session.open()
+        # python-escpos 3 connects lazily: connect now (raises DeviceNotFoundError)
+        printer = slot.session.printer
+        if getattr(printer, "_device", None) is False:
+            printer.open()
+
+
+def load_records(path):
+    """
+    Read receipt records from a JSON file (list of dicts) or '-' for stdin
+    """
+    if path == "-":
+        return json.load(sys.stdin)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Imprimir recibos repartidos entre varias impresoras")
+    parser.add_argument("records", help="Archivo JSON con la lista de recibos ('-' = stdin)")
+    parser.add_argument("--layout", choices=("adm", "cob"), default="cob", help="Tipo de recibo")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="least_loaded")
+    args = parser.parse_args(argv)
+
+    layout = receipts.RECIBO_ADM if args.layout == "adm" else receipts.RECIBO_COB
+    records = load_records(args.records)
+    with ReceiptDispatcher(strategy=args.strategy) as dispatcher:
+        jobs = dispatcher.submit_batch(layout, records)
+        dispatcher.join()
+        for printer in dispatcher.status():
+            print(f"{printer['name']}: {printer['printed']} recibos"
+                  + ("" if printer["healthy"] else f" (fuera de servicio: {printer['last_error']})"))
+    failed = [job for job in jobs if job.error is not None]
+    for job in failed:
+        print(f"Error en recibo {job.record.get('cuota_id')}: {job.error}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
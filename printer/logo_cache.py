@@ -0,0 +1,162 @@
+"""
+Receipt Logo Cache
+Pre-rasterized logo bytes per printer profile, and NV (non-volatile) memory logos
+
+p.image("logo.bmp") reloads, dithers and re-encodes the bitmap for every
+receipt and sends the full raster over the serial line. This module:
+
+- 'cached' mode: converts the logo once per (image, printer profile) to the
+  exact ESC/POS raster bytes and stores them on disk (logo_cache/*.bin).
+- 'nv' mode: uploads the logo once to the printer's NV graphics memory
+  (FS q) and prints it by reference (FS p), 4 bytes per receipt.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logo_cache")
+
+FS = b"\x1c"
+# FS p n m: print NV bit image n (1-based) in normal mode
+NV_PRINT = FS + b"p"
+# FS q n: define NV bit images (replaces all stored images)
+NV_DEFINE = FS + b"q"
+
+
+def profile_key(profile):
+    """
+    Cache key of a python-escpos profile (object or name; None = 'default')
+    """
+    if profile is None:
+        return "default"
+    if isinstance(profile, str):
+        return profile
+    return type(profile).__name__
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def nv_define_bytes(image_paths):
+    """
+    Build the FS q command that stores the given images in NV memory
+
+    FS q n [xL xH yL yH d1...dk]1 ... [xL xH yL yH d1...dk]n
+    x = (xL + xH*256) * 8 dots, y = (yL + yH*256) * 8 dots, data in
+    columns: for each dot column, y/8 bytes from top to bottom (MSB on top).
+    """
+    from escpos.image import EscposImage
+    blocks = []
+    for path in image_paths:
+        im = EscposImage(path)
+        width_bytes = im.width_bytes
+        raster = im.to_raster_format()
+        height = im.height
+        height_bytes = (height + 7) // 8
+        data = bytearray(width_bytes * 8 * height_bytes)
+        pos = 0
+        for x in range(width_bytes * 8):
+            src_byte = x // 8
+            src_mask = 0x80 >> (x % 8)
+            for yb in range(height_bytes):
+                value = 0
+                for bit in range(8):
+                    y = yb * 8 + bit
+                    if y < height and raster[y * width_bytes + src_byte] & src_mask:
+                        value |= 0x80 >> bit
+                data[pos] = value
+                pos += 1
+        blocks.append(bytes((width_bytes & 0xFF, width_bytes >> 8,
+                             height_bytes & 0xFF, height_bytes >> 8)) + bytes(data))
+    return NV_DEFINE + bytes((len(blocks),)) + b"".join(blocks)
+
+
+def nv_print_bytes(number=1):
+    """
+    FS p command that prints stored NV image number (1-based)
+    """
+    return NV_PRINT + bytes((number, 0))
+
+
+class LogoCache:
+    """
+    Disk and memory cache of rasterized logos, keyed by image content and profile
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def raster(self, path, profile=None, impl="bitImageRaster"):
+        """
+        ESC/POS bytes that print the image, as p.image(path, impl=impl) would send them
+
+        Args:
+            path: Image file (bmp, png, jpg, gif)
+            profile: python-escpos profile (object or name) of the target printer
+            impl: Image command (bitImageRaster, graphics or bitImageColumn)
+
+        Returns:
+            bytes: Ready-to-send command stream
+        """
+        key = f"{file_digest(path)}-{profile_key(profile)}-{impl}"
+        with self._lock:
+            cached = self._memory.get(key)
+        if cached is not None:
+            return cached
+
+        cache_path = os.path.join(self.cache_dir, key + ".bin")
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                data = f.read()
+        else:
+            from escpos.printer import Dummy
+            if profile is None or isinstance(profile, str):
+                renderer = Dummy(profile=profile)
+            else:
+                renderer = Dummy()
+                renderer.profile = profile
+            renderer.image(path, impl=impl)
+            data = renderer.output
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+
+        with self._lock:
+            self._memory[key] = data
+        return data
+
+    def nv_uploaded(self, printer_id, path):
+        """
+        Whether this exact image was already uploaded to the printer's NV memory
+        """
+        return self._nv_state().get(printer_id) == file_digest(path)
+
+    def mark_nv_uploaded(self, printer_id, path):
+        state = self._nv_state()
+        state[printer_id] = file_digest(path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, "nv_uploads.json"), "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=1)
+
+    def _nv_state(self):
+        state_path = os.path.join(self.cache_dir, "nv_uploads.json")
+        if not os.path.exists(state_path):
+            return {}
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def upload_nv_logo(printer, path):
+    """
+    Store the logo as NV image 1 (erases other NV images; flash has limited
+    write cycles, so only call this when the logo changes)
+    """
+    printer._raw(nv_define_bytes([path]))
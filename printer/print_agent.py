@@ -0,0 +1,346 @@
+"""
+Print Agent
+Long-running local process that runs print jobs with warm imports and printer sessions
+
+The host application used to start a new Python interpreter for every print
+(tiradas_interf.py, print_rulers.py, recibo_*.py), which re-imported pywin32,
+PIL and python-escpos and reopened the printer each time. The agent loads
+those once, compiles the receipt layouts at startup and keeps one
+ReceiptDispatcher (queue + open session) per receipt printer.
+
+HTTP/JSON API (bound to 127.0.0.1 only):
+    GET  /health            {"status": "ok", "uptime": ..., "jobs": ...}
+    GET  /printers          Windows printer names
+    POST /jobs/tirada       {"printer", "serverip", "lines", "ccids"[, "order", "zone_break"]}
+    POST /jobs/ruler        {"printer", "matrix", "scale"}
+    POST /jobs/receipt      {"layout": "adm"|"cob", "config": {...}, "records": [...]}
+
+Every response carries "elapsed_ms". Errors return {"error": "..."} with
+status 400 (bad request) or 500 (print failed).
+
+POST requests must be sent as Content-Type: application/json (else 415):
+a web page open in the browser cannot send that to 127.0.0.1 without a
+CORS preflight, which the agent does not answer. A receipt "config" only
+takes the recibo_*.py template fields (printer_conn network or serial,
+printer_host/port and comm_*); profile, logo mode and virtual printers
+come from env.py. At most MAX_DISPATCHERS printers are kept open; the
+least recently used idle one is closed to make room.
+
+The templates call run_job(), which sends the job to the agent and falls
+back to printing in-process when the agent is not running.
+
+Usage:
+    python print_agent.py [--port 8765]
+"""
+
+import argparse
+import collections
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import env
+
+HOST = "127.0.0.1"
+PORT = getattr(env, "PRINT_AGENT_PORT", 8765)
+# Seconds the templates wait for a job (a long tirada can take minutes)
+JOB_TIMEOUT = getattr(env, "PRINT_AGENT_TIMEOUT", 600)
+# Receipt printers kept open at once
+MAX_DISPATCHERS = getattr(env, "PRINT_AGENT_MAX_PRINTERS", 8)
+
+# Printer settings a receipt job can carry (the recibo_*.py template fields)
+CONFIG_FIELDS = ("printer_conn", "printer_host", "printer_port", "comm_name", "comm_bps", "comm_bsz",
+                 "comm_stop", "comm_par")
+
+# tirada.py draws on module-level GDI handles: one Windows print job at a time
+_gdi_lock = threading.Lock()
+_dispatchers = collections.OrderedDict()
+_dispatchers_lock = threading.Lock()
+# Layouts compiled by warm_up(): (profile, logo_mode) -> [(layout, CompiledReceipt)]
+_templates = {}
+_stats = {"started": time.time(), "jobs": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _print_tirada(payload):
+    import tirada
+    ccids = [int(ccid) for ccid in payload["ccids"]]
+    with _gdi_lock:
+        tirada.print_fees(payload["printer"], payload["serverip"], bool(payload.get("lines")), ccids,
+                          order=payload.get("order"), zone_break=bool(payload.get("zone_break")))
+    return {"ccids": len(ccids)}
+
+
+def _print_ruler(payload):
+    import tirada
+    with _gdi_lock:
+        tirada.print_ruler(payload["printer"], bool(payload.get("matrix")), bool(payload.get("scale")))
+    return {}
+
+
+def _print_receipt(payload):
+    import receipts
+    layouts = {"adm": receipts.RECIBO_ADM, "cob": receipts.RECIBO_COB}
+    if payload.get("layout") not in layouts:
+        raise ValueError("layout must be 'adm' or 'cob'")
+    records = payload.get("records")
+    if not isinstance(records, list) or not records:
+        raise ValueError("records must be a non-empty list")
+
+    dispatcher = get_dispatcher(payload.get("config") or {})
+    jobs = dispatcher.submit_batch(layouts[payload["layout"]], records)
+    deadline = time.monotonic() + JOB_TIMEOUT
+    for job in jobs:
+        if not job.wait(max(deadline - time.monotonic(), 0)):
+            raise Exception("Timed out waiting for the printer (receipts stay queued)")
+    return {"printed": len(jobs), "printers": sorted({job.printer for job in jobs})}
+
+
+def _list_printers(payload=None):
+    import tirada
+    return {"printers": tirada.get_printers_list()}
+
+
+JOBS = {
+    "tirada": _print_tirada,
+    "ruler": _print_ruler,
+    "receipt": _print_receipt,
+}
+
+
+def printer_config(config):
+    """
+    Printer settings of a receipt job
+
+    Template fields left empty by the host app fall back to env.py.
+
+    Raises:
+        ValueError: A setting that is not a template field, or a printer_conn
+                    other than 'network' or 'serial'
+    """
+    if not isinstance(config, dict):
+        raise ValueError("config must be an object")
+    unknown = sorted(set(config) - set(CONFIG_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown printer settings: {', '.join(unknown)}")
+    config = {key: value for key, value in config.items() if value not in (None, "")}
+    if config.get("printer_conn", "network") not in ("network", "serial"):
+        raise ValueError("printer_conn must be 'network' or 'serial'")
+    return config
+
+
+def get_dispatcher(config):
+    """
+    Warm receipt dispatcher (one open session) for a printer configuration
+
+    Raises:
+        ValueError: Invalid printer settings (see printer_config())
+        Exception: MAX_DISPATCHERS printers are busy
+    """
+    import dispatcher
+    import receipts
+    full = dict(receipts.default_config(), **printer_config(config))
+    key = receipts.printer_id(full)
+    evicted = None
+    with _dispatchers_lock:
+        if key in _dispatchers:
+            _dispatchers.move_to_end(key)
+            return _dispatchers[key]
+        if len(_dispatchers) >= MAX_DISPATCHERS:
+            idle = next((name for name, d in _dispatchers.items() if not d.pending), None)
+            if idle is None:
+                raise Exception("Too many receipt printers in use")
+            evicted = _dispatchers.pop(idle)
+        templates = _templates.get((full["profile"], full["logo_mode"]), ())
+        result = _dispatchers[key] = dispatcher.ReceiptDispatcher(
+            [full], session_factory=lambda config: receipts.ReceiptPrinter(config, templates=templates))
+    if evicted is not None:
+        evicted.close(wait=False)
+    return result
+
+
+def execute(kind, payload):
+    """
+    Run a job in this process
+
+    Returns:
+        dict: Job result
+
+    Raises:
+        ValueError: Unknown job kind or invalid payload
+    """
+    if kind not in JOBS:
+        raise ValueError(f"Unknown job: {kind}")
+    return JOBS[kind](payload)
+
+
+def warm_up():
+    """
+    Import the printing modules and compile the receipt layouts ahead of the first job
+
+    The layouts are compiled for the env.py profile and logo mode; the
+    sessions of printers with those settings start with them (get_dispatcher()).
+    """
+    import receipts
+    config = receipts.default_config()
+    templates = _templates[(config["profile"], config["logo_mode"])] = []
+    for layout in (receipts.RECIBO_ADM, receipts.RECIBO_COB):
+        try:
+            templates.append((layout, receipts.compile_layout(layout, config["profile"], config["logo_mode"])))
+        except Exception as e:
+            # Sin precompilar, el primer recibo compila el layout (y muestra el error)
+            print(f"Layout de recibo no precompilado: {e}")
+    try:
+        # tirada.py loads these on first use: load them now
+        import tirada
+        import tirada_cell_data  # noqa: F401
+        from PIL import Image, ImageWin  # noqa: F401
+        tirada.load_win32()
+        tirada.load_draw_text()
+    except (ImportError, AttributeError, OSError) as e:
+        print(f"Impresión de tiradas no disponible: {e}")
+
+
+def shutdown(wait=True):
+    """
+    Close the printer sessions
+
+    Args:
+        wait: Print the queued receipts first (for up to JOB_TIMEOUT seconds);
+              receipts still queued after that are failed
+    """
+    with _dispatchers_lock:
+        dispatchers = list(_dispatchers.values())
+        _dispatchers.clear()
+    for dispatcher in dispatchers:
+        dispatcher.close(wait, timeout=JOB_TIMEOUT)
+
+
+class AgentHandler(BaseHTTPRequestHandler):
+    """
+    HTTP/JSON handler of the print agent
+    """
+
+    def do_GET(self):
+        started = time.perf_counter()
+        if self.path == "/health":
+            self._reply(200, {"status": "ok", "uptime": round(time.time() - _stats["started"]),
+                              "jobs": _stats["jobs"], "errors": _stats["errors"]}, started)
+        elif self.path == "/printers":
+            self._run(_list_printers, None, started)
+        else:
+            self._reply(404, {"error": "Not found"}, started)
+
+    def do_POST(self):
+        started = time.perf_counter()
+        kind = self.path[len("/jobs/"):] if self.path.startswith("/jobs/") else None
+        if kind not in JOBS:
+            self._reply(404, {"error": "Not found"}, started)
+            return
+        if self.headers.get_content_type() != "application/json":
+            self._reply(415, {"error": "Content-Type must be application/json"}, started)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError as e:
+            self._reply(400, {"error": f"Invalid JSON: {e}"}, started)
+            return
+        self._run(JOBS[kind], payload, started)
+
+    def _run(self, func, payload, started):
+        try:
+            result = func(payload)
+        except (KeyError, TypeError, ValueError) as e:
+            self._count("errors")
+            self._reply(400, {"error": f"Invalid job: {e!r}"}, started)
+            return
+        except Exception as e:
+            self._count("errors")
+            self._reply(500, {"error": str(e)}, started)
+            return
+        self._count("jobs")
+        self._reply(200, dict(result, ok=True), started)
+
+    def _count(self, name):
+        with _stats_lock:
+            _stats[name] += 1
+
+    def _reply(self, status, body, started):
+        body["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if getattr(env, "VERBOSE_LOGGING", False):
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def run_job(kind, payload, port=None):
+    """
+    Send a job to the running agent, or run it in this process if there is none
+
+    Used by the host application templates (tiradas_interf.py, print_rulers.py,
+    recibo_*.py).
+
+    Returns:
+        dict: Job result
+
+    Raises:
+        Exception: If the job failed
+    """
+    url = f"http://{HOST}:{port or PORT}/jobs/{kind}"
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=JOB_TIMEOUT) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read().decode("utf-8")).get("error")
+        except ValueError:
+            message = e.reason
+        raise Exception(f"Print agent error {e.code}: {message}")
+    except urllib.error.URLError:
+        pass
+
+    # No agent running: print directly
+    try:
+        result = execute(kind, payload)
+    except Exception:
+        # Printer unreachable or job timed out: drop the queued receipts
+        shutdown(wait=False)
+        raise
+    shutdown()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agente de impresión local (API HTTP/JSON)")
+    parser.add_argument("--port", type=int, default=PORT, help="Puerto local")
+    args = parser.parse_args(argv)
+
+    warm_up()
+    server = ThreadingHTTPServer((HOST, args.port), AgentHandler)
+    server.daemon_threads = True
+    print(f"Agente de impresión escuchando en http://{HOST}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,9 @@
-import tirada
+import print_agent
 
-tirada.print_ruler("{printer.value}", {matrix.value}, {scale.value})
\ No newline at end of file
+# Sent to the print agent (print_agent.py); printed in-process if it is not running
+# The host app fills in the field placeholders: no other braces in this file
+print_agent.run_job("ruler", dict(
+    printer="{printer.value}",
+    matrix={matrix.value},
+    scale={scale.value},
+))
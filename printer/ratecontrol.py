@@ -0,0 +1,172 @@
+"""
+Adaptive concurrency and rate control for BiblioAPIClient
+Keeps parallel API calls below the server rate limits (backend/middleware/rateLimiters.js)
+"""
+
+import threading
+import time
+
+# Status codes that mean "slow down" (rate limited / temporarily unavailable)
+BACKOFF_STATUS = (429, 503)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) concurrency limiter
+
+    - Every fast successful response raises the concurrency limit by 1/limit
+      (about +1 per "round" of requests).
+    - A 429/503 response halves the limit and pauses all new requests until
+      the time given by Retry-After / RateLimit-Reset (or an exponential backoff).
+    - When RateLimit-Remaining reports the quota is almost used, new requests
+      wait for RateLimit-Reset instead of triggering 429 errors.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=8, target_latency=1.0,
+                 backoff=1.0, max_backoff=60.0, clock=time.monotonic):
+        """
+        Initialize limiter
+
+        Args:
+            initial: Initial number of concurrent requests
+            minimum: Lowest concurrency limit
+            maximum: Highest concurrency limit
+            target_latency: Responses faster than this (seconds) ramp the limit up
+            backoff: First pause (seconds) after a 429/503 without Retry-After
+            max_backoff: Longest pause (seconds)
+            clock: Time function (replaceable for tests)
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.remaining = None
+        self._failures = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Block until a request may be sent
+        """
+        with self._cond:
+            while True:
+                wait = self.paused_until - self.clock()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait()
+
+    def release(self, status, headers=None, elapsed=0.0):
+        """
+        Report the result of a request and free its slot
+
+        Args:
+            status: HTTP status code (None on connection errors)
+            headers: Response headers (mapping with case-insensitive get, or dict)
+            elapsed: Request duration in seconds
+        """
+        now = self.clock()
+        retry_after = _retry_after(headers)
+        reset = _rate_limit_reset(headers)
+        remaining = _header_int(headers, 'RateLimit-Remaining')
+
+        with self._cond:
+            self.in_flight -= 1
+            if remaining is not None:
+                self.remaining = remaining
+
+            if status in BACKOFF_STATUS:
+                self._failures += 1
+                self.limit = max(float(self.minimum), self.limit / 2)
+                pause = retry_after if retry_after is not None else reset
+                if pause is None:
+                    pause = min(self.backoff * 2 ** (self._failures - 1), self.max_backoff)
+                self.paused_until = max(self.paused_until, now + min(pause, self.max_backoff))
+            elif status is not None and status < 400:
+                self._failures = 0
+                if remaining is not None and remaining <= self.in_flight:
+                    # Quota almost exhausted: wait for the window to reset
+                    if reset is not None:
+                        self.paused_until = max(self.paused_until, now + min(reset, self.max_backoff))
+                    self.limit = max(float(self.minimum), min(self.limit, remaining or self.minimum))
+                elif elapsed <= self.target_latency:
+                    self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+                else:
+                    self.limit = max(float(self.minimum), self.limit - 0.5)
+
+            self._cond.notify_all()
+
+    def should_retry(self, status, attempt, max_retries):
+        """
+        Whether a failed request should be sent again
+
+        Args:
+            status: HTTP status code of the failed attempt
+            attempt: Number of attempts already made (1 = first try)
+            max_retries: Maximum number of retries
+        """
+        return status in BACKOFF_STATUS and attempt <= max_retries
+
+
+def _header(headers, name):
+    if not headers:
+        return None
+    value = headers.get(name)
+    if value is None and isinstance(headers, dict):
+        for key, val in headers.items():
+            if key.lower() == name.lower():
+                return val
+    return value
+
+
+def _header_int(headers, name):
+    value = _header(headers, name)
+    if value is None:
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+
+def _retry_after(headers):
+    """
+    Retry-After in seconds (HTTP dates are not used by the backend and are ignored)
+    """
+    value = _header(headers, 'Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _rate_limit_reset(headers):
+    """
+    Seconds until the rate limit window resets
+
+    Supports the draft-6 'RateLimit-Reset' header and the draft-7 combined
+    'RateLimit: limit=100, remaining=0, reset=30' header.
+    """
+    reset = _header_int(headers, 'RateLimit-Reset')
+    if reset is not None:
+        return float(reset)
+    combined = _header(headers, 'RateLimit')
+    if combined:
+        for part in str(combined).split(','):
+            key, _, value = part.strip().partition('=')
+            if key == 'reset':
+                try:
+                    return float(value)
+                except ValueError:
+                    return None
+    return None
@@ -0,0 +1,256 @@
+"""
+ESC/POS Wire-Size Profiler
+Virtual printer and byte/transmit-time breakdown of receipt jobs, without hardware
+
+VirtualPrinter captures the exact byte stream a receipt job would send (it is
+also available to receipts.py as printer_conn "virtual"). profile_receipt()
+splits a receipt into sections (image, text, QR, style, cut) and estimates
+how long it takes to send at a serial baud rate. compare_variants() runs the
+same receipts with other logo modes and with the native QR command instead
+of a QR image, to tune layouts for throughput.
+
+Transmit time only covers the serial line (start + data + parity + stop bits
+per byte); paper feed and print head time are not included.
+
+Usage:
+    python receipt_profile.py --layout cob --baud 9600 --logo logo.bmp
+    python receipt_profile.py --layout cob --records recibos.json --compare
+    python receipt_profile.py --layout adm --dump recibo_adm.bin
+"""
+
+import argparse
+import collections
+import json
+import sys
+import time
+
+import logo_cache
+import receipts
+from escpos.printer import Dummy
+
+SECTIONS = ("setup", "style", "image", "text", "qr", "cut")
+
+SAMPLE_RECORD = {
+    "cuota_mesanio": "Marzo 2024",
+    "cuota_value": "1500",
+    "soc_id": "12345",
+    "soc_apenom": "Pérez Fernández, Juan Martín",
+    "soc_type": "Activo",
+    "soc_addr": "Av. Colón 31",
+    "cuota_id": "662464",
+    "cob_name": "Cobrador 1",
+}
+
+
+class VirtualPrinter(Dummy):
+    """
+    Offline ESC/POS printer that keeps every write
+
+    With realtime=True each write takes as long as it would on a serial line
+    at the given baud rate, so batch and dispatcher timings can be tried on
+    Linux without hardware.
+    """
+
+    def __init__(self, baudrate=9600, bits_per_byte=10, realtime=False, dump_path=None,
+                 profile=None, sleep=time.sleep):
+        """
+        Initialize virtual printer
+
+        Args:
+            baudrate: Simulated serial speed (bits per second)
+            bits_per_byte: Bits on the wire per byte (8N1 = 10)
+            realtime: Sleep for the simulated transmit time of each write
+            dump_path: File the byte stream is appended to on close()
+            profile: python-escpos profile (name or object)
+            sleep: Sleep function (replaceable for tests)
+        """
+        if profile is None or isinstance(profile, str):
+            Dummy.__init__(self, profile=profile)
+        else:
+            Dummy.__init__(self)
+            self.profile = profile
+        self.baudrate = baudrate
+        self.bits_per_byte = bits_per_byte
+        self.realtime = realtime
+        self.dump_path = dump_path
+        self.sleep = sleep
+        self.writes = []
+
+    def _raw(self, msg):
+        Dummy._raw(self, msg)
+        self.writes.append(len(msg))
+        if self.realtime:
+            self.sleep(transmit_time(len(msg), self.baudrate, self.bits_per_byte))
+
+    def transmit_time(self):
+        """
+        Simulated seconds needed to send everything written so far
+        """
+        return transmit_time(len(self.output), self.baudrate, self.bits_per_byte)
+
+    def close(self):
+        if self.dump_path and self.output:
+            with open(self.dump_path, "ab") as f:
+                f.write(self.output)
+            self.clear()
+
+
+def serial_bits(config):
+    """
+    Bits on the wire per byte for a serial configuration (start bit included)
+    """
+    parity = 0 if str(config.get("comm_par", "N")).upper() == "N" else 1
+    return 1 + int(config.get("comm_bsz", 8)) + parity + int(config.get("comm_stop", 1))
+
+
+def transmit_time(size, baudrate, bits_per_byte=10):
+    """
+    Seconds needed to send size bytes over a serial line
+    """
+    return size * bits_per_byte / float(baudrate)
+
+
+def profile_receipts(layout, records, profile=None, logo_mode="cached", logos=None):
+    """
+    Byte breakdown of a receipt batch sent through one printer session
+
+    Args:
+        layout: Receipt layout (receipts.RECIBO_ADM, receipts.RECIBO_COB, ...)
+        records: Receipt records (dicts with the layout #fields)
+        profile: python-escpos profile (object or name) of the target printer
+        logo_mode: 'image', 'cached' or 'nv'
+        logos: logo_cache.LogoCache for 'cached' mode
+
+    Returns:
+        dict: 'sections' ({section: bytes}, 'setup' = code page and NV logo
+              upload sent once per session), 'total' bytes, 'receipts' count,
+              'render_time' (seconds spent building the bytes) and 'data'
+              (the byte stream)
+    """
+    started = time.perf_counter()
+    template = receipts.compile_layout(layout, profile, logo_mode, logos)
+    sections = collections.OrderedDict((name, 0) for name in SECTIONS)
+    setup = template.prefix
+    if template.nv_logo:
+        setup = logo_cache.nv_define_bytes([template.nv_logo]) + setup
+    sections["setup"] = len(setup)
+    chunks = [setup]
+    count = 0
+    for record in records:
+        for kind, data in template.render_sections(record):
+            sections[kind] += len(data)
+            chunks.append(data)
+        count += 1
+    data = b"".join(chunks)
+    return {
+        "sections": sections,
+        "total": len(data),
+        "receipts": count,
+        "render_time": time.perf_counter() - started,
+        "data": data,
+    }
+
+
+def profile_receipt(layout, record, profile=None, logo_mode="cached", logos=None):
+    """
+    Byte breakdown of a single receipt (see profile_receipts())
+    """
+    return profile_receipts(layout, [record], profile, logo_mode, logos)
+
+
+def with_native_qr(layout):
+    """
+    Copy of a layout that prints its QR codes with the printer's QR command
+    instead of a raster image
+    """
+    items = [dict(item, native=True) if "qr" in item else item for item in layout["items"]]
+    return dict(layout, items=items)
+
+
+def without_images(layout):
+    """
+    Copy of a layout without logo images
+    """
+    return dict(layout, items=[item for item in layout["items"] if "image" not in item])
+
+
+def compare_variants(layout, records, profile=None, logos=None):
+    """
+    Profile the layout with each logo mode, a native QR code and no logo
+
+    Returns:
+        list: (variant name, profile_receipts() result) pairs
+    """
+    variants = [
+        ("logo image", layout, "image"),
+        ("logo cached", layout, "cached"),
+        ("logo nv", layout, "nv"),
+        ("no logo", without_images(layout), "cached"),
+    ]
+    if any("qr" in item for item in layout["items"]):
+        variants.append(("native qr + logo nv", with_native_qr(layout), "nv"))
+    return [(name, profile_receipts(variant, records, profile, mode, logos))
+            for name, variant, mode in variants]
+
+
+def print_report(results, baudrate, bits_per_byte=10, out=sys.stdout):
+    """
+    Print a bytes / transmit time table for profile results
+    """
+    header = f"{'Variante':<22}{'Bytes':>9}" + "".join(f"{s:>8}" for s in SECTIONS)
+    header += f"{'Envío':>10}{'Por rec.':>10}{'CPU ms':>9}"
+    print(f"{baudrate} bps, {bits_per_byte} bits/byte", file=out)
+    print(header, file=out)
+    for name, result in results:
+        seconds = transmit_time(result["total"], baudrate, bits_per_byte)
+        per_receipt = transmit_time(result["total"] - result["sections"]["setup"],
+                                    baudrate, bits_per_byte) / max(result["receipts"], 1)
+        line = f"{name:<22}{result['total']:>9}"
+        line += "".join(f"{result['sections'][s]:>8}" for s in SECTIONS)
+        line += f"{seconds:>9.2f}s{per_receipt:>9.2f}s{result['render_time'] * 1000:>9.1f}"
+        print(line, file=out)
+
+
+def _use_logo(layout, path):
+    items = [dict(item, image=path) if "image" in item else item for item in layout["items"]]
+    return dict(layout, items=items)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tamaño en bytes y tiempo de envío de recibos ESC/POS")
+    parser.add_argument("--layout", choices=("adm", "cob"), default="cob", help="Tipo de recibo")
+    parser.add_argument("--records", help="Archivo JSON con la lista de recibos (por defecto, uno de ejemplo)")
+    parser.add_argument("--baud", type=int, help="Velocidad del puerto serie (por defecto, env.py)")
+    parser.add_argument("--logo", help="Imagen del logo (por defecto, logo.bmp)")
+    parser.add_argument("--logo-mode", choices=("image", "cached", "nv"), default=None)
+    parser.add_argument("--compare", action="store_true", help="Comparar modos de logo y QR nativo")
+    parser.add_argument("--dump", help="Guardar el flujo de bytes en un archivo")
+    args = parser.parse_args(argv)
+
+    config = receipts.default_config()
+    baudrate = args.baud or int(config["comm_bps"])
+    bits = serial_bits(config)
+    layout = receipts.RECIBO_ADM if args.layout == "adm" else receipts.RECIBO_COB
+    if args.logo:
+        layout = _use_logo(layout, args.logo)
+    records = [SAMPLE_RECORD]
+    if args.records:
+        with open(args.records, "r", encoding="utf-8") as f:
+            records = json.load(f)
+
+    profile = config["profile"]
+    if args.compare:
+        results = compare_variants(layout, records, profile)
+    else:
+        mode = args.logo_mode or config["logo_mode"]
+        results = [(f"logo {mode}", profile_receipts(layout, records, profile, mode))]
+    print_report(results, baudrate, bits)
+
+    if args.dump:
+        with open(args.dump, "wb") as f:
+            f.write(results[0][1]["data"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
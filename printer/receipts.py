@@ -0,0 +1,466 @@
+"""
+ESC/POS Receipt Engine
+Prints batches of receipts through one persistent printer session
+
+Receipt layouts are lists of print operations (like the cell layouts in
+tirada_cell_data.py). Text may contain #field placeholders that are filled
+from each receipt record:
+
+    {"style": {...}}                     p.set(...) (align, font, bold, width, height)
+    {"image": "logo.bmp"}                p.image(path)
+    {"text": "Cuota: #cuota_mesanio\\n"}  p.text(...), "limit" truncates fields
+    {"qr": "#cuota_id", "size": 3}       p.qr(...)
+
+Layouts are compiled once per session (compile_layout) into pre-encoded
+ESC/POS bytes; only the #fields are encoded per receipt, and each receipt is
+sent to the printer in a single write.
+
+The logo is sent according to logo_mode (env.ESCPOS_LOGO_MODE):
+    'image'   p.image() for every receipt (original behaviour)
+    'cached'  raster bytes prepared once per printer profile (logo_cache.py)
+    'nv'      uploaded once to the printer NV memory and printed by reference
+
+Usage:
+    with ReceiptPrinter({"printer_conn": "network", "printer_host": "192.168.1.100"}) as printer:
+        printer.print_batch(RECIBO_COB, records)
+"""
+
+import codecs
+import re
+
+import env
+import logo_cache
+
+# python-escpos (~0.3-0.5 s to import: printer capabilities database) is
+# imported on first use, in open_printer() and compile_layout()
+
+HEADER = [
+    {"style": {"align": "center", "font": "a", "bold": True, "width": 1, "height": 1}},
+    {"image": "logo.bmp"},
+    {"text": "ASOCIACIÓN BERNARDINO RIVADAVIA\n"},
+    {"text": "BIBLIOTECA POPULAR\n"},
+    {"style": {"align": "center", "font": "a", "bold": False, "width": 1, "height": 1}},
+    {"text": "rivadaviabiblioteca.adm@gmail.com\n"},
+    {"style": {"align": "center", "font": "b", "bold": False, "width": 1, "height": 1}},
+    {"text": "Av. Colón 31 - Bahía Blanca\n"},
+]
+
+FOOTER = [
+    {"style": {"align": "center", "font": "b", "bold": True, "width": 1, "height": 1}},
+    {"text": "C.U.I.T: 30-52895478-9 - ING. BRUTOS: EXENTO - I.V.A.: EXENTO\n"},
+]
+
+# Recibo de cuota (recibo_adm.py)
+RECIBO_ADM = {
+    "charcode": "CP860",
+    "items": HEADER + [
+        {"style": {"align": "center", "font": "a", "bold": True, "width": 1, "height": 2}},
+        {"text": "Recibo de cuota\n"},
+        {"style": {"align": "left", "font": "a", "bold": False, "width": 2, "height": 1}},
+        {"text": "Cuota: #cuota_mesanio\n"},
+        {"text": "Importe: $ #cuota_value\n"},
+        {"style": {"align": "left", "font": "b", "bold": True, "width": 2, "height": 2}},
+        {"text": "Código: #soc_id\n"},
+        {"text": "Nombre: #soc_apenom\n", "limit": {"soc_apenom": 24}},
+        {"style": {"align": "left", "font": "a", "bold": False, "width": 1, "height": 1}},
+        {"text": "Categoria: #soc_type\n"},
+        {"text": "Rec. Nro.: #cuota_id\n"},
+        {"style": {"align": "left", "font": "a", "bold": False, "width": 1, "height": 1}},
+        {"text": "Cobrador: #cob_name\n"},
+    ] + FOOTER
+}
+
+# Rendición de cuota (recibo_cob.py)
+RECIBO_COB = {
+    "charcode": "CP860",
+    "items": HEADER + [
+        {"style": {"align": "center", "font": "a", "bold": True, "width": 1, "height": 2}},
+        {"text": "Rendición de cuota\n"},
+        {"style": {"align": "left", "font": "a", "bold": False, "width": 2, "height": 1}},
+        {"text": "Cuota: #cuota_mesanio\n"},
+        {"style": {"align": "left", "font": "b", "bold": True, "width": 2, "height": 2}},
+        {"text": "Código: #soc_id\n"},
+        {"text": "Categoria: #soc_type\n"},
+        {"text": "Nombre: #soc_apenom\n", "limit": {"soc_apenom": 24}},
+        {"text": "Rec. Nro.: #cuota_id\n"},
+        {"style": {"align": "left", "font": "a", "bold": False, "width": 1, "height": 1}},
+        {"text": "Dirección: #soc_addr\n"},
+        {"text": "Importe: $ #cuota_value\n"},
+        {"text": "Cobrador: #cob_name\n"},
+    ] + FOOTER + [
+        {"qr": "#cuota_id", "size": 3},
+    ]
+}
+
+
+LOGOS = logo_cache.LogoCache()
+
+FIELD_RE = re.compile(r"#([A-Za-z_][A-Za-z0-9_]*)")
+
+
+def default_config():
+    """
+    Printer connection settings from env.py (same keys as the recibo_*.py fields)
+    """
+    return {
+        "printer_conn": "network" if getattr(env, "ESCPOS_NETWORK_HOST", None) else "serial",
+        "printer_host": getattr(env, "ESCPOS_NETWORK_HOST", None),
+        "printer_port": getattr(env, "ESCPOS_NETWORK_PORT", 9100),
+        "comm_name": getattr(env, "ESCPOS_SERIAL_PORT", "COM1"),
+        "comm_bps": getattr(env, "ESCPOS_SERIAL_BAUDRATE", 9600),
+        "comm_bsz": getattr(env, "ESCPOS_SERIAL_BYTESIZE", 8),
+        "comm_stop": getattr(env, "ESCPOS_SERIAL_STOPBITS", 1),
+        "comm_par": getattr(env, "ESCPOS_SERIAL_PARITY", "N"),
+        "profile": getattr(env, "ESCPOS_PROFILE", None),
+        "logo_mode": getattr(env, "ESCPOS_LOGO_MODE", "cached"),
+        "virtual_dump": getattr(env, "ESCPOS_VIRTUAL_DUMP", None),
+    }
+
+
+def open_printer(config):
+    """
+    Open a Network, Serial or virtual ESC/POS printer
+
+    printer_conn "virtual" is an offline printer (receipt_profile.VirtualPrinter)
+    that takes as long as a serial line at comm_bps and appends the bytes to
+    virtual_dump, if set.
+
+    Args:
+        config: Connection settings (see default_config())
+
+    Returns:
+        escpos printer instance
+    """
+    extra = {"profile": config["profile"]} if config.get("profile") else {}
+    from escpos.printer import Network, Serial
+    if config["printer_conn"] == "virtual":
+        import receipt_profile
+        return receipt_profile.VirtualPrinter(baudrate=int(config["comm_bps"]),
+                                              bits_per_byte=receipt_profile.serial_bits(config),
+                                              realtime=True, dump_path=config.get("virtual_dump"),
+                                              **extra)
+    if config["printer_conn"] == "network":
+        return Network(config["printer_host"], port=int(config["printer_port"]), **extra)
+    return Serial(devfile=config["comm_name"], baudrate=int(config["comm_bps"]),
+                  bytesize=int(config["comm_bsz"]), timeout=2,
+                  stopbits=int(config["comm_stop"]), parity=config["comm_par"], **extra)
+
+
+def printer_id(config):
+    """
+    Identifier of a physical printer (used to track NV logo uploads)
+    """
+    if config["printer_conn"] == "network":
+        return f"network:{config['printer_host']}:{config['printer_port']}"
+    if config["printer_conn"] == "virtual":
+        return f"virtual:{config.get('virtual_dump') or config['comm_name']}"
+    return f"serial:{config['comm_name']}"
+
+
+def style_args(style):
+    """
+    Convert a layout style into python-escpos set() arguments
+
+    Every style sets size, bold, font and alignment explicitly, so a receipt
+    never inherits the text mode left by the previous one.
+    """
+    return {
+        "align": style.get("align", "left"),
+        "font": style.get("font", "a"),
+        "bold": style.get("bold", False),
+        "custom_size": True,
+        "width": style.get("width", 1),
+        "height": style.get("height", 1),
+    }
+
+
+class CompiledReceipt:
+    """
+    Receipt layout compiled to ESC/POS bytes
+
+    Static text, styles, logo and cut are encoded once; parts holds those
+    byte strings and the slots for the #fields, which are the only things
+    encoded when a receipt is printed. sections keeps the same parts before
+    merging, labelled 'style', 'image', 'text', 'qr' or 'cut' (for profiling).
+    """
+
+    def __init__(self, charcode, prefix, sections, profile, nv_logo=None):
+        self.charcode = charcode
+        self.prefix = prefix
+        self.sections = sections
+        self.parts = _merge_static([part for _, part in sections])
+        self.profile = profile
+        self.nv_logo = nv_logo
+        self.codec = _python_codec(charcode)
+        self._renderer = None
+
+    def render(self, record):
+        """
+        Build the bytes of one receipt
+
+        Args:
+            record: Receipt record (dict with the layout #fields; fields missing
+                    from the record are printed as the placeholder, like before)
+
+        Returns:
+            bytes: Command stream, ready for a single write
+        """
+        return b"".join(self._part_bytes(part, record) for part in self.parts)
+
+    def render_sections(self, record):
+        """
+        Bytes of one receipt split by section
+
+        Returns:
+            list: (section, bytes) pairs; joined, they equal render(record)
+        """
+        return [(kind, self._part_bytes(part, record)) for kind, part in self.sections]
+
+    def _part_bytes(self, part, record):
+        if isinstance(part, bytes):
+            return part
+        if part[0] == "field":
+            value = _field_value(record, part[1])
+            if part[2]:
+                value = value[0:part[2]]
+            return self.encode(value)
+        _, content, size, native = part
+        content = FIELD_RE.sub(lambda m: _field_value(record, m.group(1)), content)
+        return self._command(lambda d: d.qr(content, size=size, native=native))
+
+    def encode(self, text):
+        if self.codec:
+            return text.encode(self.codec, errors="replace")
+        return self._command(lambda d: d.text(text))
+
+    def _command(self, command):
+        """
+        Bytes of a python-escpos command, rendered with the code page already selected
+        """
+        if self._renderer is None:
+            self._renderer = _dummy_printer(self.profile)
+            if self.charcode:
+                self._renderer.charcode(code=self.charcode)
+        self._renderer.clear()
+        command(self._renderer)
+        return self._renderer.output
+
+
+def compile_layout(layout, profile=None, logo_mode="cached", logos=None):
+    """
+    Compile a receipt layout into a CompiledReceipt
+
+    Args:
+        layout: Receipt layout (RECIBO_ADM, RECIBO_COB, ...)
+        profile: python-escpos profile (object or name, e.g. env.ESCPOS_PROFILE)
+                 of the target printer
+        logo_mode: 'image', 'cached' or 'nv' (see module docstring)
+        logos: logo_cache.LogoCache used in 'cached' mode
+
+    Returns:
+        CompiledReceipt
+    """
+    logos = logos or LOGOS
+    d = _dummy_printer(profile)
+    charcode = layout.get("charcode")
+    prefix = _capture(d, lambda: d.charcode(code=charcode)) if charcode else b""
+    parts = []
+    nv_logo = None
+
+    for item in layout["items"]:
+        if "style" in item:
+            parts.append(("style", _capture(d, lambda: d.set(**style_args(item["style"])))))
+        elif "image" in item:
+            path = item["image"]
+            if logo_mode == "nv":
+                if nv_logo not in (None, path):
+                    raise ValueError("NV logo mode supports a single logo per layout")
+                nv_logo = path
+                parts.append(("image", logo_cache.nv_print_bytes(1)))
+            elif logo_mode == "cached":
+                parts.append(("image", logos.raster(path, d.profile)))
+            else:
+                parts.append(("image", _capture(d, lambda: d.image(path))))
+        elif "text" in item:
+            text = item["text"]
+            limits = item.get("limit") or {}
+            pos = 0
+            for match in FIELD_RE.finditer(text):
+                literal = text[pos:match.start()]
+                if literal:
+                    parts.append(("text", _capture(d, lambda: d.text(literal))))
+                parts.append(("text", ("field", match.group(1), limits.get(match.group(1)))))
+                pos = match.end()
+            if text[pos:]:
+                parts.append(("text", _capture(d, lambda: d.text(text[pos:]))))
+        elif "qr" in item:
+            parts.append(("qr", ("qr", item["qr"], item.get("size", 3), item.get("native", False))))
+    parts.append(("cut", _capture(d, d.cut)))
+    return CompiledReceipt(charcode, prefix, parts, d.profile, nv_logo)
+
+
+def _merge_static(parts):
+    """
+    Merge consecutive static byte parts
+    """
+    merged = []
+    for part in parts:
+        if isinstance(part, bytes) and merged and isinstance(merged[-1], bytes):
+            merged[-1] += part
+        else:
+            merged.append(part)
+    return merged
+
+
+def _dummy_printer(profile):
+    """
+    Offline printer that renders commands for a profile (object or name)
+    """
+    from escpos.printer import Dummy
+    if profile is None or isinstance(profile, str):
+        return Dummy(profile=profile)
+    d = Dummy()
+    d.profile = profile
+    return d
+
+
+def _capture(d, command):
+    """
+    Bytes a python-escpos command writes to a Dummy printer
+    """
+    start = len(d.output)
+    command()
+    return d.output[start:]
+
+
+def _python_codec(charcode):
+    if not charcode:
+        return None
+    try:
+        return codecs.lookup(charcode).name
+    except LookupError:
+        return None
+
+
+def _field_value(record, field):
+    if field not in record:
+        return "#" + field
+    value = record[field]
+    return "" if value is None else str(value)
+
+
+class ReceiptPrinter:
+    """
+    Persistent ESC/POS printer session
+
+    The connection is opened once, each layout is compiled once, and the code
+    page is sent only when it changes, so a batch of receipts goes out back
+    to back, one write per receipt, with a cut between each one.
+    """
+
+    def __init__(self, config=None, printer=None, logos=None, templates=None):
+        """
+        Initialize session
+
+        Args:
+            config: Connection settings (default: from env.py)
+            printer: Already opened escpos printer (e.g. escpos.printer.Dummy)
+            logos: logo_cache.LogoCache (default: shared cache in logo_cache/)
+            templates: (layout, CompiledReceipt) pairs already compiled for this
+                       printer's profile and logo_mode (see compile_layout())
+        """
+        self.config = dict(default_config(), **(config or {}))
+        self.printer = printer
+        self.charcode = None
+        self.logo_mode = self.config["logo_mode"]
+        self.logos = logos or LOGOS
+        self._compiled = {id(layout): (layout, template) for layout, template in templates or ()}
+
+    def open(self):
+        if self.printer is None:
+            self.printer = open_printer(self.config)
+            self.charcode = None
+        return self
+
+    def close(self):
+        if self.printer is not None:
+            try:
+                self.printer.close()
+            finally:
+                self.printer = None
+                self.charcode = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def print_receipt(self, layout, record):
+        """
+        Print one receipt followed by a cut, as a single write
+
+        If the connection was dropped (printer restarted, cable), the session
+        is reopened once and the receipt is sent again.
+        """
+        self.open()
+        template = self.compiled(layout)
+        data = template.render(record)
+        try:
+            self._send(template, data)
+        except OSError:
+            self.close()
+            self.open()
+            self._send(template, data)
+
+    def print_batch(self, layout, records):
+        """
+        Print several receipts on the open session
+
+        Returns:
+            int: Number of receipts printed
+        """
+        count = 0
+        for record in records:
+            self.print_receipt(layout, record)
+            count += 1
+        return count
+
+    def compiled(self, layout):
+        """
+        Compiled template of a layout for this session's printer profile
+        """
+        cached = self._compiled.get(id(layout))
+        if cached is None or cached[0] is not layout:
+            template = compile_layout(layout, self.printer.profile, self.logo_mode, self.logos)
+            cached = (layout, template)
+            self._compiled[id(layout)] = cached
+        return cached[1]
+
+    def _send(self, template, data):
+        p = self.printer
+        if template.nv_logo:
+            target = printer_id(self.config)
+            if not self.logos.nv_uploaded(target, template.nv_logo):
+                logo_cache.upload_nv_logo(p, template.nv_logo)
+                self.logos.mark_nv_uploaded(target, template.nv_logo)
+        if template.charcode and template.charcode != self.charcode:
+            data = template.prefix + data
+        p._raw(data)
+        self.charcode = template.charcode or self.charcode
+
+
+def print_receipts(layout, records, config=None):
+    """
+    Open a printer session, print all receipts and close it (convenience function)
+
+    Args:
+        layout: Receipt layout (RECIBO_ADM, RECIBO_COB, ...)
+        records: List of receipt records (dicts with the layout #fields)
+        config: Connection settings (default: from env.py)
+
+    Returns:
+        int: Number of receipts printed
+    """
+    with ReceiptPrinter(config) as printer:
+        return printer.print_batch(layout, records)
@@ -1,43 +1,28 @@
-import time
-from escpos.printer import Serial
-from escpos.printer import Network
+import print_agent
 
-if "{printer_conn.value}" == "network":
-    p =  Network("{printer_host.value}", port={printer_port.value})
-else:
-    p = Serial(devfile="{comm_name.value}", baudrate={comm_bps.value}, bytesize={comm_bsz.value}, timeout=2, stopbits={comm_stop.value}, parity='{comm_par.value}')
+# Rendicion de cuota: layout in receipts.RECIBO_COB
+# Sent to the print agent (print_agent.py); printed in-process if it is not running
+# The host app fills in the field placeholders: no other braces in this file
+config = dict(
+    printer_conn="{printer_conn.value}",
+    printer_host="{printer_host.value}",
+    printer_port="{printer_port.value}",
+    comm_name="{comm_name.value}",
+    comm_bps="{comm_bps.value}",
+    comm_bsz="{comm_bsz.value}",
+    comm_stop="{comm_stop.value}",
+    comm_par="{comm_par.value}",
+)
 
-p.charcode(code='PORTUGUESE')
-p.set(align='center', font='a', text_type='b',  width=1, height=1)
-p.image("logo.bmp")
-p.text("ASOCIACIN BERNARDINO RIVADAVIA\n")
-p.text("BIBLIOTECA POPULAR\n")
-p.set(align='center', font='a', text_type='normal',  width=1, height=1)
-p.text("rivadaviabiblioteca.adm@gmail.com\n")
-p.set(align='center', font='b', text_type='normal',  width=1, height=1)
-p.text("Av. Coln 31 - Baha Blanca\n")
-p.set(align='center', font='a', text_type='b',  width=1, height=2)
-p.text("Rendicin de cuota\n")
-p.set(align='left', font='a', text_type='normal',  width=2, height=1)
-p.text(f"Cuota: {cuota_mesanio.value}\n")
-p.set(align='left', font='b', text_type='b',  width=2, height=2)
-p.text(f"Cdigo: {soc_id.value}\n")
-p.text(f"Categoria: {soc_type.value}\n")
-nom = "{soc_apenom.value}"
-p.text(f"Nombre: "+nom[0:24]+"\n")
-p.text(f"Rec. Nro.: {cuota_id.value}\n");
-p.set(align='left', font='a', text_type='normal',  width=1, height=1)
-p.text(f"Direccin: {soc_addr.value}\n")
-p.text(f"Importe: $ {cuota_value.value}\n")
-p.text(f"Cobrador: {cob_name.value}\n")
-p.set(align='center', font='b', text_type='b',  width=1, height=1)
-p.text("C.U.I.T: 30-52895478-9 - ING. BRUTOS: EXENTO - I.V.A.: EXENTO\n")
-# set(align='left', font='a', bold=False, underline=0, width=1, height=1, density=9, 
-# invert=False, smooth=False, flip=False, double_width=False, double_height=False, 
-# custom_size=False)
+records = [dict(
+    cuota_mesanio="{cuota_mesanio.value}",
+    cuota_value="{cuota_value.value}",
+    soc_id="{soc_id.value}",
+    soc_apenom="{soc_apenom.value}",
+    soc_type="{soc_type.value}",
+    soc_addr="{soc_addr.value}",
+    cuota_id="{cuota_id.value}",
+    cob_name="{cob_name.value}",
+)]
 
-# p.set(align='center')
-p.qr("{cuota_id.value}", size=3)
-
-p.cut()
-p.close()
+print_agent.run_job("receipt", dict(layout="cob", config=config, records=records))
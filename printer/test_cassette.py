@@ -0,0 +1,87 @@
+"""
+Test that recorded cassettes keep no secrets
+Records a login through a fake server and checks the file written to disk
+"""
+
+import json
+import os
+import sys
+import tempfile
+import urllib.request
+
+import cassette
+
+SECRETS = ('api-key-123', 'secret-pass', 'csrf-456', 'access-789', 'refresh-012')
+
+
+class FakeServer:
+    """Inner transport that answers like /api/csrf-token and /api/auth/login"""
+
+    def open(self, request):
+        if request.full_url.endswith('/api/csrf-token'):
+            body = {'csrfToken': 'csrf-456'}
+        else:
+            body = {'accessToken': 'access-789', 'refreshToken': 'refresh-012',
+                    'user': {'id': 1, 'username': 'admin'}}
+        data = json.dumps(body).encode('utf-8')
+        return cassette.CassetteResponse(request.full_url, 200,
+                                         {'Content-Type': 'application/json',
+                                          'Content-Length': str(len(data)),
+                                          'Set-Cookie': 'session=abc'}, data)
+
+
+def record(path):
+    transport = cassette.RecordingTransport(path, inner=FakeServer())
+    transport.open(urllib.request.Request('http://server/api/csrf-token',
+                                          headers={'X-API-Key': 'api-key-123'}))
+    login = json.dumps({'username': 'admin', 'password': 'secret-pass'}).encode('utf-8')
+    response = transport.open(urllib.request.Request('http://server/api/auth/login', data=login,
+                                                     headers={'X-CSRF-Token': 'csrf-456'}, method='POST'))
+    return json.loads(response.read())
+
+
+def test_cassette_file_has_no_secrets():
+    """The cassette on disk has no API key, password or tokens"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'login.json')
+        live = record(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+
+    # La respuesta en vivo no se modifica, sólo lo que se guarda
+    assert live['accessToken'] == 'access-789'
+    for secret in SECRETS:
+        assert secret not in text, f"{secret} written to the cassette"
+    stored = json.loads(text)['interactions']
+    login = json.loads(stored[1]['response']['body']['text'])
+    assert login['accessToken'] == '***' and login['user']['username'] == 'admin'
+
+
+def test_replay_of_masked_cassette():
+    """A masked cassette still replays the login"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'login.json')
+        record(path)
+        replay = cassette.ReplayTransport(path)
+        login = json.dumps({'username': 'admin', 'password': 'secret-pass'}).encode('utf-8')
+        response = replay.open(urllib.request.Request('http://server/api/auth/login', data=login, method='POST'))
+        body = response.read()
+    assert json.loads(body)['accessToken'] == '***'
+    assert response.headers.get('Content-Length') is None
+
+
+def main():
+    failed = 0
+    for test in (test_cassette_file_has_no_secrets, test_replay_of_masked_cassette):
+        print(f"{test.__doc__}...", end=" ")
+        try:
+            test()
+            print("✅ OK")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
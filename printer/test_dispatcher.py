@@ -0,0 +1,121 @@
+"""
+Test the receipt dispatcher without printers
+Fake sessions stand in for receipts.ReceiptPrinter
+"""
+
+import sys
+import time
+
+import dispatcher
+
+
+class BrokenPrinter:
+    """Session that reconnects but drops the connection on every receipt"""
+
+    def __init__(self, config):
+        self.printer = None
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def print_receipt(self, layout, record):
+        raise OSError("connection reset")
+
+
+def test_receipt_fails_after_max_attempts():
+    """A receipt fails once every attempt hit a printer error"""
+    pool = [{"printer_host": "10.0.0.1"}, {"printer_host": "10.0.0.2"}]
+    d = dispatcher.ReceiptDispatcher(pool, health_interval=0.01, session_factory=BrokenPrinter,
+                                     max_attempts=3)
+    job = d.submit({}, {"cuota_id": 1})
+    error = None
+    try:
+        job.wait(5)
+    except Exception as e:
+        error = e
+    assert job.done(), "the receipt is still queued"
+    assert error is not None and "after 3 attempts" in str(error), error
+    assert job.attempts == 3, job.attempts
+    assert d.join(1), "the dispatcher still counts the receipt as pending"
+    d.close()
+
+
+class UnreachablePrinter(BrokenPrinter):
+    """Session whose printer never answers"""
+
+    def open(self):
+        raise OSError("printer unreachable")
+
+
+def test_close_does_not_wait_forever():
+    """close() with a timeout fails the receipts no printer can take"""
+    d = dispatcher.ReceiptDispatcher([{}], health_interval=0.01, session_factory=UnreachablePrinter)
+    job = d.submit({}, {"cuota_id": 1})
+    started = time.monotonic()
+    d.close(timeout=0.2)
+    assert time.monotonic() - started < 2, "close() kept waiting for the queued receipt"
+    error = None
+    try:
+        job.wait(0)
+    except Exception as e:
+        error = e
+    assert job.done() and "closed" in str(error), error
+
+
+def test_run_job_without_agent_or_printer():
+    """run_job() with no agent and no printer ends with an error"""
+    import print_agent
+    print_agent.JOB_TIMEOUT = 0.5
+    config = {"printer_conn": "network", "printer_host": "127.0.0.1", "printer_port": 9}
+    started = time.monotonic()
+    error = None
+    try:
+        # Puerto sin agente: imprime en este proceso
+        print_agent.run_job("receipt", {"layout": "cob", "config": config, "records": [{"cuota_id": 1}]}, port=9)
+    except Exception as e:
+        error = e
+    assert time.monotonic() - started < 5, "run_job() kept waiting for the printer"
+    assert error is not None and "Timed out" in str(error), error
+    assert not print_agent._dispatchers
+
+
+def test_warm_up_layouts_reach_the_sessions():
+    """The layouts compiled by warm_up() are the ones the receipt sessions use"""
+    import env
+    import print_agent
+    import receipts
+    saved = dict(vars(env))
+    env.ESCPOS_PROFILE = "TM-T88III"
+    env.ESCPOS_LOGO_MODE = "nv"
+    try:
+        print_agent.warm_up()
+        d = print_agent.get_dispatcher({"printer_conn": "network", "printer_host": "127.0.0.1", "printer_port": 9})
+        warm = dict((id(layout), template) for layout, template in
+                    print_agent._templates[("TM-T88III", "nv")])
+        for layout in (receipts.RECIBO_ADM, receipts.RECIBO_COB):
+            assert d.slots[0].session.compiled(layout) is warm[id(layout)], "layout compiled again"
+    finally:
+        vars(env).clear()
+        vars(env).update(saved)
+        print_agent.shutdown()
+
+
+def main():
+    failed = 0
+    for test in (test_receipt_fails_after_max_attempts, test_close_does_not_wait_forever,
+                 test_run_job_without_agent_or_printer, test_warm_up_layouts_reach_the_sessions):
+        print(f"{test.__doc__}...", end=" ")
+        try:
+            test()
+            print("✅ OK")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Test the print agent HTTP API and receipt printer settings
+Runs the agent on a free local port; no printer is contacted
+"""
+
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import print_agent
+
+
+def post(port, path, body, content_type):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=body.encode("utf-8"),
+                                     headers={"Content-Type": content_type}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_http_api_rejects_unsafe_requests():
+    """Non-JSON posts and printer settings outside the templates are refused"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), print_agent.AgentHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    receipt = {"layout": "cob", "records": [{"cuota_id": 1}]}
+    try:
+        # Lo que un formulario o fetch() sin preflight puede mandar desde una página
+        status, body = post(port, "/jobs/receipt", json.dumps(receipt), "text/plain")
+        assert status == 415, (status, body)
+        for config in ({"printer_conn": "virtual", "virtual_dump": "C:\\Windows\\win.ini"},
+                       {"printer_conn": "network", "profile": "TM-T88III"},
+                       {"logo_mode": "image"}):
+            status, body = post(port, "/jobs/receipt", json.dumps(dict(receipt, config=config)),
+                                "application/json")
+            assert status == 400, (config, status, body)
+        assert not print_agent._dispatchers
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_template_settings_accepted():
+    """Empty template fields fall back to env.py"""
+    config = print_agent.printer_config({"printer_conn": "serial", "printer_host": "", "comm_name": "COM3",
+                                         "comm_bps": "9600"})
+    assert config == {"printer_conn": "serial", "comm_name": "COM3", "comm_bps": "9600"}, config
+
+
+def test_idle_printers_are_closed():
+    """At most MAX_DISPATCHERS printers stay open"""
+    saved = print_agent.MAX_DISPATCHERS
+    print_agent.MAX_DISPATCHERS = 2
+    try:
+        first = print_agent.get_dispatcher({"printer_conn": "network", "printer_host": "127.0.0.1",
+                                            "printer_port": 9})
+        for port in (10, 11):
+            print_agent.get_dispatcher({"printer_conn": "network", "printer_host": "127.0.0.1",
+                                        "printer_port": port})
+        assert len(print_agent._dispatchers) == 2, list(print_agent._dispatchers)
+        assert first.closed and first not in print_agent._dispatchers.values()
+    finally:
+        print_agent.MAX_DISPATCHERS = saved
+        print_agent.shutdown()
+
+
+def main():
+    failed = 0
+    for test in (test_http_api_rejects_unsafe_requests, test_template_settings_accepted,
+                 test_idle_printers_are_closed):
+        print(f"{test.__doc__}...", end=" ")
+        try:
+            test()
+            print("✅ OK")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+Test receipt layout compilation without a printer
+Renders the receipts for python-escpos profiles given by name, as env.ESCPOS_PROFILE does
+"""
+
+import sys
+
+import receipts
+
+RECORD = {"cuota_mesanio": "03/2024", "cuota_value": "1500", "soc_id": "123", "soc_apenom": "Pérez, Juan",
+          "soc_type": "Activo", "soc_addr": "Calle 1", "cuota_id": "4567", "cob_name": "García"}
+
+
+def without_logo(layout):
+    return dict(layout, items=[item for item in layout["items"] if "image" not in item])
+
+
+def test_compile_with_profile_name():
+    """compile_layout() takes a profile name"""
+    for layout in (receipts.RECIBO_ADM, receipts.RECIBO_COB):
+        compiled = receipts.compile_layout(without_logo(layout), "TM-T88III")
+        assert compiled.profile.profile_data["name"] == "TM-T88III", compiled.profile.profile_data["name"]
+        assert b"4567" in compiled.render(RECORD)
+
+
+def test_profile_name_matches_profile_object():
+    """A profile name renders the same bytes as its profile object"""
+    from escpos.capabilities import get_profile
+    layout = without_logo(receipts.RECIBO_COB)
+    by_name = receipts.compile_layout(layout, "TM-T88III").render(RECORD)
+    by_object = receipts.compile_layout(layout, get_profile("TM-T88III")).render(RECORD)
+    assert by_name == by_object
+
+
+def test_profile_receipts_with_profile_name():
+    """receipt_profile takes the ESCPOS_PROFILE name"""
+    import receipt_profile
+    result = receipt_profile.profile_receipts(without_logo(receipts.RECIBO_COB), [RECORD], "TM-T88III")
+    assert result["receipts"] == 1 and result["total"] > 0
+
+
+def main():
+    failed = 0
+    for test in (test_compile_with_profile_name, test_profile_name_matches_profile_object,
+                 test_profile_receipts_with_profile_name):
+        print(f"{test.__doc__}...", end=" ")
+        try:
+            test()
+            print("✅ OK")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,14 +9,29 @@ import os
 # List of Python files to test
 files_to_test = [
     'api_client.py',
+    'cassette.py',
+    'ratecontrol.py',
     'test.py',
     'tirada.py',
     'tirada_cell_data.py',
+    'tirada_summary.py',
+    'tirada_imposition.py',
+    'tirada_export.py',
     'tiradas_interf.py',
+    'receipts.py',
+    'logo_cache.py',
+    'dispatcher.py',
+    'receipt_profile.py',
+    'print_agent.py',
+    'bench_import.py',
     'recibo_adm.py',
     'recibo_cob.py',
     'recibo_test.py',
     'test_printer.py',
+    'test_cassette.py',
+    'test_dispatcher.py',
+    'test_receipts.py',
+    'test_print_agent.py',
     'print_rulers.py',
     'env.py'
 ]
@@ -1,45 +1,57 @@
 # -*- coding: utf-8 -*-
 
-import win32print
-import win32ui
-import win32gui
-import win32con
 import env
-import urllib.request
-import json
-import ctypes as ct
-import tirada_cell_data
 import copy
-from PIL import Image, ImageWin, ImageFont
-
-user32 = ct.WinDLL("user32.dll")
-# Definición de los tipos de datos necesarios para la función DrawTextW
-HWND = ct.c_void_p
-HDC = ct.c_void_p
-LPWSTR = ct.c_char_p
-INT = ct.c_int
-RECT = ct.Structure
-
-class RECT(ct.Structure):
-    _fields_ = [
-        ("left", ct.c_long),
-        ("top", ct.c_long),
-        ("right", ct.c_long),
-        ("bottom", ct.c_long),
-    ]
-
-# Definición de la firma de la función DrawTextW
-DrawTextA = user32.DrawTextA
-DrawTextA.restype = INT
-DrawTextA.argtypes = [HDC, LPWSTR, INT, ct.POINTER(RECT), INT]
-
-                       
+import tirada_imposition
+
+# pywin32, user32.dll (ctypes) y PIL se cargan en el primer uso: importar este
+# módulo es inmediato y funciona fuera de Windows (ver bench_import.py)
+win32print = win32ui = win32gui = win32con = None
+ct = RECT = DrawTextA = None
+
+
+def load_win32():
+    global win32print, win32ui, win32gui, win32con
+    if win32con is None:
+        import win32print
+        import win32ui
+        import win32gui
+        import win32con
+
+
+def load_draw_text():
+    global ct, RECT, DrawTextA
+    if DrawTextA is not None:
+        return
+    import ctypes as ct
+
+    user32 = ct.WinDLL("user32.dll")
+    # Definición de los tipos de datos necesarios para la función DrawTextW
+    HDC = ct.c_void_p
+    LPWSTR = ct.c_char_p
+    INT = ct.c_int
+
+    class RECT(ct.Structure):
+        _fields_ = [
+            ("left", ct.c_long),
+            ("top", ct.c_long),
+            ("right", ct.c_long),
+            ("bottom", ct.c_long),
+        ]
+
+    # Definición de la firma de la función DrawTextW
+    DrawTextA = user32.DrawTextA
+    DrawTextA.restype = INT
+    DrawTextA.argtypes = [HDC, LPWSTR, INT, ct.POINTER(RECT), INT]
+
+
 
 def init_printer(printer):
     global dc, hDC, dpi_x, dpi_y, page_height, page_width, hprinter
     global page_offset_x, page_offset_y, cell_width, cell_height
     global adj_offset_x, adj_offset_y, adj_scale_x, adj_scale_y
     
+    load_win32()
     # Set paper properties
     hprinter = win32print.OpenPrinter(printer)
     devmode = win32print.GetPrinter(hprinter, 9)["pDevMode"]
@@ -111,6 +123,7 @@ def draw_text(text, font, size_mm, weight, align, x_mm, y_mm, width_mm, height_m
     x = to_points(x_mm) - page_offset_x
     y = to_points(y_mm) - page_offset_y
     #print('Printing: "', text, '" - x: ', x, ' - y: ', y, ' - width: ', width, ' - height: ', height)
+    load_draw_text()
     font_handle = win32ui.CreateFont({
         "name": font,
         "weight": weight,     # win32ui.FW_NORMAL o win32ui.FW_BOLD ,
@@ -128,6 +141,7 @@ def draw_image(imagename, x_mm, y_mm, width_mm, height_mm):
     height = to_points(height_mm)
     x = to_points(x_mm)-page_offset_x
     y = to_points(y_mm)-page_offset_y
+    from PIL import Image, ImageWin
     image = Image.open(imagename)
     dib = ImageWin.Dib(image)
     dib.draw(hDC.GetHandleOutput(), (x, y, x+width-1, y+height-1))
@@ -149,6 +163,7 @@ def print_cell(data, x_mm, y_mm, width_mm, height_mm):
 
 def get_printers_list():
     # Obtener información de todas las impresoras instaladas
+    load_win32()
     result = []
     printers = win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL)
     for i, impresora_info in enumerate(printers):
@@ -184,45 +199,23 @@ def print_lines():
         hDC.LineTo(cell_width*i-page_offset_x, page_height-page_offset_y)
 
 def print_matrix(data):
-    for i in range(4):
-        if len(data)>2*i:
-            if (data[2*i]["fee_code"] > 1):
-                print_cell(replace_fields(tirada_cell_data.cell_data_asoc, data[2*i]), 
-                            0, 
-                            to_mm(cell_height)*i, 
-                            to_mm(cell_width), 
-                            to_mm(cell_height)*(i+1))
-                print_cell(replace_fields(tirada_cell_data.cell_data_coll, data[2*i]), 
-                            to_mm(cell_width)*1, 
-                            to_mm(cell_height)*i, 
-                            to_mm(cell_width)*2, 
-                            to_mm(cell_height)*(i+1))
-        if len(data)>2*i+1:
-            if (data[2*i+1]["fee_code"] > 1):
-                print_cell(replace_fields(tirada_cell_data.cell_data_coll, data[2*i+1]), 
-                            to_mm(cell_width)*2, 
-                            to_mm(cell_height)*i, 
-                            to_mm(cell_width)*3, 
-                            to_mm(cell_height)*(i+1))
-                print_cell(replace_fields(tirada_cell_data.cell_data_asoc, data[2*i+1]), 
-                            to_mm(cell_width)*3, 
-                            to_mm(cell_height)*i, 
-                            to_mm(cell_width)*4, 
-                            to_mm(cell_height)*(i+1))
+    w = to_mm(cell_width)
+    h = to_mm(cell_height)
+    for layout, record, col, row in tirada_imposition.page_cells(data):
+        if record["fee_code"] > 1:
+            print_cell(replace_fields(layout, record), w*col, h*row, w*(col+1), h*(row+1))
 
 def load_fee_data(ccids):
-    url = APP_HOST+"/api/tirada/custom/"
-    empty = "/-1/-1/-1/-1/-1/-1/-1"
-    data = []
-    for ccid in ccids:
-        url_res = url+str(ccid)+empty
-        json_url = urllib.request.urlopen(url_res)
-        res = json.loads(json_url.read())
-        
-        if len(res)==1:
-            if "nombre" in res[0]:
-                data.append(res[0])
-    return tirada_cell_data.db_to_fields(data)                                  
+    # Una sola consulta bulk (en lotes) en lugar de un request por cada ID
+    import api_client
+    import tirada_cell_data
+    client = api_client.BiblioAPIClient(base_url=APP_HOST)
+    records = {}
+    for rec in client.get_tirada_bulk(ccids):
+        if "nombre" in rec:
+            records[rec["CC_ID"]] = rec
+    data = [records[int(ccid)] for ccid in ccids if int(ccid) in records]
+    return tirada_cell_data.iter_fields(data)
 
 def extract_fields(cell_data):
     result = []
@@ -256,26 +249,25 @@ def replace_fields(cell_data, json_data):
             obj['text'] = stri
     return result
 
-def print_fees(printer, serverip, lines, ccids):
+def print_fees(printer, serverip, lines, ccids, order=None, zone_break=False):
     global APP_HOST
     APP_HOST = "http://"+serverip+":3000"
     if printer:
         init_printer(printer)
         try:
-            fees = load_fee_data(ccids)
-            ind = 0
-            while True:
-                data=[]
-                for i in range(8):
-                    if len(fees)>ind+i:
-                        data.append(fees[ind+i])
+            # Sin los registros que no se imprimen (fee_code <= 1) y con las
+            # páginas completas; order='zone' agrupa la tirada por cobrador
+            stats = {}
+            pages = tirada_imposition.impose(load_fee_data(ccids), order,
+                                             zone_break=zone_break, stats=stats)
+            for number, data in enumerate(pages):
+                if number:
+                    new_page()
                 if lines:
                     print_lines()
                 print_matrix(data)
-                ind = ind + 8
-                if len(fees)<=ind:
-                    break
-                new_page()
+            print("Registros:", stats["records"], "- omitidos:", stats["skipped"],
+                  "- páginas:", stats["pages"])
         finally:
             close_printer()
 
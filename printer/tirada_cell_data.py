@@ -302,24 +302,80 @@ month = [ "",
           "Noviembre",
           "Diciembre"]
 
+class FeeRecord:
+    """
+    Registro de cuota para la tirada (compacto, con __slots__)
+
+    Los campos se leen como atributos (rec.member_name) o como en un dict
+    (rec["member_name"], "member_name" in rec), para que replace_fields y
+    print_matrix funcionen igual que con el dict de json_convert.
+    fee_month se arma recién cuando se lo pide y queda cacheado.
+    """
+    __slots__ = ("fee_code", "fee_value", "zone", "member_code", "member_name",
+                 "member_address", "member_type", "fee_mes", "fee_anio", "_fee_month")
+
+    FIELDS = ("fee_code", "fee_month", "fee_value", "zone", "member_code",
+              "member_name", "member_address", "member_type")
+
+    def __init__(self, fee_code, fee_mes, fee_anio, fee_value, zone, member_code,
+                 member_name, member_address, member_type):
+        self.fee_code = fee_code
+        self.fee_mes = fee_mes
+        self.fee_anio = fee_anio
+        self.fee_value = fee_value
+        self.zone = zone
+        self.member_code = member_code
+        self.member_name = member_name
+        self.member_address = member_address
+        self.member_type = member_type
+        self._fee_month = None
+
+    @classmethod
+    def from_db(cls, json_db):
+        return cls(0 if json_db["So_ID"] == 1 else json_db["CC_ID"],
+                   json_db["CC_Mes"],
+                   json_db["CC_Anio"],
+                   json_db["CC_Valor"],
+                   json_db["Co_ID"],
+                   json_db["So_ID"],
+                   json_db["nombre"],
+                   json_db["So_DomCob"],
+                   json_db["Gr_Titulo"])
+
+    @property
+    def fee_month(self):
+        if self._fee_month is None:
+            self._fee_month = month[self.fee_mes]+" "+str(self.fee_anio)
+        return self._fee_month
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def __repr__(self):
+        return "FeeRecord(%s)" % ", ".join("%s=%r" % (k, getattr(self, k)) for k in self.FIELDS)
+
+
 def json_convert(json_db):
-    result = {}
-    if (json_db["So_ID"] == 1):
-        result["fee_code"] = 0
-    else:
-        result["fee_code"] = json_db["CC_ID"]
-    result["fee_month"] = month[json_db["CC_Mes"]]+" "+str(json_db["CC_Anio"])
-    result["fee_value"] = json_db["CC_Valor"]
-    result["zone"] = json_db["Co_ID"]
-    result["member_code"] = json_db["So_ID"]
-    result["member_name"] = json_db["nombre"]
-    result["member_address"] = json_db["So_DomCob"]
-    result["member_type"] = json_db["Gr_Titulo"]
-    return result
+    return FeeRecord.from_db(json_db)
 
-def db_to_fields(data):
-    result = []
+def iter_fields(data):
+    # Versión generador de db_to_fields: convierte un registro por vez
     for obj in data:
-        result.append(json_convert(obj))
-    return result
+        yield FeeRecord.from_db(obj)
 
+def db_to_fields(data):
+    return list(iter_fields(data))
@@ -0,0 +1,315 @@
+"""
+Tirada Export
+Renders a whole tirada to a PDF file and/or a directory of PNG images, in parallel
+
+Pages are imposed as for printing (tirada_imposition.impose) and drawn with
+PIL from the same cell layouts (tirada_cell_data) and positions (page_cells)
+that tirada.print_matrix() sends to the Windows printer. A process pool
+renders and compresses the pages; the parent only writes the results, in
+page order, so the export scales with the number of cores.
+
+The PDF is written incrementally (one grayscale image per A4 page), so
+memory stays flat for 1,000+ page tiradas.
+
+Usage:
+    python tirada_export.py --start 661902 --end 671902 --pdf tirada.pdf
+    python tirada_export.py --ids ids.txt --order zone --png tirada_png --dpi 200
+    python tirada_export.py --start 661902 --end 671902 --pdf tirada.pdf --png tirada_png
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+
+import tirada_imposition
+
+PAGE_WIDTH_MM = 210
+PAGE_HEIGHT_MM = 297
+# Same truncation as tirada.to_mm() on the printer page: 52 x 74 mm cells
+CELL_WIDTH_MM = PAGE_WIDTH_MM // 4
+CELL_HEIGHT_MM = PAGE_HEIGHT_MM // 4
+
+# Font files per layout font: (regular, bold)
+FONT_FILES = {
+    "Calibri": ("calibri.ttf", "calibrib.ttf"),
+    "Free 3 of 9 Extended": ("FRE3OF9X.TTF", "FRE3OF9X.TTF"),
+}
+FALLBACK_FONTS = ("DejaVuSans.ttf", "DejaVuSans-Bold.ttf")
+FONT_DIRS = [
+    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"),
+    os.path.dirname(os.path.abspath(__file__)),
+    "/usr/share/fonts/truetype/dejavu",
+]
+
+# Per-process caches (each pool worker loads fonts, images and the static
+# part of each cell layout once)
+_fonts = {}
+_images = {}
+_static_cells = {}
+
+
+def mm_to_px(mm, dpi):
+    return int(round(mm * dpi / 25.4))
+
+
+def load_font(name, bold, size_px):
+    """
+    TrueType font for a layout font name, with a fallback when it is not installed
+    """
+    from PIL import ImageFont
+    key = (name, bold, size_px)
+    if key not in _fonts:
+        files = FONT_FILES.get(name, FALLBACK_FONTS)
+        candidates = [files[1 if bold else 0], FALLBACK_FONTS[1 if bold else 0]]
+        font = None
+        for filename in candidates:
+            for directory in [""] + FONT_DIRS:
+                try:
+                    font = ImageFont.truetype(os.path.join(directory, filename), size_px)
+                    break
+                except OSError:
+                    continue
+            if font is not None:
+                break
+        _fonts[key] = font or ImageFont.load_default()
+    return _fonts[key]
+
+
+def load_image(path, size):
+    from PIL import Image
+    key = (path, size)
+    if key not in _images:
+        with Image.open(path) as image:
+            _images[key] = image.convert("L").resize(size)
+    return _images[key]
+
+
+def wrap_text(draw, text, font, width):
+    """
+    Split text into lines that fit width (like DrawText with DT_WORDBREAK)
+    """
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = word if not line else line + " " + word
+            if line and draw.textlength(candidate, font=font) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def draw_cell(draw, page, cell, x_mm, y_mm, dpi):
+    """
+    Draw one filled cell layout (see tirada.print_cell) at x_mm, y_mm
+    """
+    for obj in cell:
+        window = obj["window"]
+        x = mm_to_px(x_mm + window["x_mm"], dpi)
+        y = mm_to_px(y_mm + window["y_mm"], dpi)
+        width = mm_to_px(window["width_mm"], dpi)
+        height = mm_to_px(window["height_mm"], dpi)
+        if "text" in obj:
+            font = load_font(obj["font"], obj["bold"], max(mm_to_px(obj["size_mm"], dpi), 1))
+            line_height = font.getbbox("Ág")[3] if hasattr(font, "getbbox") else font.getsize("Ág")[1]
+            for number, line in enumerate(wrap_text(draw, obj["text"], font, width)):
+                left = x
+                if obj["center"]:
+                    left = x + int((width - draw.textlength(line, font=font)) / 2)
+                draw.text((left, y + number * line_height), line, fill=0, font=font)
+        elif "image" in obj:
+            try:
+                page.paste(load_image(obj["image"], (width, height)), (x, y))
+            except OSError:
+                pass
+
+
+def static_cell(layout, dpi):
+    """
+    Ink mask of the parts of a cell layout without #fields (logo, headers)
+
+    Returns:
+        tuple: (mask image, layout objects that still have to be drawn per record)
+    """
+    from PIL import Image, ImageDraw, ImageOps
+    key = (id(layout), dpi)
+    if key not in _static_cells:
+        fixed = [obj for obj in layout if "#" not in obj.get("text", "")]
+        fields = [obj for obj in layout if "#" in obj.get("text", "")]
+        cell = Image.new("L", (mm_to_px(CELL_WIDTH_MM, dpi), mm_to_px(CELL_HEIGHT_MM, dpi)), 255)
+        draw_cell(ImageDraw.Draw(cell), cell, fixed, 0, 0, dpi)
+        _static_cells[key] = (ImageOps.invert(cell), fields)
+    return _static_cells[key]
+
+
+def render_page(data, dpi):
+    """
+    Render one page of records (list of record dicts) to a grayscale PIL image
+    """
+    from PIL import Image, ImageDraw
+    import tirada
+    page = Image.new("L", (mm_to_px(PAGE_WIDTH_MM, dpi), mm_to_px(PAGE_HEIGHT_MM, dpi)), 255)
+    draw = ImageDraw.Draw(page)
+    for layout, record, col, row in tirada_imposition.page_cells(data):
+        if record["fee_code"] > 1:
+            mask, fields = static_cell(layout, dpi)
+            page.paste(0, (mm_to_px(CELL_WIDTH_MM * col, dpi), mm_to_px(CELL_HEIGHT_MM * row, dpi)), mask)
+            draw_cell(draw, page, tirada.replace_fields(fields, record),
+                      CELL_WIDTH_MM * col, CELL_HEIGHT_MM * row, dpi)
+    return page
+
+
+def _png_path(directory, number):
+    return os.path.join(directory, f"pagina_{number + 1:05d}.png")
+
+
+def _render_pdf_page(task):
+    # También guarda el PNG si se pidieron las dos salidas
+    number, data, dpi, directory = task
+    page = render_page(data, dpi)
+    if directory:
+        page.save(_png_path(directory, number), optimize=False)
+    return number, page.size, zlib.compress(page.tobytes(), 6)
+
+
+def _render_png_page(task):
+    number, data, dpi, directory = task
+    path = _png_path(directory, number)
+    render_page(data, dpi).save(path, optimize=False)
+    return number, path
+
+
+class PdfWriter:
+    """
+    Minimal PDF writer: one full-page grayscale image per page, written as pages arrive
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.offsets = {}
+        self.pages = []
+        self._next = 3  # 1 = catalog, 2 = page tree (written at the end)
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.file.write(data)
+
+    def _object(self, number, body, stream=None):
+        self.offsets[number] = self.file.tell()
+        self._write(f"{number} 0 obj\n".encode("ascii") + body)
+        if stream is not None:
+            self._write(b"\nstream\n" + stream + b"\nendstream")
+        self._write(b"\nendobj\n")
+
+    def add_page(self, size, compressed, width_pt=595.28, height_pt=841.89):
+        """
+        Add a page from Flate-compressed 8-bit grayscale pixels
+        """
+        image, content, page = self._next, self._next + 1, self._next + 2
+        self._next += 3
+        self._object(image, (f"<< /Type /XObject /Subtype /Image /Width {size[0]} /Height {size[1]}"
+                             f" /ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode"
+                             f" /Length {len(compressed)} >>").encode("ascii"), compressed)
+        draw = f"q {width_pt} 0 0 {height_pt} 0 0 cm /Im0 Do Q".encode("ascii")
+        self._object(content, f"<< /Length {len(draw)} >>".encode("ascii"), draw)
+        self._object(page, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt} {height_pt}]"
+                            f" /Resources << /XObject << /Im0 {image} 0 R >> >>"
+                            f" /Contents {content} 0 R >>").encode("ascii"))
+        self.pages.append(page)
+
+    def close(self):
+        kids = " ".join(f"{page} 0 R" for page in self.pages)
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode("ascii"))
+        xref = self.file.tell()
+        lines = [f"xref\n0 {self._next}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, self._next)]
+        lines.append(f"trailer\n<< /Size {self._next} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+        self._write("".join(lines).encode("ascii"))
+        self.file.close()
+
+
+def export(pages, pdf_path=None, png_dir=None, dpi=150, workers=None):
+    """
+    Render pages in a process pool and write them in order
+
+    Args:
+        pages: Iterable of pages (lists of record dicts), e.g. from impose()
+        pdf_path: Output PDF file
+        png_dir: Output directory for one PNG per page (both outputs can be
+                 written from the same rendering)
+        dpi: Render resolution
+        workers: Processes (default: number of CPUs)
+
+    Returns:
+        int: Number of pages written
+    """
+    if not pdf_path and not png_dir:
+        raise ValueError("pdf_path or png_dir is required")
+    writer = PdfWriter(pdf_path) if pdf_path else None
+    if png_dir:
+        os.makedirs(png_dir, exist_ok=True)
+
+    def tasks():
+        for number, page in enumerate(pages):
+            data = [record.to_dict() if hasattr(record, "to_dict") else dict(record) for record in page]
+            yield number, data, dpi, png_dir
+
+    count = 0
+    worker = _render_pdf_page if writer is not None else _render_png_page
+    with multiprocessing.Pool(workers) as pool:
+        # imap keeps page order; chunks amortize the inter-process transfer
+        for result in pool.imap(worker, tasks(), chunksize=4):
+            if writer is not None:
+                writer.add_page(result[1], result[2])
+            count += 1
+    if writer is not None:
+        writer.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exportar la tirada a PDF y/o PNG en paralelo")
+    parser.add_argument("--start", type=int, help="CC_ID inicial")
+    parser.add_argument("--end", type=int, help="CC_ID final")
+    parser.add_argument("--ids", help="Archivo con un CC_ID por línea")
+    parser.add_argument("--order", choices=sorted(tirada_imposition.COLLATION), help="Orden de intercalado")
+    parser.add_argument("--zone-break", action="store_true", help="Nueva página en cada cambio de zona")
+    parser.add_argument("--pdf", help="Archivo PDF de salida")
+    parser.add_argument("--png", help="Directorio de salida (una imagen PNG por página)")
+    parser.add_argument("--dpi", type=int, default=150, help="Resolución")
+    parser.add_argument("--workers", type=int, help="Procesos (por defecto, uno por núcleo)")
+    args = parser.parse_args(argv)
+
+    if args.ids is None and (args.start is None or args.end is None):
+        parser.error("indicar --start y --end, o --ids")
+    if not args.pdf and not args.png:
+        parser.error("indicar --pdf o --png")
+
+    import api_client
+    import tirada_cell_data
+    import tirada_summary
+    client = api_client.BiblioAPIClient()
+    ids = None
+    if args.ids:
+        with open(args.ids) as f:
+            ids = [int(line) for line in f if line.strip()]
+    records = [rec for rec in tirada_summary.fetch_records(client, args.start, args.end, ids)
+               if "nombre" in rec]
+
+    started = time.perf_counter()
+    pages = tirada_imposition.impose(tirada_cell_data.iter_fields(records), args.order,
+                                     zone_break=args.zone_break)
+    count = export(pages, args.pdf, args.png, args.dpi, args.workers)
+    print(f"{count} páginas exportadas en {time.perf_counter() - started:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Tirada Page Imposition
+Filters unprintable fee records and packs the rest densely into 4x4 pages
+
+print_matrix() places 8 records per A4 page (4 rows x 2 records, each record
+a member cell plus a collector cell). Records with fee_code <= 1 (member 1,
+mapped to fee_code 0 by FeeRecord.from_db) are not printed, so they used to
+leave blank cell pairs; here they are dropped before the pages are built.
+
+Collation orders (stable, input order is kept within each group):
+    None      input order (streams the records, nothing is held in memory)
+    'zone'    by collector zone (Co_ID), so each collector gets a contiguous stack
+    'member'  by member code (So_ID)
+    'name'    by member name
+
+Usage:
+    python tirada_imposition.py --start 661902 --end 671902 --order zone
+"""
+
+import argparse
+import itertools
+import sys
+
+RECORDS_PER_PAGE = 8
+
+COLLATION = {
+    "zone": lambda rec: (rec["zone"] is None, rec["zone"] or 0),
+    "member": lambda rec: rec["member_code"] or 0,
+    "name": lambda rec: (rec["member_name"] or "").upper(),
+}
+
+
+def is_printable(record):
+    return record["fee_code"] > 1
+
+
+def impose(records, order=None, per_page=RECORDS_PER_PAGE, zone_break=False, stats=None):
+    """
+    Build the pages of a tirada
+
+    Args:
+        records: Fee records (FeeRecord or dicts, as yielded by tirada_cell_data.iter_fields)
+        order: Collation order (None, 'zone', 'member' or 'name')
+        per_page: Records per page
+        zone_break: Start a new page when the collector zone changes
+        stats: Optional dict, filled with 'records', 'skipped' and 'pages' as
+               the pages are consumed
+
+    Returns:
+        iterator: Pages, each a list of up to per_page printable records
+    """
+    if order is not None and order not in COLLATION:
+        raise ValueError(f"Unknown collation order: {order}")
+    if stats is None:
+        stats = {}
+    stats.update(records=0, skipped=0, pages=0)
+    return _pages(records, order, per_page, zone_break, stats)
+
+
+def _pages(records, order, per_page, zone_break, stats):
+    printable = _filter(records, stats)
+    if order is not None:
+        printable = sorted(printable, key=COLLATION[order])
+
+    if zone_break:
+        groups = (group for _, group in itertools.groupby(printable, key=lambda rec: rec["zone"]))
+    else:
+        groups = [printable]
+    for group in groups:
+        group = iter(group)
+        while True:
+            page = list(itertools.islice(group, per_page))
+            if not page:
+                break
+            stats["pages"] += 1
+            yield page
+
+
+def _filter(records, stats):
+    for record in records:
+        stats["records"] += 1
+        if is_printable(record):
+            yield record
+        else:
+            stats["skipped"] += 1
+
+
+def page_cells(data):
+    """
+    Cells of one page, as print_matrix() lays them out on the 4x4 grid
+
+    Row i holds record 2i (member cell, collector cell) and record 2i+1
+    (collector cell, member cell), so the two collector cells sit side by side.
+
+    Args:
+        data: Up to 8 records (one page from impose())
+
+    Returns:
+        list: (cell layout, record, column, row) tuples
+    """
+    import tirada_cell_data
+    asoc = tirada_cell_data.cell_data_asoc
+    coll = tirada_cell_data.cell_data_coll
+    cells = []
+    for i in range(4):
+        if len(data) > 2*i:
+            cells.append((asoc, data[2*i], 0, i))
+            cells.append((coll, data[2*i], 1, i))
+        if len(data) > 2*i+1:
+            cells.append((coll, data[2*i+1], 2, i))
+            cells.append((asoc, data[2*i+1], 3, i))
+    return cells
+
+
+def page_count(records, order=None, per_page=RECORDS_PER_PAGE, zone_break=False):
+    """
+    Pages needed with and without compaction
+
+    Returns:
+        tuple: (pages before, i.e. every record taking a slot; pages after; stats)
+    """
+    records = list(records)
+    stats = {}
+    for _ in impose(records, order, per_page, zone_break, stats):
+        pass
+    before = -(-len(records) // per_page)
+    return before, stats["pages"], stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Páginas de la tirada con y sin compactación")
+    parser.add_argument("--start", type=int, help="CC_ID inicial")
+    parser.add_argument("--end", type=int, help="CC_ID final")
+    parser.add_argument("--ids", help="Archivo con un CC_ID por línea")
+    parser.add_argument("--order", choices=sorted(COLLATION), help="Orden de intercalado")
+    parser.add_argument("--zone-break", action="store_true", help="Nueva página en cada cambio de zona")
+    args = parser.parse_args(argv)
+
+    if args.ids is None and (args.start is None or args.end is None):
+        parser.error("indicar --start y --end, o --ids")
+
+    import api_client
+    import tirada_cell_data
+    import tirada_summary
+    client = api_client.BiblioAPIClient()
+    ids = None
+    if args.ids:
+        with open(args.ids) as f:
+            ids = [int(line) for line in f if line.strip()]
+    records = tirada_summary.fetch_records(client, args.start, args.end, ids)
+
+    before, after, stats = page_count(tirada_cell_data.iter_fields(records), args.order,
+                                      zone_break=args.zone_break)
+    print(f"Registros: {stats['records']} - omitidos (fee_code <= 1): {stats['skipped']}")
+    print(f"Páginas: {before} sin compactar, {after} compactadas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
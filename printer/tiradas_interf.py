@@ -1,3 +1,10 @@
-import tirada
+import print_agent
 
-tirada.print_fees("{printer.value}", "{serverip.value}", {lines.value}, [{ccids.value}])
\ No newline at end of file
+# Sent to the print agent (print_agent.py); printed in-process if it is not running
+# The host app fills in the field placeholders: no other braces in this file
+print_agent.run_job("tirada", dict(
+    printer="{printer.value}",
+    serverip="{serverip.value}",
+    lines={lines.value},
+    ccids=[{ccids.value}],
+))
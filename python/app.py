@@ -1,12 +1,19 @@
-import bz2
 import pickle
+import json
 import mega
 import os
-import subprocess
+import shutil
 from datetime import datetime
 import operator
 import pprint
 
+import contextlib
+
+import backup_stream
+import compression
+import dedup
+import mega_upload
+
 SESSION_CACHE = 'mega_session.pickle'
 
 MEGA_USER = os.environ.get('MEGA_USER') # "gramoscelli@hotmail.com"
@@ -20,6 +27,14 @@ password = os.environ.get('MYSQL_PASSWORD')
 database = os.environ.get('MYSQL_DATABASE')
 accounting_database = os.environ.get('ACCOUNTING_DATABASE', 'accounting')
 
+# Directorio de trabajo local (modo por tablas) y copia local de los manifiestos e índices de cada backup
+backup_dir = os.environ.get('BACKUP_DIR', '/app/backup')
+manifests_dir = os.path.join(backup_dir, 'manifests')
+indexes_dir = os.path.join(backup_dir, 'indexes')
+
+# Carpeta de Mega (dentro de "backup") con los chunks de los backups deduplicados
+CHUNKS_FOLDER = 'chunks'
+
 print("Mega Credentials")
 print()
 print("User: ", MEGA_USER)
@@ -55,36 +70,193 @@ def get_mega_client():
     return mega_client
 
 
+def stream_backup(mega_client, set_folder, backup_name):
+    """
+    Backup completo en un solo dump, comprimido y subido por partes a medida que se genera
+    """
+    # Compresión en paralelo (BACKUP_CODEC, BACKUP_LEVEL, BACKUP_WORKERS)
+    compressor = compression.from_env()
+    bz2_name = f'{backup_name}.sql{compression.extension(compressor.codec)}'
+
+    def upload_part(number, data):
+        name = backup_stream.part_name(bz2_name, number)
+        print(f'Uploading {name} ({len(data)} bytes)')
+        mega_upload.upload_bytes(mega_client, data, set_folder, name)
+
+    backup_command = backup_stream.dump_command(host, port, user, [database, accounting_database])
+    print("Ejecutando: ", " ".join(backup_command))
+    print(f"Compresión {compressor.codec} nivel {compressor.level} con {compressor.workers} procesos")
+    with compressor:
+        stats = backup_stream.stream_backup(backup_command, upload_part, backup_stream.dump_env(password),
+                                            compressor)
+    print(f"Backup {bz2_name}: {stats['dump_bytes']} bytes de dump, {stats['compressed_bytes']} comprimidos "
+          f"en {stats['parts']} partes, {stats['seconds']:.0f} s")
+
+
+def table_backup(mega_client, set_folder, backup_name):
+    """
+    Backup por tablas: un archivo comprimido por tabla, volcadas en paralelo
+    desde una misma instantánea, y manifest.json
+
+    Incremental: las tablas sin cambios desde el último backup no se suben
+    de nuevo, el manifiesto apunta a su archivo en el backup anterior.
+
+    Una subida cortada se reanuda dentro de esta misma ejecución, sin repetir
+    las piezas ya enviadas (mega_upload.ATTEMPTS). Si aun así el backup falla,
+    se borra work_dir, con el estado <archivo>.upload.json de cada subida, y
+    la próxima ejecución hace un backup nuevo.
+    """
+    import table_dump
+
+    config = {'host': host, 'port': port, 'user': user, 'password': password}
+    codec = os.environ.get('BACKUP_CODEC', 'bz2')
+    level = os.environ.get('BACKUP_LEVEL')
+    work_dir = os.path.join(backup_dir, backup_name)
+
+    # Sólo se pueden referenciar archivos de backups que siguen en Mega
+    files = mega_client.get_files()
+    available = {file['a']['n'] for file in files.values()
+                 if file['t'] == 1 and file['p'] == files[set_folder]['p']}
+    manifests = table_dump.load_manifests(manifests_dir)
+    previous = next((manifest for name, manifest in reversed(manifests.items()) if name in available), None)
+    reuse = table_dump.reusable_tables(previous, codec, table_dump.FULL_DAYS, available)
+    if previous:
+        print(f"Backup anterior: {previous['set']} ({len(reuse)} tablas se pueden referenciar)")
+
+    def upload(entry):
+        path = os.path.join(work_dir, entry['file'])
+        print(f"Uploading {entry['file']} ({entry['bytes']} bytes)")
+        mega_upload.upload_file(mega_client, path, set_folder, entry['file'])
+        os.remove(path)
+
+    try:
+        manifest = table_dump.dump_tables(config, [database, accounting_database], work_dir, upload,
+                                          table_dump.WORKERS, codec, int(level) if level else None,
+                                          previous, reuse)
+        manifest_path = os.path.join(work_dir, table_dump.MANIFEST)
+        with open(manifest_path, 'rb') as f:
+            mega_upload.upload_bytes(mega_client, f.read(), set_folder, table_dump.MANIFEST)
+        table_dump.save_manifest(manifests_dir, manifest)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    new = [entry for entry in manifest['tables'] if entry['set'] == backup_name]
+    print(f"Backup {backup_name}: {len(manifest['tables'])} tablas, {len(new)} volcadas "
+          f"({sum(entry['bytes'] for entry in new)} bytes comprimidos) y "
+          f"{len(manifest['tables']) - len(new)} sin cambios, "
+          f"instantánea {'consistente' if manifest['consistent'] else 'NO consistente'}, "
+          f"{manifest['seconds']:.0f} s")
+
+
+def referenced_sets(files, kept):
+    """
+    Backups que tienen archivos de tablas usados por los backups dados
+    (según la copia local de sus manifiestos)
+
+    Devuelve None si falta la copia local del manifiesto de alguno de los
+    backups por tablas dados (p. ej. un contenedor nuevo sin BACKUP_DIR):
+    entonces no se sabe qué backups anteriores se pueden borrar.
+    """
+    import table_dump
+
+    manifests = table_dump.load_manifests(manifests_dir)
+    with_manifest = {file['p'] for file in files.values() if file['a']['n'] == table_dump.MANIFEST}
+    referenced = set()
+    for folder in kept:
+        name = folder['a']['n']
+        if name in manifests:
+            referenced |= table_dump.referenced_sets(manifests[name])
+        elif folder['h'] in with_manifest:
+            print(f"Falta el manifiesto local de {name}: no se borran backups anteriores")
+            return None
+    return referenced
+
+
+def find_folder(files, name, parent):
+    return next((file['h'] for file in files.values()
+                 if file['t'] == 1 and file['a']['n'] == name and file['p'] == parent), None)
+
+
+def dedup_backup(mega_client, set_folder, backup_name):
+    """
+    Backup deduplicado: el dump se corta en chunks por contenido y sólo se
+    suben los que no están en la carpeta de chunks; el backup es su índice
+    """
+    files = mega_client.get_files()
+    parent = files[set_folder]['p']
+    chunks_folder = find_folder(files, CHUNKS_FOLDER, parent)
+    if chunks_folder is None:
+        chunks_folder = mega_client.create_folder(CHUNKS_FOLDER, parent)[CHUNKS_FOLDER]
+    known = {file['a']['n'] for file in files.values() if file['p'] == chunks_folder}
+    print(f"{len(known)} chunks en Mega")
+
+    def upload_chunk(name, data):
+        print(f'Uploading {name} ({len(data)} bytes)')
+        mega_upload.upload_bytes(mega_client, data, chunks_folder, name)
+
+    level = os.environ.get('BACKUP_LEVEL')
+    workers = os.environ.get('BACKUP_WORKERS')
+    backup_command = backup_stream.dump_command(host, port, user, [database, accounting_database],
+                                                dedup.dump_options())
+    print("Ejecutando: ", " ".join(backup_command))
+    with contextlib.closing(backup_stream.read_dump(backup_command, backup_stream.dump_env(password))) as blocks:
+        index = dedup.dedup_backup(blocks, known, upload_chunk, os.environ.get('BACKUP_CODEC', 'bz2'),
+                                   int(level) if level else None, int(workers) if workers else None)
+    mega_upload.upload_bytes(mega_client, json.dumps(index).encode('utf-8'), set_folder, dedup.INDEX)
+    dedup.save_index(indexes_dir, backup_name, index)
+    print(f"Backup {backup_name}: {index['dump_bytes']} bytes de dump en {len(index['chunks'])} chunks, "
+          f"{index['new_chunks']} nuevos ({index['uploaded_bytes']} bytes subidos), {index['seconds']:.0f} s")
+
+
+def clean_chunks(mega_client, backup_folder):
+    """
+    Borrar de la carpeta de chunks los que ya no usa ningún backup
+
+    Sólo si se tiene la copia local del índice de todos los backups
+    deduplicados que quedan en Mega; si falta alguno no se borra nada.
+    """
+    files = mega_client.get_files()
+    chunks_folder = find_folder(files, CHUNKS_FOLDER, backup_folder)
+    if chunks_folder is None:
+        return
+    sets = {file['h']: file['a']['n'] for file in files.values()
+            if file['t'] == 1 and file['p'] == backup_folder and file['a']['n'].startswith('backup_')}
+    used = set()
+    for file in files.values():
+        if file['p'] in sets and file['a']['n'] == dedup.INDEX:
+            index = dedup.load_index(indexes_dir, sets[file['p']])
+            if index is None:
+                print(f"Falta el índice local de {sets[file['p']]}: no se borran chunks")
+                return
+            used |= dedup.index_chunks(index)
+    unused = [file['h'] for file in files.values() if file['p'] == chunks_folder and file['a']['n'] not in used]
+    for handle in unused:
+        mega_client.delete(handle)
+    print(f"{len(unused)} chunks sin usar borrados")
+
+
+BACKUPS = {
+    'stream': stream_backup,
+    'tables': table_backup,
+    'dedup': dedup_backup,
+}
+
+
 if __name__ == '__main__':
     mega_client = get_mega_client()
     print("Your current storage is:")
     print(mega_client.get_storage_space())
 
-    # Ruta de destino del archivo de backup
-    
+    # Modo de backup: 'stream' (un dump completo), 'tables' (un archivo por tabla) o 'dedup' (chunks)
+    mode = os.environ.get('BACKUP_MODE', 'stream')
+    if mode not in BACKUPS:
+        raise ValueError(f'BACKUP_MODE must be one of: {", ".join(BACKUPS)}')
 
     # Obtener la fecha y hora actual
     timestamp = datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
 
-    # Nombre del archivo de backup con fecha y hora (incluye todas las bases de datos)
-    backup_file = f'backup_complete_{timestamp}.sql'
+    # Nombre del backup con fecha y hora (incluye todas las bases de datos)
+    backup_name = f'backup_complete_{timestamp}'
 
-    # Ruta completa del archivo de backup
-    backup_dir = "/app/backup"
-    backup_path = os.path.join(backup_dir, backup_file)
-    bz2_path = f'{backup_path}.bz2'
-
-    # Realizar el backup de todas las bases de datos del sistema
-    print("Iniciando backup de las bases de datos en ", backup_path)
-    print(f"Bases de datos a respaldar: {database}, {accounting_database}")
-    backup_command = f'mysqldump --skip-set-charset --host={host} --user={user} --port={port} --password={password} --order-by-primary --databases {database} {accounting_database} > {backup_path}'
-    print("Ejecutando: ", backup_command)
-    subprocess.run(backup_command, shell=True)
-
-    print("Iniciando compresion de la base mysql en ", bz2_path)
-    bz2_command = f'bzip2 -z "{backup_path}" '
-    subprocess.run(bz2_command, shell=True)
-    
     # Obtener la lista de archivos en Mega
     files = mega_client.get_files()
 
@@ -92,37 +264,51 @@ if __name__ == '__main__':
     if not any(file['a']['n'] == 'backup' and file['t'] == 1 for file in files.values()):
         mega_client.create_folder('backup')
 
-    # mover el archivo a la carpeta backup
     backup_folder = mega_client.find('backup', exclude_deleted=True)
 
-    print(f'Uploading the file {bz2_path}')
-    # Subir el archivo de backup
-    backup_file = mega_client.upload(bz2_path, backup_folder[0])
+    # Cada backup es una carpeta con sus archivos, subidos a medida que se generan
+    set_folder = mega_client.create_folder(backup_name, backup_folder[0])[backup_name]
+
+    # Realizar el backup de todas las bases de datos del sistema
+    print(f"Bases de datos a respaldar: {database}, {accounting_database} (modo {mode})")
+    try:
+        BACKUPS[mode](mega_client, set_folder, backup_name)
+    except Exception:
+        # No dejar un backup incompleto ni rotar los anteriores. Las subidas ya
+        # se reanudaron dentro de esta ejecución (mega_upload.ATTEMPTS); la
+        # próxima ejecución empieza un backup nuevo
+        mega_client.delete(set_folder)
+        raise
 
     # Obtener la lista de archivos en Mega
     files = mega_client.get_files()
 
-    # Filtrar los archivos que pertenecen a la carpeta "backup"
+    # Filtrar los backups (carpetas, o archivos .sql.bz2 de antes) que están en la carpeta "backup"
     backup_files = []
     for file in files.values():
-        if file['a']['n'].startswith('backup_') and not "rr" in file['a']:
+        if file['a']['n'].startswith('backup_') and not "rr" in file['a'] and file['p'] == backup_folder[0]:
             backup_files.append(file)
 
     # Ordenar los archivos por fecha de creación (ascendente)
     sorted_files = sorted(backup_files, key=operator.itemgetter('ts'))
 
-    # Eliminar el archivo más antiguo si hay más de 10 archivos
+    # Eliminar el archivo más antiguo si hay más de 10 archivos, salvo los
+    # backups con tablas que siguen usando los backups que quedan (si falta el
+    # manifiesto local de alguno de ellos no se borra nada, como en clean_chunks)
     if len(sorted_files) > 10:
         oldest_files = sorted_files[:len(sorted_files)-10]
+        protected = referenced_sets(files, sorted_files[-10:])
+        if protected is None:
+            oldest_files = []
         for file in oldest_files:
-            file_h = mega_client.find(file['a']['n'])
-            mega_client.delete(file_h[0])
-
-    # Eliminar todos los archivos existentes en el directorio de backup
-    
-    for file_name in os.listdir(backup_dir):
-        file_path = os.path.join(backup_dir, file_name)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
+            if file['a']['n'] in protected:
+                continue
+            mega_client.delete(file['h'])
+            for local_dir in (manifests_dir, indexes_dir):
+                local_path = os.path.join(local_dir, f"{file['a']['n']}.json")
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+
+    clean_chunks(mega_client, backup_folder[0])
 
     print("bye!")
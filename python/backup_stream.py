@@ -0,0 +1,128 @@
+"""
+Streaming backup pipeline: mysqldump -> compressor -> upload
+
+mysqldump writes to a pipe; its output is compressed in this process as it
+arrives and the compressed stream is cut into parts of PART_SIZE bytes,
+which are uploaded by a background thread while the dump goes on. Nothing
+is written to disk and at most QUEUE_PARTS parts wait in memory, so the
+run takes about as long as the slowest of the three stages.
+
+The parts are consecutive slices of the compressed output: joined in
+order they give the whole .sql.bz2 (or .gz, .zst, see compression.py), e.g.
+
+    cat backup_complete_<fecha>.sql.bz2.* | bunzip2 | mysql
+"""
+
+import bz2
+import contextlib
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Tamaño de cada parte subida y de cada lectura del pipe de mysqldump
+PART_SIZE = int(os.environ.get('BACKUP_PART_SIZE', 16 * 1024 * 1024))
+READ_SIZE = 1024 * 1024
+# Partes comprimidas que pueden esperar a ser subidas
+QUEUE_PARTS = 2
+
+
+def dump_command(host, port, user, databases, options=()):
+    """
+    mysqldump arguments (the password goes in the environment, see dump_env())
+    """
+    return ['mysqldump', '--skip-set-charset', f'--host={host}', f'--user={user}', f'--port={port}',
+            '--order-by-primary'] + list(options) + ['--databases'] + list(databases)
+
+
+def dump_env(password):
+    env = dict(os.environ)
+    if password:
+        env['MYSQL_PWD'] = password
+    return env
+
+
+def part_name(name, number):
+    return f'{name}.{number:04d}'
+
+
+def read_dump(command, env=None, read_size=READ_SIZE):
+    """
+    Run the dump command and yield its output in blocks of up to read_size bytes
+
+    Raises:
+        Exception: After the last block, if the dump failed (exit code != 0)
+    """
+    with tempfile.TemporaryFile() as errors:
+        dump = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, env=env)
+        try:
+            for block in iter(lambda: dump.stdout.read(read_size), b''):
+                yield block
+            returncode = dump.wait()
+            if returncode != 0:
+                errors.seek(0)
+                message = errors.read().decode('utf-8', 'replace').strip()
+                raise Exception(f'mysqldump failed with exit code {returncode}: {message}')
+        finally:
+            if dump.poll() is None:
+                dump.kill()
+                dump.wait()
+            dump.stdout.close()
+
+
+def stream_backup(command, upload_part, env=None, compressor=None, part_size=PART_SIZE):
+    """
+    Run the dump command and upload its compressed output in parts
+
+    Args:
+        command: Dump command (argument list, run without a shell)
+        upload_part: Function called as upload_part(number, data) for each
+                     part (number starts at 1), from a background thread
+        env: Environment of the dump command
+        compressor: Object with compress(data) and flush(), e.g. a
+                    compression.ParallelCompressor (default bz2 level 9 in
+                    this process, as bzip2 -z)
+        part_size: Bytes per part
+
+    Returns:
+        dict: 'dump_bytes', 'compressed_bytes', 'parts' and 'seconds'
+
+    Raises:
+        Exception: If the dump fails (exit code != 0) or a part cannot be uploaded
+    """
+    started = time.time()
+    if compressor is None:
+        compressor = bz2.BZ2Compressor(9)
+    stats = {'dump_bytes': 0, 'compressed_bytes': 0, 'parts': 0}
+    pending = []
+
+    with contextlib.closing(read_dump(command, env)) as blocks, ThreadPoolExecutor(max_workers=1) as uploader:
+
+        def submit(data):
+            stats['parts'] += 1
+            stats['compressed_bytes'] += len(data)
+            pending.append(uploader.submit(upload_part, stats['parts'], data))
+            # Memoria acotada: esperar a que se suban las partes más viejas
+            while len(pending) > QUEUE_PARTS or (pending and pending[0].done()):
+                pending.pop(0).result()
+
+        try:
+            buffer = bytearray()
+            for block in blocks:
+                stats['dump_bytes'] += len(block)
+                buffer += compressor.compress(block)
+                while len(buffer) >= part_size:
+                    submit(bytes(buffer[:part_size]))
+                    del buffer[:part_size]
+            buffer += compressor.flush()
+            if buffer or not stats['parts']:
+                submit(bytes(buffer))
+            for future in pending:
+                future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    stats['seconds'] = time.time() - started
+    return stats
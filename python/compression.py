@@ -0,0 +1,259 @@
+"""
+Multi-core block compression for backups
+
+The dump is cut into blocks of BLOCK_SIZE bytes that are compressed in
+parallel by a process pool. Every block becomes a complete bz2 stream, gzip
+member or zstd frame, and their concatenation is a valid file for the usual
+tools (bunzip2, gunzip, zstd -d, and Python's bz2/gzip modules all read
+multi-stream files). zstd is only offered when the zstandard package is
+installed.
+
+Configuration (environment): BACKUP_CODEC (bz2, gzip, zstd; default bz2),
+BACKUP_LEVEL (default per codec) and BACKUP_WORKERS (default: CPU count).
+
+Usage:
+    python compression.py bench sample.sql
+    mysqldump ... | python compression.py bench - --codecs gzip zstd --levels 1 6
+"""
+
+import argparse
+import bz2
+import collections
+import gzip
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# codec: (extensión, nivel por defecto, niveles válidos)
+CODECS = collections.OrderedDict([
+    ('bz2', ('.bz2', 9, range(1, 10))),
+    ('gzip', ('.gz', 6, range(0, 10))),
+    ('zstd', ('.zst', 3, range(1, 23))),
+])
+
+
+def available_codecs():
+    return [codec for codec in CODECS if codec != 'zstd' or zstandard is not None]
+
+
+def extension(codec):
+    return CODECS[codec][0]
+
+
+def check_codec(codec, level=None):
+    """
+    Validate a codec and level
+
+    Returns:
+        int: Level (the codec default when level is None)
+
+    Raises:
+        ValueError: Unknown or unavailable codec, or level out of range
+    """
+    if codec not in CODECS:
+        raise ValueError(f'Unknown codec: {codec} (available: {", ".join(available_codecs())})')
+    if codec not in available_codecs():
+        raise ValueError(f'Codec {codec} is not available (pip install zstandard)')
+    if level is None:
+        return CODECS[codec][1]
+    if level not in CODECS[codec][2]:
+        raise ValueError(f'Invalid {codec} level: {level}')
+    return level
+
+
+def compress_block(codec, level, data):
+    """
+    Compress one block into a self-contained stream/member/frame
+    """
+    if codec == 'bz2':
+        return bz2.compress(data, level)
+    if codec == 'gzip':
+        return gzip.compress(data, level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _compress_task(task):
+    return compress_block(*task)
+
+
+def decompress(codec, data):
+    """
+    Decompress a concatenation of blocks (for checks and restores)
+    """
+    if codec == 'bz2':
+        return bz2.decompress(data)
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    output = []
+    while data:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        output.append(decompressor.decompress(data))
+        data = decompressor.unused_data
+    return b''.join(output)
+
+
+def _decompressor(codec):
+    if codec == 'bz2':
+        return bz2.BZ2Decompressor()
+    if codec == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def iter_decompress(codec, chunks):
+    """
+    Decompress a concatenation of blocks piece by piece (bounded memory)
+
+    Args:
+        codec: 'bz2', 'gzip' or 'zstd'
+        chunks: Iterable of compressed bytes
+
+    Returns:
+        iterator: Decompressed bytes
+    """
+    decompressor = _decompressor(codec)
+    for chunk in chunks:
+        while chunk:
+            output = decompressor.decompress(chunk)
+            if output:
+                yield output
+            chunk = b''
+            if decompressor.eof:
+                # Fin de un bloque: lo que sigue es el bloque siguiente
+                chunk = decompressor.unused_data
+                decompressor = _decompressor(codec)
+
+
+class ParallelCompressor:
+    """
+    Compressor with the compress()/flush() interface of bz2.BZ2Compressor,
+    backed by a process pool
+
+    compress() returns the compressed blocks that are ready, in order; at
+    most 2 * workers blocks are in flight, so memory stays bounded.
+    """
+
+    def __init__(self, codec='bz2', level=None, workers=None, block_size=BLOCK_SIZE):
+        self.codec = codec
+        self.level = check_codec(codec, level)
+        self.workers = workers or os.cpu_count() or 1
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.pending = collections.deque()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def compress(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return self._collect(wait=False)
+
+    def flush(self):
+        if self.buffer or not self.pending:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        return self._collect(wait=True)
+
+    def _submit(self, block):
+        self.pending.append(self.pool.submit(_compress_task, (self.codec, self.level, block)))
+
+    def _collect(self, wait):
+        output = []
+        while self.pending and (wait or self.pending[0].done() or len(self.pending) > 2 * self.workers):
+            output.append(self.pending.popleft().result())
+        return b''.join(output)
+
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def from_env():
+    """
+    ParallelCompressor configured from BACKUP_CODEC, BACKUP_LEVEL and BACKUP_WORKERS
+    """
+    level = os.environ.get('BACKUP_LEVEL')
+    workers = os.environ.get('BACKUP_WORKERS')
+    return ParallelCompressor(os.environ.get('BACKUP_CODEC', 'bz2'), int(level) if level else None,
+                              int(workers) if workers else None)
+
+
+def bench(data, codecs, levels, workers, block_size=BLOCK_SIZE):
+    """
+    Throughput and ratio of each codec/level on a sample
+
+    Returns:
+        list: (codec, level, compressed bytes, seconds, decompress seconds) tuples
+    """
+    results = []
+    for codec in codecs:
+        for level in levels or [None]:
+            level = check_codec(codec, level)
+            with ParallelCompressor(codec, level, workers, block_size) as compressor:
+                started = time.perf_counter()
+                output = [compressor.compress(data[i:i + 1024 * 1024]) for i in range(0, len(data), 1024 * 1024)]
+                output = b''.join(output) + compressor.flush()
+                seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            if decompress(codec, output) != data:
+                raise Exception(f'{codec} level {level}: decompressed data does not match')
+            results.append((codec, level, len(output), seconds, time.perf_counter() - started))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compresión en paralelo de los backups')
+    commands = parser.add_subparsers(dest='command')
+    bench_parser = commands.add_parser('bench', help='Velocidad y tasa de compresión sobre un dump de ejemplo')
+    bench_parser.add_argument('sample', help='Dump de ejemplo (- = stdin)')
+    bench_parser.add_argument('--codecs', nargs='+', default=available_codecs(), help='Codecs a medir')
+    bench_parser.add_argument('--levels', nargs='+', type=int, help='Niveles (por defecto, el de cada codec)')
+    bench_parser.add_argument('--workers', type=int, help='Procesos (por defecto, uno por núcleo)')
+    bench_parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='Bytes por bloque')
+    args = parser.parse_args(argv)
+    if args.command != 'bench':
+        parser.print_help()
+        return 1
+
+    try:
+        for codec in args.codecs:
+            for level in args.levels or [None]:
+                check_codec(codec, level)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.sample == '-':
+        data = sys.stdin.buffer.read()
+    else:
+        with open(args.sample, 'rb') as f:
+            data = f.read()
+    workers = args.workers or os.cpu_count() or 1
+    mb = len(data) / 1e6
+    print(f'{mb:.1f} MB, {workers} procesos, bloques de {args.block_size // 1024} KB')
+    print(f"{'Codec':<6}{'Nivel':>6}{'Tasa':>8}{'MB/s':>9}{'Descomp. MB/s':>15}{'Bytes':>13}")
+    results = bench(data, args.codecs, args.levels, workers, args.block_size)
+    for codec, level, size, seconds, unpack in results:
+        print(f'{codec:<6}{level:>6}{len(data) / max(size, 1):>7.1f}x{mb / seconds:>9.1f}'
+              f'{mb / unpack:>15.1f}{size:>13}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
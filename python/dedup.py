@@ -0,0 +1,291 @@
+"""
+Deduplicated backups: content-defined chunks of the dump
+
+The dump stream is cut into chunks whose boundaries depend only on the
+bytes around them, so a row inserted, updated or deleted in a table changes
+the chunk that holds it and leaves the following ones identical. Each chunk
+is named by the SHA-256 of its SQL and stored once, compressed, in a shared
+chunk store; a backup is an index, the list of its chunks in order. Only
+the chunks that the store does not have yet are compressed and uploaded.
+
+Boundaries: candidate cut points are the ends of the row and statement
+separators of the dump ("),(" in extended INSERTs, and newlines). A
+candidate is taken when the CRC-32 of the WINDOW bytes before it falls
+under a threshold proportional to the distance from the previous candidate,
+which gives chunks of about AVG_SIZE bytes whatever the row length. Chunks
+are never shorter than MIN_SIZE; a stretch without candidates is cut every
+MAX_SIZE bytes. The dump must have one row per line (mysqldump
+--skip-extended-insert): with extended INSERTs a new row moves every
+following statement break and with it the content of every chunk.
+
+Configuration (environment): BACKUP_CHUNK_SIZE (AVG_SIZE, default 256 KB),
+plus BACKUP_CODEC, BACKUP_LEVEL and BACKUP_WORKERS as in compression.py.
+
+Restore (index and a directory with the chunk files):
+    python dedup.py restore /ruta/index.json /ruta/chunks | mysql -u root -p
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import backup_stream
+import compression
+
+AVG_SIZE = int(os.environ.get('BACKUP_CHUNK_SIZE', 256 * 1024))
+# Bytes antes de cada separador que deciden si es un límite
+WINDOW = 64
+# Separadores de filas (INSERT extendido) y de sentencias
+BOUNDARY = re.compile(rb'\),\(|\n')
+# Chunks nuevos que pueden esperar a ser subidos
+QUEUE_CHUNKS = 4
+
+INDEX = 'index.json'
+
+
+class Chunker:
+    """
+    Cuts a byte stream into content-defined chunks
+
+    feed() returns the chunks completed by the new data, flush() the last one.
+    """
+
+    def __init__(self, avg_size=AVG_SIZE, min_size=None, max_size=None):
+        self.min_size = max(min_size or avg_size // 4, WINDOW)
+        self.max_size = max(max_size or avg_size * 4, self.min_size)
+        # Umbral del CRC por byte desde el candidato anterior
+        self.scale = (1 << 32) / avg_size
+        self.buffer = bytearray()
+        self.prev = 0
+        self.scan = 0
+
+    def feed(self, data):
+        self.buffer += data
+        buffer = self.buffer
+        cuts = []
+        start = 0
+        prev = self.prev
+        last = self.scan
+        for match in BOUNDARY.finditer(buffer, self.scan):
+            end = match.end()
+            last = end
+            while end - start > self.max_size:
+                start += self.max_size
+                cuts.append(start)
+            gap = end - prev
+            prev = end
+            if end - start >= self.min_size and zlib.crc32(buffer[end - WINDOW:end]) < gap * self.scale:
+                start = end
+                cuts.append(start)
+        while len(buffer) - start > self.max_size:
+            start += self.max_size
+            cuts.append(start)
+
+        chunks = []
+        begin = 0
+        for cut in cuts:
+            chunks.append(bytes(buffer[begin:cut]))
+            begin = cut
+        del buffer[:start]
+        self.prev = prev - start
+        # Un separador puede continuar en el bloque siguiente
+        self.scan = max(last, len(buffer) + start - 2, start) - start
+        return chunks
+
+    def flush(self):
+        chunks = [bytes(self.buffer)] if self.buffer else []
+        self.buffer = bytearray()
+        self.prev = self.scan = 0
+        return chunks
+
+
+def chunk_name(digest, codec):
+    return f'{digest}.sql{compression.extension(codec)}'
+
+
+def _compress_task(task):
+    return compression.compress_block(*task)
+
+
+def dedup_backup(blocks, known, upload_chunk, codec='bz2', level=None, workers=None, avg_size=AVG_SIZE):
+    """
+    Chunk a dump, upload the chunks the store does not have and build the index
+
+    Args:
+        blocks: Iterable of dump bytes (e.g. backup_stream.read_dump())
+        known: Names of the chunks already in the store (see chunk_name())
+        upload_chunk: Function called as upload_chunk(name, data) for each
+                      new compressed chunk, from a background thread
+        codec: Compression codec of the chunks (see compression.py)
+        level: Compression level (default per codec)
+        workers: Compression processes (default: CPU count)
+        avg_size: Average chunk size
+
+    Returns:
+        dict: Index: codec, level, chunks ([SHA-256, size] in order) and stats
+
+    Raises:
+        Exception: If the dump fails or a chunk cannot be uploaded
+    """
+    started = time.time()
+    level = compression.check_codec(codec, level)
+    workers = workers or os.cpu_count() or 1
+    chunker = Chunker(avg_size)
+    known = set(known)
+    index = {
+        'format': 1,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'codec': codec,
+        'level': level,
+        'avg_size': avg_size,
+        'chunks': [],
+        'dump_bytes': 0,
+        'new_chunks': 0,
+        'new_bytes': 0,
+        'uploaded_bytes': 0,
+    }
+    compressing = collections.deque()
+    uploading = collections.deque()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=1) as uploader:
+
+        def collect(wait):
+            # Pasar a la subida los chunks ya comprimidos, en orden y con memoria acotada
+            while compressing and (wait or compressing[0][1].done() or len(compressing) > 2 * workers):
+                name, future = compressing.popleft()
+                data = future.result()
+                index['uploaded_bytes'] += len(data)
+                uploading.append(uploader.submit(upload_chunk, name, data))
+                while len(uploading) > QUEUE_CHUNKS or (uploading and uploading[0].done()):
+                    uploading.popleft().result()
+
+        def add(chunk):
+            digest = hashlib.sha256(chunk).hexdigest()
+            index['chunks'].append([digest, len(chunk)])
+            name = chunk_name(digest, codec)
+            if name in known:
+                return
+            known.add(name)
+            index['new_chunks'] += 1
+            index['new_bytes'] += len(chunk)
+            compressing.append((name, pool.submit(_compress_task, (codec, level, chunk))))
+            collect(wait=False)
+
+        try:
+            for block in blocks:
+                index['dump_bytes'] += len(block)
+                for chunk in chunker.feed(block):
+                    add(chunk)
+            for chunk in chunker.flush():
+                add(chunk)
+            collect(wait=True)
+            for future in uploading:
+                future.result()
+        finally:
+            for _, future in compressing:
+                future.cancel()
+            for future in uploading:
+                future.cancel()
+
+    index['seconds'] = round(time.time() - started, 1)
+    return index
+
+
+def index_chunks(index):
+    """
+    Names of the chunk files an index refers to
+    """
+    return {chunk_name(digest, index['codec']) for digest, _ in index['chunks']}
+
+
+def save_index(directory, name, index):
+    """
+    Keep a local copy of a backup's index (<directory>/<name>.json)
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(path + '.tmp', path)
+
+
+def load_index(directory, name):
+    """
+    Local copy of a backup's index, or None
+    """
+    path = os.path.join(directory, f'{name}.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump_options():
+    """
+    mysqldump options for a chunked dump: one row per line, no date
+    """
+    return ['--skip-extended-insert', '--skip-dump-date']
+
+
+def restore(index, chunks_dir, out):
+    """
+    Write the dump of an index to a binary stream, checking every chunk
+    """
+    for digest, size in index['chunks']:
+        with open(os.path.join(chunks_dir, chunk_name(digest, index['codec'])), 'rb') as f:
+            data = compression.decompress(index['codec'], f.read())
+        if len(data) != size or hashlib.sha256(data).hexdigest() != digest:
+            raise Exception(f'Checksum mismatch in chunk {digest}')
+        out.write(data)
+    out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backups deduplicados por chunks')
+    commands = parser.add_subparsers(dest='command')
+    restore_parser = commands.add_parser('restore', help='Escribir el dump de un backup en stdout')
+    restore_parser.add_argument('index', help='Índice del backup (index.json)')
+    restore_parser.add_argument('chunks', help='Directorio con los chunks')
+    stats_parser = commands.add_parser('stats', help='Chunks nuevos de un dump respecto de los índices dados')
+    stats_parser.add_argument('sample', help='Dump (- = stdin)')
+    stats_parser.add_argument('indexes', nargs='*', help='Índices de backups anteriores')
+    stats_parser.add_argument('--save', metavar='ARCHIVO', help='Guardar el índice del dump')
+    stats_parser.add_argument('--chunk-size', type=int, default=AVG_SIZE, help='Tamaño medio de los chunks')
+    args = parser.parse_args(argv)
+
+    if args.command == 'restore':
+        with open(args.index, encoding='utf-8') as f:
+            restore(json.load(f), args.chunks, sys.stdout.buffer)
+    elif args.command == 'stats':
+        known = set()
+        codec = os.environ.get('BACKUP_CODEC', 'bz2')
+        for path in args.indexes:
+            with open(path, encoding='utf-8') as f:
+                index = json.load(f)
+            codec = index['codec']
+            known |= index_chunks(index)
+        source = sys.stdin.buffer if args.sample == '-' else open(args.sample, 'rb')
+        with source:
+            blocks = iter(lambda: source.read(backup_stream.READ_SIZE), b'')
+            index = dedup_backup(blocks, known, lambda name, data: None, codec, avg_size=args.chunk_size)
+        print(f"{index['dump_bytes']} bytes en {len(index['chunks'])} chunks; nuevos: {index['new_chunks']} "
+              f"({index['new_bytes']} bytes, {index['uploaded_bytes']} comprimidos), {index['seconds']} s")
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
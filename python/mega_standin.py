@@ -0,0 +1,322 @@
+"""
+Local stand-in for Mega's storage, to check the uploads without an account
+
+StandInServer is an HTTP server on 127.0.0.1 that takes the pieces posted
+to an upload URL (POST /ul/<id>/<offset>) and answers the request that
+completes the file with a handle, as Mega does. Faults can be queued to
+simulate a bad network: 'error' (HTTP 500), 'drop' (connection closed
+without an answer), 'busy' (-3) and 'reject' (-9, e.g. expired URL).
+StandInClient is the part of mega.Mega that mega_upload.py uses, backed by
+the server, and verify() decrypts a stored file and checks its MAC the way
+a Mega download does.
+
+    python mega_standin.py      # pruebas de mega_upload.py contra el servidor local
+"""
+
+import http.server
+import os
+import secrets
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+from Crypto.Cipher import AES
+from Crypto.Util import Counter
+from mega.crypto import (a32_to_str, base64_to_a32, base64_url_decode, decrypt_attr, decrypt_key, get_chunks,
+                         str_to_a32)
+
+import mega_upload
+
+# Piezas chicas para que las pruebas tengan varias por archivo
+PIECE = 512 * 1024
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            _, upload_id, offset = self.path.strip('/').split('/')
+            offset = int(offset)
+        except ValueError:
+            self.reply(404, 'not found')
+            return
+        status, text = self.server.receive(upload_id, offset, data)
+        if status is None:
+            # Conexión cortada sin respuesta
+            self.close_connection = True
+            return
+        self.reply(status, text)
+
+    def reply(self, status, text):
+        body = text.encode('ascii')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Upload endpoint of the stand-in storage
+
+    Attributes:
+        faults: Faults for the next pieces, in order (None = no fault)
+        fail_after: Pieces to accept before failing every request (None = never)
+        delay: Seconds each piece takes (to see pieces overlap)
+        pieces: (upload id, offset) of every piece accepted
+        max_active: Most pieces received at the same time
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.uploads = {}
+        self.faults = []
+        self.fail_after = None
+        self.delay = 0
+        self.pieces = []
+        self.active = 0
+        self.max_active = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def new_upload(self, size):
+        with self.lock:
+            upload_id = f'u{len(self.uploads) + 1}'
+            self.uploads[upload_id] = {'size': size, 'data': bytearray(size), 'received': {}, 'handle': None,
+                                       'expired': False}
+        return f'{self.url}/ul/{upload_id}'
+
+    def expire(self, url):
+        self.uploads[url.rsplit('/', 1)[1]]['expired'] = True
+
+    def receive(self, upload_id, offset, data):
+        """
+        Store a piece
+
+        Returns:
+            tuple: (HTTP status or None to drop the connection, response text)
+        """
+        with self.lock:
+            fault = self.faults.pop(0) if self.faults else None
+            if self.fail_after is not None and len(self.pieces) >= self.fail_after:
+                fault = 'error'
+            upload = self.uploads.get(upload_id)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if fault == 'drop':
+                return None, ''
+            if fault == 'error':
+                return 500, 'error'
+            if fault == 'busy':
+                return 200, '-3'
+            if fault == 'reject' or upload is None or upload['expired']:
+                return 200, '-9'
+            if offset + len(data) > upload['size']:
+                return 200, '-2'
+            with self.lock:
+                upload['data'][offset:offset + len(data)] = data
+                upload['received'][offset] = len(data)
+                self.pieces.append((upload_id, offset))
+                covered = 0
+                for start in sorted(upload['received']):
+                    if start > covered:
+                        break
+                    covered = max(covered, start + upload['received'][start])
+                if covered < upload['size'] and upload['size']:
+                    return 200, ''
+                if not upload['handle']:
+                    upload['handle'] = f'H{upload_id}'
+                return 200, upload['handle']
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class StandInClient:
+    """
+    mega.Mega stand-in: upload URLs and file nodes ('u' and 'p' requests)
+    """
+    timeout = 10
+    request_id = 'standin'
+
+    def __init__(self, server):
+        self.server = server
+        self.master_key = [secrets.randbits(32) for _ in range(4)]
+        self.nodes = {}
+
+    def _api_request(self, data):
+        if data['a'] == 'u':
+            return {'p': self.server.new_upload(data['s'])}
+        if data['a'] == 'p':
+            node = data['n'][0]
+            upload = next((upload for upload in self.server.uploads.values() if upload['handle'] == node['h']), None)
+            if upload is None:
+                return -9
+            handle = f'N{len(self.nodes) + 1}'
+            self.nodes[handle] = dict(node, t=data['t'], data=bytes(upload['data']))
+            return {'f': [{'h': handle, 'p': data['t'], 't': 0}]}
+        raise ValueError(f"Unsupported request: {data['a']}")
+
+
+def verify(client, handle):
+    """
+    Decrypt a stored file and check its MAC
+
+    Returns:
+        tuple: (name, contents)
+
+    Raises:
+        ValueError: If the MAC does not match
+    """
+    node = client.nodes[handle]
+    key = decrypt_key(base64_to_a32(node['k']), client.master_key)
+    k = (key[0] ^ key[4], key[1] ^ key[5], key[2] ^ key[6], key[3] ^ key[7])
+    k_str = a32_to_str(k)
+    name = decrypt_attr(base64_url_decode(node['a']), k)['n']
+    counter = Counter.new(128, initial_value=((key[4] << 32) + key[5]) << 64)
+    data = AES.new(k_str, AES.MODE_CTR, counter=counter).decrypt(node['data'])
+
+    iv_str = a32_to_str([key[4], key[5], key[4], key[5]])
+    mac_encryptor = AES.new(k_str, AES.MODE_CBC, b'\0' * 16)
+    mac_str = b'\0' * 16
+    for start, length in (get_chunks(len(data)) if data else []):
+        chunk = data[start:start + length]
+        chunk += b'\0' * (-len(chunk) % 16)
+        mac_str = mac_encryptor.encrypt(AES.new(k_str, AES.MODE_CBC, iv_str).encrypt(chunk)[-16:])
+    file_mac = str_to_a32(mac_str)
+    if (file_mac[0] ^ file_mac[1], file_mac[2] ^ file_mac[3]) != tuple(key[6:8]):
+        raise ValueError(f'Mismatched MAC in {name}')
+    return name, data
+
+
+def selftest():
+    """
+    Uploads through mega_upload.py against the stand-in, with network faults
+    and interrupted uploads
+
+    Returns:
+        bool: True if every check passed
+    """
+    mega_upload.RETRY_DELAY = 0.01
+    mega_upload.RESUME_DELAY = 0.01
+    server = StandInServer().start()
+    client = StandInClient(server)
+    work_dir = tempfile.mkdtemp()
+    results = []
+
+    def check(description, condition):
+        results.append(condition)
+        print(f"{'ok  ' if condition else 'FAIL'} {description}")
+
+    def uploaded(response, data, name):
+        try:
+            return verify(client, response['f'][0]['h']) == (name, data)
+        except ValueError:
+            return False
+
+    def write(name, size):
+        path = os.path.join(work_dir, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        with open(path, 'rb') as f:
+            return path, f.read()
+
+    try:
+        for size in (0, 1, 16, 17, 0x20000, 0x20000 + 16, 3 * 1024 * 1024 + 123):
+            data = os.urandom(size)
+            response = mega_upload.upload_bytes(client, data, 'DEST', f'b{size}')
+            check(f'upload_bytes de {size} bytes', uploaded(response, data, f'b{size}'))
+
+        server.delay = 0.05
+        server.max_active = 0
+        data = os.urandom(6 * 1024 * 1024)
+        started = time.time()
+        response = mega_upload.upload_data(client, lambda start, length: data[start:start + length], len(data),
+                                           'DEST', 'parallel', workers=4, piece_size=PIECE)
+        check(f'piezas en paralelo ({server.max_active} a la vez, {time.time() - started:.2f} s)',
+              uploaded(response, data, 'parallel') and server.max_active > 1)
+        server.delay = 0
+
+        server.faults = ['error', 'drop', None, 'busy', 'error']
+        response = mega_upload.upload_data(client, lambda start, length: data[start:start + length], len(data),
+                                           'DEST', 'faults', workers=2, piece_size=PIECE)
+        check('reintentos ante errores 500, conexiones cortadas y -3',
+              uploaded(response, data, 'faults') and not server.faults)
+
+        # La tercera pieza agota sus reintentos: la subida sigue sin repetir las dos primeras
+        server.faults = [None, None, 'error', 'error']
+        before = len(server.pieces)
+        response = mega_upload.upload_data(client, lambda start, length: data[start:start + length], len(data),
+                                           'DEST', 'resumed', workers=1, piece_size=PIECE, retries=1)
+        total = len(mega_upload.upload_pieces(len(data), PIECE))
+        sent = len(server.pieces) - before
+        check(f'reanudación en la misma llamada: {sent} piezas para {total}',
+              uploaded(response, data, 'resumed') and sent == total)
+
+        path, data = write('archive.sql.bz2', 5 * 1024 * 1024 + 7)
+        state_path = path + mega_upload.STATE_SUFFIX
+        server.fail_after = len(server.pieces) + 2
+        try:
+            mega_upload.upload_file(client, path, 'DEST', piece_size=PIECE, workers=1, retries=1)
+            check('corte de la red a mitad de la subida', False)
+        except Exception:
+            check('corte de la red a mitad de la subida: se conserva el estado', os.path.exists(state_path))
+        server.fail_after = None
+        before = len(server.pieces)
+        response = mega_upload.upload_file(client, path, 'DEST', piece_size=PIECE, workers=2)
+        total = len(mega_upload.upload_pieces(len(data), PIECE))
+        resent = len(server.pieces) - before
+        check(f'reanudación: {resent} de {total} piezas enviadas de nuevo',
+              uploaded(response, data, 'archive.sql.bz2') and resent == total - 2 and not os.path.exists(state_path))
+
+        server.fail_after = len(server.pieces) + 1
+        try:
+            mega_upload.upload_file(client, path, 'DEST', piece_size=PIECE, workers=1, retries=0)
+        except Exception:
+            pass
+        server.fail_after = None
+        server.expire(mega_upload.load_state(state_path, {})['url'])
+        response = mega_upload.upload_file(client, path, 'DEST', piece_size=PIECE, workers=2)
+        check('URL vencida: la subida empieza de nuevo', uploaded(response, data, 'archive.sql.bz2'))
+
+        server.fail_after = len(server.pieces) + 1
+        try:
+            mega_upload.upload_file(client, path, 'DEST', piece_size=PIECE, workers=1, retries=0)
+        except Exception:
+            pass
+        server.fail_after = None
+        path, data = write('archive.sql.bz2', 2 * 1024 * 1024)
+        response = mega_upload.upload_file(client, path, 'DEST', piece_size=PIECE, workers=2)
+        check('archivo modificado: no se reanuda la subida anterior', uploaded(response, data, 'archive.sql.bz2'))
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return all(results)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if selftest() else 1)
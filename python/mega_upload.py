@@ -0,0 +1,339 @@
+"""
+Mega upload from memory or from a file, in parallel and resumable
+
+mega.Mega().upload() only takes a local file name and sends it in one
+blocking call. upload_data() uses the same protocol (AES-CTR encrypted
+chunks posted to the upload URL, CBC-MAC per chunk, node created with 'p')
+but groups the chunks into pieces of about PIECE_SIZE bytes that are posted
+by UPLOAD_WORKERS threads at once, each retried on network errors.
+
+The chunk MACs do not depend on the order in which pieces arrive, so they
+are kept per piece and chained at the end. When a piece still fails after
+its retries, upload_data() waits RESUME_DELAY seconds and resumes the same
+upload, sending only the pieces that are missing, up to ATTEMPTS times;
+this applies to buffers (upload_bytes()) as well as files. upload_file()
+also saves the progress with the upload URL and key in <file>.upload.json
+after every piece: if the process stops, a later call for the same file
+(same size and modification time), e.g. the upload command below, only
+sends the missing pieces. The state file is removed when the node is
+created.
+
+Usage (upload or resume a local archive, with MEGA_USER and MEGA_PASSWORD):
+    python mega_upload.py upload backup_complete_<fecha>.sql.bz2 --folder backup
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from Crypto.Cipher import AES
+from Crypto.Util import Counter
+from mega.crypto import (a32_to_base64, a32_to_str, base64_url_encode, encrypt_attr, encrypt_key,
+                         get_chunks, str_to_a32)
+
+# Bytes por pedido POST y pedidos simultáneos
+PIECE_SIZE = int(os.environ.get('BACKUP_UPLOAD_PIECE', 4 * 1024 * 1024))
+UPLOAD_WORKERS = int(os.environ.get('BACKUP_UPLOAD_WORKERS', 4))
+# Reintentos por pieza; la espera empieza en RETRY_DELAY segundos y se duplica
+RETRIES = 5
+RETRY_DELAY = 1
+# Reanudaciones de una subida interrumpida y espera antes de cada una
+ATTEMPTS = int(os.environ.get('BACKUP_UPLOAD_ATTEMPTS', 3))
+RESUME_DELAY = 30
+
+STATE_SUFFIX = '.upload.json'
+
+
+class UploadRejected(Exception):
+    """
+    The storage server refused a piece (e.g. the upload URL expired)
+    """
+
+
+def chunk_mac(k_str, iv_str, chunk):
+    """
+    CBC-MAC of one upload chunk (zero padded to 16 bytes)
+    """
+    if len(chunk) % 16:
+        chunk += b'\0' * (16 - len(chunk) % 16)
+    return AES.new(k_str, AES.MODE_CBC, iv_str).encrypt(chunk)[-16:]
+
+
+def encrypt_chunk(k_str, ul_key, start, chunk):
+    """
+    AES-CTR encryption of the chunk that starts at byte offset start
+    """
+    counter = Counter.new(128, initial_value=(((ul_key[4] << 32) + ul_key[5]) << 64) + start // 16)
+    return AES.new(k_str, AES.MODE_CTR, counter=counter).encrypt(chunk)
+
+
+def upload_pieces(size, piece_size=PIECE_SIZE):
+    """
+    Group the MAC chunks of a file (mega.crypto.get_chunks) into pieces
+
+    Returns:
+        list: (start, length, [(chunk start, chunk length), ...]) tuples
+    """
+    if not size:
+        return [(0, 0, [])]
+    pieces = []
+    start = 0
+    chunks = []
+    for chunk_start, length in get_chunks(size):
+        chunks.append((chunk_start, length))
+        if chunk_start + length - start >= piece_size:
+            pieces.append((start, chunk_start + length - start, chunks))
+            start = chunk_start + length
+            chunks = []
+    if chunks:
+        pieces.append((start, size - start, chunks))
+    return pieces
+
+
+def post_piece(url, k_str, iv_str, ul_key, start, data, chunks, timeout=None, retries=RETRIES):
+    """
+    Encrypt and post one piece, retrying on network and server errors
+
+    Returns:
+        tuple: (MACs of its chunks in hex, response text: the completion
+               handle when the piece completes the file, else empty)
+
+    Raises:
+        UploadRejected: If the server answers with an error code
+        requests.RequestException: If the piece cannot be sent after the retries
+    """
+    macs = [chunk_mac(k_str, iv_str, data[chunk_start - start:chunk_start - start + length]).hex()
+            for chunk_start, length in chunks]
+    encrypted = encrypt_chunk(k_str, ul_key, start, data)
+    for attempt in range(retries + 1):
+        try:
+            response = requests.post(f'{url}/{start}', data=encrypted, timeout=timeout)
+            response.raise_for_status()
+            text = response.text
+            if text == '-3':
+                # EAGAIN: el servidor pide reintentar
+                raise requests.RequestException(f'Server busy at byte {start}')
+            if text.lstrip('-').isdigit():
+                # El servidor devuelve un código de error numérico en lugar del handle
+                raise UploadRejected(f'Upload rejected at byte {start}: {text}')
+            return macs, text
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+
+def load_state(path, identity):
+    """
+    Saved state of an upload, if it belongs to the same file and destination
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except ValueError:
+        return None
+    if any(state.get(key) != value for key, value in identity.items()):
+        return None
+    return state
+
+
+def save_state(path, state):
+    if path:
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+
+def new_state(mega_client, identity, piece_size):
+    """
+    Start an upload: URL and random AES key (128 bits) and CTR nonce of the file,
+    from the OS cryptographic generator
+    """
+    state = dict(identity)
+    state['url'] = mega_client._api_request({'a': 'u', 's': identity['size']})['p']
+    state['key'] = [secrets.randbits(32) for _ in range(6)]
+    state['piece_size'] = piece_size
+    state['done'] = {}
+    state['handle'] = None
+    return state
+
+
+def upload_data(mega_client, read, size, dest, name, state_path=None, identity=None, workers=UPLOAD_WORKERS,
+                piece_size=PIECE_SIZE, retries=RETRIES, attempts=ATTEMPTS):
+    """
+    Upload a new file piece by piece, several pieces at once
+
+    Args:
+        mega_client: Logged in mega.Mega client
+        read: Function called as read(start, length) that returns the bytes
+              of the file in that range (from the upload threads)
+        size: File size
+        dest: Node id of the destination folder
+        name: File name
+        state_path: JSON file to save the progress in (None: the upload is
+                    only resumed within this call)
+        identity: Values that must match to resume a saved upload
+        workers: Pieces posted at once
+        piece_size: Bytes per piece
+        retries: Retries per piece
+        attempts: Times the upload is tried, each one resuming the previous
+
+    Returns:
+        dict: Response of the node creation request (same as Mega.upload())
+
+    Raises:
+        Exception: If a piece cannot be uploaded (the progress is kept in
+                   state_path) or the node cannot be created
+    """
+    identity = dict(identity or {}, size=size, dest=dest, name=name)
+    state = load_state(state_path, identity)
+    resumed = state is not None
+    attempt = 1
+    while True:
+        if state is None:
+            state = new_state(mega_client, identity, piece_size)
+            save_state(state_path, state)
+        try:
+            return _upload(mega_client, read, state, state_path, workers, retries)
+        except requests.RequestException as e:
+            if attempt >= attempts:
+                raise
+            attempt += 1
+            print(f"Upload of {name} interrupted ({e}), resuming in {RESUME_DELAY} s "
+                  f"({len(state['done'])} pieces sent)")
+            time.sleep(RESUME_DELAY)
+            resumed = True
+        except UploadRejected:
+            if not resumed:
+                raise
+            # La URL de la subida guardada ya no sirve: empezar de nuevo
+            print(f'Upload of {name} could not be resumed, starting again')
+            state = None
+            resumed = False
+
+
+def _upload(mega_client, read, state, state_path, workers, retries):
+    ul_key = state['key']
+    k_str = a32_to_str(ul_key[:4])
+    iv_str = a32_to_str([ul_key[4], ul_key[5], ul_key[4], ul_key[5]])
+    pieces = upload_pieces(state['size'], state['piece_size'])
+    lock = threading.Lock()
+
+    def send(piece):
+        start, length, chunks = piece
+        macs, handle = post_piece(state['url'], k_str, iv_str, ul_key, start, read(start, length), chunks,
+                                  mega_client.timeout, retries)
+        with lock:
+            state['done'][str(start)] = macs
+            if handle:
+                state['handle'] = handle
+            save_state(state_path, state)
+
+    pending = [piece for piece in pieces if str(piece[0]) not in state['done']]
+    if not pending and not state['handle']:
+        # Todo subido pero sin el handle final: volver a mandar la última pieza
+        pending = pieces[-1:]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(send, piece) for piece in pending]
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    mac_encryptor = AES.new(k_str, AES.MODE_CBC, b'\0' * 16)
+    mac_str = b'\0' * 16
+    for start, _, _ in pieces:
+        for mac in state['done'][str(start)]:
+            mac_str = mac_encryptor.encrypt(bytes.fromhex(mac))
+    response = create_node(mega_client, state['dest'], state['name'], ul_key, mac_str, state['handle'])
+    if state_path and os.path.exists(state_path):
+        os.remove(state_path)
+    return response
+
+
+def upload_bytes(mega_client, data, dest, name, workers=UPLOAD_WORKERS):
+    """
+    Upload a buffer as a new file (resumed only within this call, see upload_data())
+    """
+    view = memoryview(data)
+    return upload_data(mega_client, lambda start, length: bytes(view[start:start + length]), len(data),
+                       dest, name, workers=workers)
+
+
+def upload_file(mega_client, path, dest, name=None, workers=UPLOAD_WORKERS, piece_size=PIECE_SIZE,
+                retries=RETRIES):
+    """
+    Upload a local file, resuming a previous interrupted upload of it
+
+    The progress is kept in <path>.upload.json (see upload_data()).
+    """
+    name = name or os.path.basename(path)
+    stat = os.stat(path)
+
+    def read(start, length):
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+    return upload_data(mega_client, read, stat.st_size, dest, name, path + STATE_SUFFIX,
+                       {'mtime': stat.st_mtime}, workers, piece_size, retries)
+
+
+def create_node(mega_client, dest, name, ul_key, mac_str, completion_handle):
+    """
+    Create the file node of a finished upload (encrypted name and key)
+    """
+    if not completion_handle:
+        raise Exception(f'Mega upload of {name} did not return a completion handle')
+    file_mac = str_to_a32(mac_str)
+    meta_mac = (file_mac[0] ^ file_mac[1], file_mac[2] ^ file_mac[3])
+    attribs = base64_url_encode(encrypt_attr({'n': name}, ul_key[:4]))
+    key = [ul_key[0] ^ ul_key[4], ul_key[1] ^ ul_key[5], ul_key[2] ^ meta_mac[0], ul_key[3] ^ meta_mac[1],
+           ul_key[4], ul_key[5], meta_mac[0], meta_mac[1]]
+    encrypted_key = a32_to_base64(encrypt_key(key, mega_client.master_key))
+    return mega_client._api_request({
+        'a': 'p',
+        't': dest,
+        'i': mega_client.request_id,
+        'n': [{'h': completion_handle, 't': 0, 'a': attribs, 'k': encrypted_key}],
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Subida a Mega en paralelo y con reanudación')
+    commands = parser.add_subparsers(dest='command')
+    upload_parser = commands.add_parser('upload', help='Subir (o terminar de subir) archivos locales')
+    upload_parser.add_argument('files', nargs='+', help='Archivos a subir')
+    upload_parser.add_argument('--folder', default='backup', help='Carpeta de destino en Mega')
+    upload_parser.add_argument('--workers', type=int, default=UPLOAD_WORKERS, help='Piezas simultáneas')
+    args = parser.parse_args(argv)
+    if args.command != 'upload':
+        parser.print_help()
+        return 1
+
+    import mega
+
+    mega_client = mega.Mega()
+    mega_client.login(os.environ.get('MEGA_USER'), os.environ.get('MEGA_PASSWORD'))
+    folder = mega_client.find(args.folder, exclude_deleted=True)
+    if not folder:
+        parser.error(f'no existe la carpeta {args.folder}')
+    for path in args.files:
+        started = time.time()
+        upload_file(mega_client, path, folder[0], workers=args.workers)
+        print(f'{path}: {os.path.getsize(path)} bytes, {time.time() - started:.0f} s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
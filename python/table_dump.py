@@ -0,0 +1,604 @@
+"""
+Per-table parallel dump from one consistent snapshot
+
+A pool of worker processes dumps the tables of the given databases, one
+compressed SQL file per table (<base>.<tabla>.sql.bz2, see compression.py),
+largest tables first. All workers read from the same point in time: while
+a FLUSH TABLES WITH READ LOCK is held by the main connection, each worker
+opens a REPEATABLE READ transaction WITH CONSISTENT SNAPSHOT, and the lock
+is released as soon as all of them have started (milliseconds). Without
+the RELOAD privilege the lock is skipped and the manifest says
+"consistent": false. As with mysqldump --single-transaction, only InnoDB
+tables are covered by the snapshot.
+
+Each table file is self-contained (database, DROP/CREATE TABLE, rows in
+primary key order, triggers) and holds no timestamps, so an unchanged table
+gives the same SQL every night. manifest.json ties the set together: the
+files, rows, sizes and SHA-256 of each table.
+
+Incremental sets: given the manifest of the previous set, a table whose
+change marker (CHECKSUM TABLE of the rows in the snapshot plus the CREATE
+TABLE and trigger definitions) is the same as before is not dumped again;
+its manifest entry points to the file in the earlier set ("set"). Files
+older than FULL_DAYS days are never referenced, which bounds the chain and
+gives a fresh copy of every table at least once per period.
+
+Restore (from a directory with the manifest and the table files or their
+.0001, .0002, ... parts; files of earlier sets are read from the sibling
+directories, e.g. a download of the whole "backup" folder):
+    python table_dump.py restore /ruta/backup/backup_complete_<fecha> | mysql -u root -p
+    python table_dump.py restore /ruta/backup | mysql -u root -p    # el más reciente
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import urllib.parse
+from datetime import datetime, timedelta
+
+import pymysql
+
+import compression
+
+WORKERS = int(os.environ.get('BACKUP_DUMP_WORKERS', 4))
+# Bytes por sentencia INSERT (como --net-buffer-length de mysqldump) y filas por lectura
+INSERT_SIZE = 1024 * 1024
+FETCH_ROWS = 1000
+# Segundos de espera para que los procesos abran su transacción
+READY_TIMEOUT = 60
+
+# Días que un archivo puede ser referenciado por los backups siguientes (0 = siempre completo)
+FULL_DAYS = float(os.environ.get('BACKUP_FULL_DAYS', 7))
+
+# EXTRA de las columnas generadas; DEFAULT_GENERATED (MySQL 8, p. ej. DEFAULT
+# CURRENT_TIMESTAMP) es una columna normal y se vuelca
+GENERATED_EXTRA = ('VIRTUAL GENERATED', 'STORED GENERATED')
+# Versión del contenido de los archivos: al cambiar, ninguna tabla reutiliza un archivo anterior
+DUMP_FORMAT = 2
+
+MANIFEST = 'manifest.json'
+CREATED_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def connect(config, **kwargs):
+    return pymysql.connect(host=config['host'], port=int(config.get('port') or 3306), user=config['user'],
+                           password=config.get('password') or '', charset='utf8mb4', **kwargs)
+
+
+def quote_name(name):
+    return '`' + name.replace('`', '``') + '`'
+
+
+def table_file(database, table, codec):
+    """
+    File name of a table dump (names are %-escaped when needed)
+    """
+    name = '.'.join(urllib.parse.quote(part, safe='') for part in (database, table))
+    return f'{name}.sql{compression.extension(codec)}'
+
+
+class BlockWriter:
+    """
+    Writes SQL text to a file compressed in compression.BLOCK_SIZE blocks and
+    keeps the SHA-256 of the SQL and of the compressed file
+    """
+
+    def __init__(self, path, codec, level):
+        self.file = open(path, 'wb')
+        self.codec = codec
+        self.level = level
+        self.buffer = []
+        self.buffered = 0
+        self.sql_bytes = 0
+        self.bytes = 0
+        self.sql_sha256 = hashlib.sha256()
+        self.sha256 = hashlib.sha256()
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.sql_sha256.update(data)
+        self.sql_bytes += len(data)
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= compression.BLOCK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        block = compression.compress_block(self.codec, self.level, b''.join(self.buffer))
+        self.file.write(block)
+        self.sha256.update(block)
+        self.bytes += len(block)
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self):
+        if self.buffer or not self.bytes:
+            self._flush()
+        self.file.close()
+
+
+def stored_columns(columns):
+    """
+    Columns whose values are dumped: all but the generated ones
+
+    Args:
+        columns: (COLUMN_NAME, EXTRA) rows of information_schema.COLUMNS
+    """
+    return [column for column, extra in columns
+            if not any(kind in (extra or '').upper() for kind in GENERATED_EXTRA)]
+
+
+def dump_table(conn, task, path, codec, level):
+    """
+    Dump one table inside the worker's open transaction
+
+    Returns:
+        dict: Manifest entry of the table
+    """
+    started = time.time()
+    database, table = task['database'], task['table']
+    name = f'{quote_name(database)}.{quote_name(table)}'
+    cursor = conn.cursor()
+    cursor.execute(f'SHOW CREATE TABLE {name}')
+    create = cursor.fetchone()[1]
+    cursor.execute('SELECT COLUMN_NAME, EXTRA FROM information_schema.COLUMNS '
+                   'WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION', (database, table))
+    columns = cursor.fetchall()
+    # Las columnas generadas no se insertan
+    stored = stored_columns(columns)
+    cursor.execute('SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = %s '
+                   'AND TABLE_NAME = %s AND CONSTRAINT_NAME = %s ORDER BY ORDINAL_POSITION',
+                   (database, table, 'PRIMARY'))
+    primary = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f'SHOW TRIGGERS FROM {quote_name(database)} WHERE `Table` = %s', (table,))
+    triggers = []
+    for trigger in [row[0] for row in cursor.fetchall()]:
+        cursor.execute(f'SHOW CREATE TRIGGER {quote_name(database)}.{quote_name(trigger)}')
+        triggers.append(cursor.fetchone()[2])
+
+    checksum = table_checksum(cursor, name, task['create_database'], create, triggers)
+    previous = task.get('previous')
+    if checksum and previous and previous.get('checksum') == checksum:
+        # Sin cambios: el archivo del backup anterior sirve tal cual
+        cursor.close()
+        return dict(previous)
+
+    writer = BlockWriter(path, codec, level)
+    writer.write('/*!40101 SET NAMES utf8mb4 */;\n'
+                 '/*!40014 SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS, FOREIGN_KEY_CHECKS=0 */;\n'
+                 '/*!40014 SET @OLD_UNIQUE_CHECKS=@@UNIQUE_CHECKS, UNIQUE_CHECKS=0 */;\n'
+                 f"{task['create_database']};\n"
+                 f'USE {quote_name(database)};\n\n'
+                 f'DROP TABLE IF EXISTS {quote_name(table)};\n'
+                 f'{create};\n\n')
+
+    select = ', '.join(quote_name(column) for column in stored)
+    insert = f'INSERT INTO {quote_name(table)}'
+    if len(stored) != len(columns):
+        insert += f' ({select})'
+    insert += ' VALUES '
+    query = f'SELECT {select} FROM {name}'
+    if primary:
+        query += ' ORDER BY ' + ', '.join(quote_name(column) for column in primary)
+
+    rows = 0
+    # Cursor sin buffer: las filas se leen del servidor a medida que se escriben
+    data = conn.cursor(pymysql.cursors.SSCursor)
+    data.execute(query)
+    statement = []
+    size = 0
+    while True:
+        batch = data.fetchmany(FETCH_ROWS)
+        if not batch:
+            break
+        for row in batch:
+            values = '(' + ','.join(conn.escape(value) for value in row) + ')'
+            statement.append(values)
+            size += len(values) + 1
+            if size >= INSERT_SIZE:
+                writer.write(insert + ','.join(statement) + ';\n')
+                statement = []
+                size = 0
+        rows += len(batch)
+    if statement:
+        writer.write(insert + ','.join(statement) + ';\n')
+    data.close()
+
+    for trigger in triggers:
+        writer.write(f'\nDELIMITER ;;\n{trigger} ;;\nDELIMITER ;\n')
+    writer.write('\n/*!40014 SET FOREIGN_KEY_CHECKS=@OLD_FOREIGN_KEY_CHECKS */;\n'
+                 '/*!40014 SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS */;\n')
+    writer.close()
+    cursor.close()
+    return {
+        'database': database,
+        'table': table,
+        'engine': task.get('engine'),
+        'file': os.path.basename(path),
+        'set': task.get('set'),
+        'checksum': checksum,
+        'rows': rows,
+        'sql_bytes': writer.sql_bytes,
+        'sql_sha256': writer.sql_sha256.hexdigest(),
+        'bytes': writer.bytes,
+        'sha256': writer.sha256.hexdigest(),
+        'seconds': round(time.time() - started, 2),
+    }
+
+
+def table_checksum(cursor, name, create_database, create, triggers):
+    """
+    Change marker of a table: CHECKSUM TABLE of its rows (read inside the
+    worker's snapshot), the definitions written to the dump and DUMP_FORMAT
+
+    Returns:
+        str: Hex digest, or None when the server cannot checksum the table
+    """
+    cursor.execute(f'CHECKSUM TABLE {name} EXTENDED')
+    row = cursor.fetchone()
+    if row is None or row[1] is None:
+        return None
+    marker = hashlib.sha256()
+    for text in [str(DUMP_FORMAT), create_database, create, str(row[1])] + triggers:
+        marker.update(text.encode('utf-8') + b'\0')
+    return marker.hexdigest()
+
+
+def _worker(config, work_dir, codec, level, tasks, results):
+    # Proceso de volcado: abre la transacción, avisa y toma tablas hasta recibir None
+    try:
+        conn = connect(config)
+        cursor = conn.cursor()
+        cursor.execute('SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        cursor.execute('START TRANSACTION WITH CONSISTENT SNAPSHOT')
+        cursor.close()
+    except Exception as e:
+        results.put(('error', None, repr(e)))
+        return
+    results.put(('ready', os.getpid(), None))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            path = os.path.join(work_dir, table_file(task['database'], task['table'], codec))
+            try:
+                results.put(('table', dump_table(conn, task, path, codec, level), None))
+            except Exception as e:
+                results.put(('error', task, repr(e)))
+    finally:
+        conn.close()
+
+
+def list_tables(conn, databases):
+    """
+    Base tables and views of the databases
+
+    Returns:
+        tuple: (tables as dicts largest first, [(database, view)])
+    """
+    cursor = conn.cursor()
+    marks = ','.join(['%s'] * len(databases))
+    cursor.execute('SELECT TABLE_SCHEMA, TABLE_NAME, TABLE_TYPE, ENGINE, '
+                   'COALESCE(DATA_LENGTH, 0) + COALESCE(INDEX_LENGTH, 0) '
+                   f'FROM information_schema.TABLES WHERE TABLE_SCHEMA IN ({marks})', databases)
+    tables, views = [], []
+    for database, table, kind, engine, size in cursor.fetchall():
+        if kind == 'VIEW':
+            views.append((database, table))
+        else:
+            tables.append({'database': database, 'table': table, 'engine': engine, 'size': int(size)})
+    creates = {}
+    for database in databases:
+        cursor.execute(f'SHOW CREATE DATABASE {quote_name(database)}')
+        creates[database] = cursor.fetchone()[1].replace('CREATE DATABASE', 'CREATE DATABASE IF NOT EXISTS', 1)
+    cursor.close()
+    for table in tables:
+        table['create_database'] = creates[table['database']]
+    tables.sort(key=lambda table: -table['size'])
+    return tables, sorted(views)
+
+
+def dump_views(conn, views, path, codec, level):
+    """
+    Definitions of the views (restored after all the tables)
+    """
+    cursor = conn.cursor()
+    writer = BlockWriter(path, codec, level)
+    writer.write('/*!40101 SET NAMES utf8mb4 */;\n')
+    for database, view in views:
+        cursor.execute(f'SHOW CREATE VIEW {quote_name(database)}.{quote_name(view)}')
+        create = cursor.fetchone()[1].replace('CREATE ', 'CREATE OR REPLACE ', 1)
+        writer.write(f'USE {quote_name(database)};\n{create};\n')
+    writer.close()
+    cursor.close()
+    return {'file': os.path.basename(path), 'views': len(views), 'bytes': writer.bytes,
+            'sha256': writer.sha256.hexdigest()}
+
+
+def _snapshot(conn, workers, results):
+    """
+    Hold a global read lock until every worker has opened its transaction
+
+    Returns:
+        tuple: (consistent, binlog position or None)
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute('FLUSH TABLES WITH READ LOCK')
+        locked = True
+    except pymysql.MySQLError as e:
+        print(f'Sin FLUSH TABLES WITH READ LOCK ({e}): las tablas se leen sin una instantánea común')
+        locked = False
+    binlog = None
+    try:
+        if locked:
+            try:
+                cursor.execute('SHOW MASTER STATUS')
+                row = cursor.fetchone()
+                if row:
+                    binlog = {'file': row[0], 'position': row[1]}
+            except pymysql.MySQLError:
+                pass
+        for process in workers:
+            process.start()
+        for _ in workers:
+            kind, _, error = results.get(timeout=READY_TIMEOUT)
+            if kind == 'error':
+                raise Exception(f'Dump worker could not start: {error}')
+    finally:
+        if locked:
+            cursor.execute('UNLOCK TABLES')
+        cursor.close()
+    return locked, binlog
+
+
+def reusable_tables(previous, codec, max_days=FULL_DAYS, available=None):
+    """
+    Entries of a previous manifest that a new set may reference instead of
+    dumping the table again: same codec, with a change marker, and a file
+    in a set created less than max_days ago (and in available, if given)
+
+    Returns:
+        dict: {(database, table): entry, with the 'set' that holds the file}
+    """
+    if not previous or previous.get('codec') != codec or max_days <= 0:
+        return {}
+    limit = datetime.now() - timedelta(days=max_days)
+    sets = previous.get('sets', {})
+    result = {}
+    for entry in previous['tables']:
+        entry = dict(entry, set=entry.get('set') or previous.get('set'))
+        created = sets.get(entry['set'])
+        if not entry.get('checksum') or not created or datetime.strptime(created, CREATED_FORMAT) < limit:
+            continue
+        if available is not None and entry['set'] not in available:
+            continue
+        result[(entry['database'], entry['table'])] = entry
+    return result
+
+
+def dump_tables(config, databases, work_dir, on_file=None, workers=WORKERS, codec='bz2', level=None,
+                previous=None, reuse=None):
+    """
+    Dump every table of the databases in parallel from one snapshot
+
+    Args:
+        config: Connection settings (host, port, user, password)
+        databases: Database names
+        work_dir: Directory for the table files; its name is the name of the set
+        on_file: Called as on_file(entry) in this process as soon as each
+                 new file is complete (e.g. to upload and delete it)
+        workers: Worker processes
+        codec: Compression codec (see compression.py)
+        level: Compression level (default per codec)
+        previous: Manifest of the previous set (incremental backup)
+        reuse: Entries that may be referenced, see reusable_tables()
+               (default: every entry of previous that qualifies)
+
+    Returns:
+        dict: Manifest (also written to work_dir/manifest.json)
+
+    Raises:
+        Exception: If a worker cannot connect or a table cannot be dumped
+    """
+    started = time.time()
+    level = compression.check_codec(codec, level)
+    os.makedirs(work_dir, exist_ok=True)
+    name = os.path.basename(os.path.normpath(work_dir))
+    if reuse is None:
+        reuse = reusable_tables(previous, codec)
+    conn = connect(config)
+    tables, views = list_tables(conn, databases)
+    for task in tables:
+        task['set'] = name
+        task['previous'] = reuse.get((task['database'], task['table']))
+    workers = max(1, min(workers, len(tables)))
+
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_worker, args=(config, work_dir, codec, level, tasks, results),
+                                         daemon=True) for _ in range(workers)]
+    manifest = {
+        'format': 2,
+        'set': name,
+        'previous': previous.get('set') if previous else None,
+        'created': datetime.now().strftime(CREATED_FORMAT),
+        'databases': list(databases),
+        'codec': codec,
+        'level': level,
+        'tables': [],
+    }
+    try:
+        manifest['consistent'], manifest['binlog'] = _snapshot(conn, processes, results)
+        for task in tables:
+            tasks.put(task)
+        for _ in processes:
+            tasks.put(None)
+
+        for _ in tables:
+            while True:
+                try:
+                    kind, entry, error = results.get(timeout=5)
+                    break
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        raise Exception('Dump workers exited before finishing')
+            if kind == 'error':
+                raise Exception(f"Dump of {entry['database']}.{entry['table']} failed: {error}")
+            manifest['tables'].append(entry)
+            if on_file and entry['set'] == name:
+                on_file(entry)
+
+        if views:
+            entry = dump_views(conn, views, os.path.join(work_dir, f'views.sql{compression.extension(codec)}'),
+                               codec, level)
+            manifest['views'] = entry
+            if on_file:
+                on_file(entry)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        conn.close()
+
+    manifest['tables'].sort(key=lambda entry: (entry['database'], entry['table']))
+    # Fecha de cada set referenciado (para saber hasta cuándo se pueden seguir usando sus archivos)
+    sets = previous.get('sets', {}) if previous else {}
+    manifest['sets'] = {set_name: sets.get(set_name, manifest['created'])
+                        for set_name in sorted(referenced_sets(manifest))}
+    manifest['seconds'] = round(time.time() - started, 1)
+    with open(os.path.join(work_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+
+def referenced_sets(manifest):
+    """
+    Names of the sets that hold the files of a manifest (itself included)
+    """
+    return {entry.get('set') or manifest.get('set') for entry in manifest['tables']} | {manifest.get('set')}
+
+
+def save_manifest(directory, manifest):
+    """
+    Keep a local copy of a set's manifest (<directory>/<set>.json)
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{manifest['set']}.json")
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def load_manifests(directory):
+    """
+    Local manifests saved by save_manifest()
+
+    Returns:
+        dict: {set name: manifest}, oldest first
+    """
+    manifests = []
+    if os.path.isdir(directory):
+        for file_name in os.listdir(directory):
+            if file_name.endswith('.json'):
+                with open(os.path.join(directory, file_name), encoding='utf-8') as f:
+                    manifests.append(json.load(f))
+    manifests.sort(key=lambda manifest: manifest['created'])
+    return collections.OrderedDict((manifest['set'], manifest) for manifest in manifests)
+
+
+def read_file(directory, name):
+    """
+    Contents of a backup file, from the file itself or from its .0001, .0002, ... parts
+
+    Returns:
+        iterator: Chunks of bytes
+    """
+    path = os.path.join(directory, name)
+    paths = [path] if os.path.exists(path) else []
+    number = 1
+    while not os.path.exists(path) and os.path.exists(f'{path}.{number:04d}'):
+        paths.append(f'{path}.{number:04d}')
+        number += 1
+    if not paths:
+        raise Exception(f'Missing backup file: {name}')
+    for part in paths:
+        with open(part, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                yield chunk
+
+
+def newest_set(directory):
+    """
+    Directory of the most recent set under a directory of downloaded sets
+    """
+    found = []
+    for set_name in os.listdir(directory):
+        path = os.path.join(directory, set_name, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                found.append((json.load(f)['created'], set_name))
+    if not found:
+        raise Exception(f'No backup sets in {directory}')
+    return os.path.join(directory, max(found)[1])
+
+
+def restore(directory, out):
+    """
+    Write the SQL of a backup set (tables, then views) to a binary stream,
+    checking the SHA-256 of every file
+
+    Files referenced from earlier sets are read from the sibling directory
+    of that set. A directory without manifest.json is taken as a directory
+    of sets and its most recent set is restored.
+    """
+    if not os.path.exists(os.path.join(directory, MANIFEST)):
+        directory = newest_set(directory)
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+    root = os.path.dirname(os.path.normpath(directory))
+    entries = list(manifest['tables'])
+    if manifest.get('views'):
+        entries.append(manifest['views'])
+    for entry in entries:
+        sha256 = hashlib.sha256()
+        source = directory
+        if entry.get('set') and entry['set'] != manifest.get('set'):
+            source = os.path.join(root, entry['set'])
+
+        def chunks():
+            for chunk in read_file(source, entry['file']):
+                sha256.update(chunk)
+                yield chunk
+
+        for data in compression.iter_decompress(manifest['codec'], chunks()):
+            out.write(data)
+        if sha256.hexdigest() != entry['sha256']:
+            raise Exception(f"Checksum mismatch in {entry['file']}")
+    out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Volcado de tablas en paralelo y restauración')
+    commands = parser.add_subparsers(dest='command')
+    restore_parser = commands.add_parser('restore', help='Escribir el SQL de un backup en stdout')
+    restore_parser.add_argument('directory', help='Directorio del backup (manifest.json y archivos de las tablas), '
+                                                  'o directorio con los backups (restaura el más reciente)')
+    args = parser.parse_args(argv)
+    if args.command != 'restore':
+        parser.print_help()
+        return 1
+    restore(args.directory, sys.stdout.buffer)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
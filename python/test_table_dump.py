@@ -0,0 +1,120 @@
+"""
+Tests of table_dump.py against a scripted connection (no MySQL server)
+
+    python test_table_dump.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pymysql
+
+import compression
+import table_dump
+
+CREATE = ('CREATE TABLE `movimientos` (\n'
+          '  `id` int NOT NULL,\n'
+          '  `importe` decimal(10,2) NOT NULL,\n'
+          '  `importe_iva` decimal(10,2) GENERATED ALWAYS AS (`importe` * 1.21) VIRTUAL,\n'
+          '  `saldo` decimal(10,2) GENERATED ALWAYS AS (`importe`) STORED,\n'
+          '  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,\n'
+          '  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,\n'
+          '  PRIMARY KEY (`id`)\n'
+          ') ENGINE=InnoDB')
+
+# information_schema.COLUMNS de MySQL 8.0 para la tabla de arriba
+COLUMNS = [('id', ''), ('importe', ''), ('importe_iva', 'VIRTUAL GENERATED'), ('saldo', 'STORED GENERATED'),
+           ('created_at', 'DEFAULT_GENERATED'), ('updated_at', 'DEFAULT_GENERATED on update CURRENT_TIMESTAMP')]
+
+ROWS = [(1, '100.00', '2024-01-02 10:00:00', '2024-01-03 11:00:00')]
+
+
+class ScriptedCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def execute(self, query, args=None):
+        self.conn.queries.append(query)
+        if query.startswith('SHOW CREATE TABLE'):
+            self.result = [('movimientos', CREATE)]
+        elif 'information_schema.COLUMNS' in query:
+            self.result = list(COLUMNS)
+        elif 'KEY_COLUMN_USAGE' in query:
+            self.result = [('id',)]
+        elif query.startswith('CHECKSUM TABLE'):
+            self.result = [('abr.movimientos', 1234)]
+        elif query.startswith('SELECT '):
+            self.result = list(ROWS)
+        else:
+            self.result = []
+
+    def fetchone(self):
+        return self.result.pop(0) if self.result else None
+
+    def fetchall(self):
+        result, self.result = self.result, []
+        return result
+
+    def fetchmany(self, size):
+        result, self.result = self.result[:size], self.result[size:]
+        return result
+
+    def close(self):
+        pass
+
+
+class ScriptedConnection:
+    def __init__(self):
+        self.queries = []
+
+    def cursor(self, cursor_class=None):
+        return ScriptedCursor(self)
+
+    def escape(self, value):
+        return pymysql.converters.escape_item(value, 'utf8mb4')
+
+
+def test_stored_columns():
+    """Only VIRTUAL and STORED generated columns are left out"""
+    assert table_dump.stored_columns(COLUMNS) == ['id', 'importe', 'created_at', 'updated_at']
+    # MySQL 5.7 / MariaDB: DEFAULT CURRENT_TIMESTAMP no figura en EXTRA
+    assert table_dump.stored_columns([('id', ''), ('ts', None), ('g', 'STORED GENERATED')]) == ['id', 'ts']
+
+
+def test_dump_selects_default_generated_columns():
+    """The dump reads and inserts DEFAULT CURRENT_TIMESTAMP columns"""
+    work_dir = tempfile.mkdtemp()
+    try:
+        conn = ScriptedConnection()
+        path = os.path.join(work_dir, table_dump.table_file('abr', 'movimientos', 'gzip'))
+        task = {'database': 'abr', 'table': 'movimientos', 'create_database': 'CREATE DATABASE `abr`'}
+        entry = table_dump.dump_table(conn, task, path, 'gzip', compression.check_codec('gzip'))
+        with open(path, 'rb') as f:
+            sql = compression.decompress('gzip', f.read()).decode('utf-8')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    select = next(query for query in conn.queries if query.startswith('SELECT `'))
+    assert select == ('SELECT `id`, `importe`, `created_at`, `updated_at` FROM `abr`.`movimientos` '
+                      'ORDER BY `id`'), select
+    assert ("INSERT INTO `movimientos` (`id`, `importe`, `created_at`, `updated_at`) VALUES "
+            "(1,'100.00','2024-01-02 10:00:00','2024-01-03 11:00:00');") in sql, sql
+    assert entry['rows'] == 1
+
+
+def main():
+    failed = 0
+    for test in (test_stored_columns, test_dump_selects_default_generated_columns):
+        try:
+            test()
+            print(f'ok   {test.__doc__}')
+        except AssertionError as e:
+            failed += 1
+            print(f'FAIL {test.__doc__}: {e}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())